@@ -175,6 +175,14 @@ from shapely.geometry import mapping
 from shapely.ops import unary_union
 import fiona
 
+# Motore zonale vettoriale (wd_engine.py nelle librerie Python del progetto)
+from wd_engine import (build_rings, zonal_ring_stats, zonal_ring_stats_parallel, reproject_raster,
+                       pixel_index_stats, coverage_ring_stats, configure_remote_access, remote_raster_path)
+from wd_cache import (DiskCache, cached_reprojection, load_or_build_rings, load_or_build_pixel_index,
+                      cached_download_files)
+from wd_io import read_buildings, list_fields, ZIP_LAYER
+from wd_transfer import shapefile_sidecars, folder_index
+
 # Import librerie di utilità
 import os
 import sys
@@ -348,14 +356,19 @@ def _create_payload():
     
     return payload
 
-def _download_remote_to_tmp(file_path: str, folder_obj, tmpdir: str):
+def _download_remote_to_tmp(file_path: str, folder_obj, tmpdir: str, cache=None):
     """
     Scarica file da Dataiku Folder in directory temporanea
     Versione adattata per flood analysis con file semplici
     
+    Trasferimento a blocchi (memoria costante anche per raster multi-GB);
+    per gli shapefile i file accessori sono scaricati in parallelo.
+    Con una cache input (DiskCache) i file invariati sul folder non vengono riscaricati.
+    
     file_path: percorso del file nel folder
-    folder_obj: oggetto dataiku.Folder
+    folder_obj: oggetto dataiku.Folder (o wd_transfer.LocalFolder per prove locali)
     tmpdir: directory locale di destinazione
+    cache: DiskCache degli input (None = download diretto)
     Restituisce percorso locale al file scaricato oppure None se non trovato.
     """
     if not file_path:
@@ -365,64 +378,25 @@ def _download_remote_to_tmp(file_path: str, folder_obj, tmpdir: str):
         # Gestisci tmpdir come string o oggetto TemporaryDirectory
         tmpdir_path = tmpdir.name if hasattr(tmpdir, "name") else str(tmpdir)
         
-        # Ottieni lista file nel folder
-        try:
-            file_list = folder_obj.list_paths_in_partition()
-        except Exception:
-            file_list = []
-        
-        # 1) Match esatto per il percorso
-        if file_path in file_list:
-            local_path = os.path.join(tmpdir_path, os.path.basename(file_path))
-            with folder_obj.get_download_stream(file_path) as stream, open(local_path, 'wb') as out:
-                out.write(stream.read())
-            
-            # Se è uno shapefile, scarica anche i file accessori
-            if file_path.lower().endswith('.shp'):
-                base_name = os.path.splitext(file_path)[0]
-                shapefile_extensions = ['.dbf', '.shx', '.prj', '.qix', '.xml', '.cpg', '.sbx', '.sbn']
-                
-                for ext in shapefile_extensions:
-                    aux_file = base_name + ext
-                    if aux_file in file_list:
-                        aux_local_path = os.path.join(tmpdir_path, os.path.basename(aux_file))
-                        try:
-                            with folder_obj.get_download_stream(aux_file) as stream, open(aux_local_path, 'wb') as out:
-                                out.write(stream.read())
-                        except Exception:
-                            continue
-            
-            return local_path
-        
-        # 2) Match per nome file (case-insensitive)
-        filename = os.path.basename(file_path)
-        for f in file_list:
-            if os.path.basename(f).lower() == filename.lower():
-                local_path = os.path.join(tmpdir_path, os.path.basename(f))
-                with folder_obj.get_download_stream(f) as stream, open(local_path, 'wb') as out:
-                    out.write(stream.read())
-                
-                # Se è uno shapefile, scarica anche i file accessori
-                if f.lower().endswith('.shp'):
-                    base_name = os.path.splitext(f)[0]
-                    shapefile_extensions = ['.dbf', '.shx', '.prj', '.qix', '.xml', '.cpg', '.sbx', '.sbn']
-                    
-                    for ext in shapefile_extensions:
-                        aux_file = base_name + ext
-                        if aux_file in file_list or aux_file.lower() in [x.lower() for x in file_list]:
-                            # Trova il file con case corretto
-                            actual_aux_file = next((x for x in file_list if x.lower() == aux_file.lower()), None)
-                            if actual_aux_file:
-                                aux_local_path = os.path.join(tmpdir_path, os.path.basename(actual_aux_file))
-                                try:
-                                    with folder_obj.get_download_stream(actual_aux_file) as stream, open(aux_local_path, 'wb') as out:
-                                        out.write(stream.read())
-                                except Exception:
-                                    continue
-                
-                return local_path
-                
-        return None
+        # Indice del folder (listing unico condiviso con la selezione dei file)
+        index = folder_index(folder_obj)
+        
+        # 1) Match esatto per il percorso, 2) match per nome file (case-insensitive)
+        remote_file = index.exact(file_path)
+        if remote_file is None:
+            matches = index.by_name(os.path.basename(file_path))
+            remote_file = matches[0] if matches else None
+        if remote_file is None:
+            return None
+        
+        # Se è uno shapefile, scarica anche i file accessori (in parallelo con il file principale)
+        remote_paths = [remote_file]
+        if remote_file.lower().endswith('.shp'):
+            remote_paths += shapefile_sidecars(remote_file, index)
+        local_paths = cached_download_files(folder_obj, remote_paths, tmpdir_path, cache)
+        if local_paths[0] is None:
+            raise IOError(f"download non riuscito: {remote_file}")
+        return local_paths[0]
         
     except Exception as e:
         print(f"⚠️ Errore download {file_path}: {e}")
@@ -457,13 +431,31 @@ class FloodAnalysisConfig:
         self.BUFFER_DISTANCE = None   # Deve essere definito nel dataset!
         
         # Formati supportati
-        self.VECTOR_EXTENSIONS = ['.shp', '.geojson', '.json', '.gpkg', '.parquet', '.geoparquet', '.kml', '.gml']
+        self.VECTOR_EXTENSIONS = ['.shp', '.geojson', '.json', '.gpkg', '.parquet', '.geoparquet', '.kml', '.gml', '.zip']
         self.RASTER_EXTENSIONS = ['.tif', '.tiff', '.img', '.jp2', '.png', '.jpg', '.jpeg', '.bmp', '.gif']
         
         # Parametri processing
         self.MIN_VALID_HEIGHT = 3.0    # Altezza minima valida (m)
         self.MAX_SUBMERSION_PERCENT = 100.0  # Cap percentuale sommersione
         self.PROGRESS_INTERVAL = 100   # Ogni quanti edifici mostrare progresso
+        self.ZONAL_ENGINE = "batch"    # "batch" = motore vettoriale unico, "mask" = rasterio.mask.mask per edificio,
+                                       # "exact" = copertura esatta dei pixel (media pesata sull'area);
+                                       # raster senza nodata: "mask" conta anche lo 0 di riempimento fuori dall'anello
+        self.TILE_MEMORY_MB = None     # Budget memoria per tile in MB (None = lettura unica)
+        self.WORKERS = 1               # Processi per le statistiche anelli (1 = seriale)
+        self.LAZY_REPROJECTION = False  # Opzioni 2/3: riproietta solo il riquadro degli edifici (False = copia completa);
+                                        # valori anche leggermente diversi dalla copia completa
+        self.REPROJECTION_CACHE_DIR = None   # Cartella cache persistente raster riproiettati (None = disattivata)
+        self.REPROJECTION_CACHE_MAX_GB = 20  # Dimensione massima cache (eliminazione LRU)
+        self.INPUT_CACHE_DIR = None    # Cache locale persistente degli input scaricati (None = download a ogni esecuzione)
+        self.INPUT_CACHE_MAX_GB = 50   # Dimensione massima cache input (eliminazione LRU)
+        self.REMOTE_RASTER_PREFIX = None  # URL del folder input su object storage (es. "s3://bucket/minio_input"):
+                                          # raster COG letto con richieste HTTP range, senza download (None = download)
+        self.S3_ENDPOINT = None        # Endpoint S3 compatibile per REMOTE_RASTER_PREFIX (es. "http://minio:9000"; None = AWS)
+        self.RING_STORE_DIR = None     # Archivio anelli precalcolati riusati tra eventi (None = ricalcolo)
+        self.PIXEL_INDEX_DIR = None    # Archivio indici edificio -> pixel per griglia raster (None = disattivato)
+        self.OUTPUT_FORMAT = "csv"     # Risultati nel folder: "csv" (geometria WKT), "parquet" (GeoParquet WKB), "feather"
+                                       # o "attributes" (solo FID e metriche, Feather senza geometria)
         
         # File management
         self.SUPPORTED_FILE_TYPES = {
@@ -520,7 +512,20 @@ class FloodAnalysisConfig:
             "min_valid_height": "MIN_VALID_HEIGHT",
             "enable_logging": "ENABLE_LOGGING",
             "create_report": "CREATE_REPORT",
-            "create_shapefile": "CREATE_SHAPEFILE"
+            "create_shapefile": "CREATE_SHAPEFILE",
+            "zonal_engine": "ZONAL_ENGINE",
+            "tile_memory_mb": "TILE_MEMORY_MB",
+            "workers": "WORKERS",
+            "lazy_reprojection": "LAZY_REPROJECTION",
+            "reprojection_cache_dir": "REPROJECTION_CACHE_DIR",
+            "reprojection_cache_max_gb": "REPROJECTION_CACHE_MAX_GB",
+            "input_cache_dir": "INPUT_CACHE_DIR",
+            "input_cache_max_gb": "INPUT_CACHE_MAX_GB",
+            "remote_raster_prefix": "REMOTE_RASTER_PREFIX",
+            "s3_endpoint": "S3_ENDPOINT",
+            "ring_store_dir": "RING_STORE_DIR",
+            "pixel_index_dir": "PIXEL_INDEX_DIR",
+            "output_format": "OUTPUT_FORMAT"
         }
         
         # FASE 1: Carica parametri dal JSON scenario (priorità più alta)
@@ -529,12 +534,16 @@ class FloodAnalysisConfig:
                 val = payload[payload_key]
                 
                 # Conversioni specifiche
-                if attr == "REPROJECTION_OPTION":
+                if attr in ("REPROJECTION_OPTION", "WORKERS"):
                     setattr(self, attr, int(val))
                 elif attr == "BUFFER_DISTANCE":
                     setattr(self, attr, None if str(val).lower() == "auto" else float(val))
-                elif attr in ("ENABLE_LOGGING", "CREATE_REPORT", "CREATE_SHAPEFILE"):
+                elif attr in ("ENABLE_LOGGING", "CREATE_REPORT", "CREATE_SHAPEFILE", "LAZY_REPROJECTION"):
                     setattr(self, attr, self._to_bool(val))
+                elif attr == "TILE_MEMORY_MB":
+                    setattr(self, attr, None if val is None or str(val).lower() == "auto" else float(val))
+                elif attr in ("REPROJECTION_CACHE_MAX_GB", "INPUT_CACHE_MAX_GB"):
+                    setattr(self, attr, float(val))
                 else:
                     setattr(self, attr, val)
         
@@ -693,6 +702,18 @@ class FloodAnalysisConfig:
         
         if self.BUFFER_DISTANCE is not None and self.BUFFER_DISTANCE <= 0:
             errors.append("BUFFER_DISTANCE deve essere > 0 o None (automatico)")
+        
+        if self.ZONAL_ENGINE not in ("batch", "mask", "exact"):
+            errors.append("ZONAL_ENGINE deve essere 'batch', 'mask' o 'exact'")
+        
+        if self.TILE_MEMORY_MB is not None and self.TILE_MEMORY_MB <= 0:
+            errors.append("TILE_MEMORY_MB deve essere > 0 o None (lettura unica)")
+        
+        if self.WORKERS < 1:
+            errors.append("WORKERS deve essere >= 1")
+        
+        if self.OUTPUT_FORMAT not in ("csv", "parquet", "feather", "attributes"):
+            errors.append("OUTPUT_FORMAT deve essere 'csv', 'parquet', 'feather' o 'attributes'")
             
         return errors
     
@@ -706,6 +727,16 @@ class FloodAnalysisConfig:
         print(f"Target EPSG: {self.TARGET_EPSG}")
         print(f"Buffer distance: {self.BUFFER_DISTANCE or 'automatico'}")
         print(f"Altezza minima valida: {self.MIN_VALID_HEIGHT}m")
+        print(f"Motore zonale: {self.ZONAL_ENGINE}")
+        print(f"Budget tile: {f'{self.TILE_MEMORY_MB} MB' if self.TILE_MEMORY_MB else 'lettura unica'}")
+        print(f"Processi statistiche: {self.WORKERS}")
+        print(f"Riproiezione raster solo riquadro edifici: {self.LAZY_REPROJECTION}")
+        print(f"Cache raster riproiettati: {self.REPROJECTION_CACHE_DIR or 'disattivata'}")
+        print(f"Cache input scaricati: {self.INPUT_CACHE_DIR or 'disattivata'}")
+        print(f"Raster remoto (richieste range): {self.REMOTE_RASTER_PREFIX or 'disattivato (download)'}")
+        print(f"Archivio anelli: {self.RING_STORE_DIR or 'disattivato'}")
+        print(f"Archivio indici pixel: {self.PIXEL_INDEX_DIR or 'disattivato'}")
+        print(f"Formato risultati: {self.OUTPUT_FORMAT}")
         print(f"File vettoriale: {self.INPUT_VECTOR_FILE or 'N/A'}")
         print(f"File raster: {self.INPUT_RASTER_FILE or 'N/A'}")
         print(f"Output folder: {self.OUTPUT_FOLDER}")
@@ -927,8 +958,10 @@ minio_input = dataiku.Folder("minio_input")
 print("=== INFORMAZIONI FOLDER INPUT ===")
 print(f"Folder minio_input: {minio_input.get_info()}")
 
-# Elenco dei file disponibili nel folder
-input_files = minio_input.list_paths_in_partition()
+# Elenco dei file disponibili nel folder (indice condiviso con selezione e download: un solo listing,
+# riletto a ogni esecuzione della cella perché l'indice sopravvive tra le esecuzioni del kernel)
+input_index = folder_index(minio_input, refresh=True)
+input_files = input_index.paths
 
 print(f"\nFile disponibili nel folder minio_input:")
 for file_path in input_files:
@@ -936,7 +969,7 @@ for file_path in input_files:
 
 # DEFINIZIONE FORMATI SUPPORTATI
 # Formati vettoriali supportati da GeoPandas/Fiona
-VECTOR_EXTENSIONS = ['.shp', '.geojson', '.json', '.gpkg', '.parquet', '.geoparquet', '.kml', '.gml']
+VECTOR_EXTENSIONS = ['.shp', '.geojson', '.json', '.gpkg', '.parquet', '.geoparquet', '.kml', '.gml', '.zip']
 # Formati raster supportati da Rasterio/GDAL  
 RASTER_EXTENSIONS = ['.tif', '.tiff', '.img', '.jp2', '.png', '.jpg', '.jpeg', '.bmp', '.gif']
 
@@ -981,8 +1014,11 @@ print(f"\n📋 Formati vettoriali supportati: {', '.join(VECTOR_EXTENSIONS)}")
 print(f"📋 Formati raster supportati: {', '.join(RASTER_EXTENSIONS[:8])}... (+{len(RASTER_EXTENSIONS)-8} altri)")
 
 # SELEZIONE INTELLIGENTE MIGLIORATA CON PAYLOAD
-def find_configured_file(file_list, configured_path, file_type):
-    """Trova il file che corrisponde alla configurazione con percorso completo"""
+def find_configured_file(file_list, configured_path, file_type, index=None):
+    """
+    Trova il file che corrisponde alla configurazione con percorso completo
+    (index: FolderIndex del folder per le ricerche per nome/percorso in tempo costante)
+    """
     if not configured_path:
         if file_list:
             print(f"⚠️ Nessun {file_type} configurato, uso il primo disponibile: {file_list[0]}")
@@ -991,6 +1027,17 @@ def find_configured_file(file_list, configured_path, file_type):
     
     configured_filename = configured_path.split('/')[-1]
     
+    # 0. Ricerca indicizzata: nome file o percorso (case-insensitive) tra i file della tipologia
+    if index is not None:
+        candidates = set(file_list)
+        indexed = [f for f in index.by_name(configured_filename) if f in candidates]
+        by_path = index.by_suffix(configured_path)
+        if not indexed and by_path in candidates:
+            indexed = [by_path]
+        if indexed:
+            print(f"✓ Trovato {file_type} configurato '{configured_filename}': {indexed[0]}")
+            return indexed[0]
+    
     # 1. Match esatto per nome file
     exact_matches = [f for f in file_list if configured_filename in f]
     if exact_matches:
@@ -1016,8 +1063,8 @@ print(f"📁 File vettoriale configurato: {shapefile_config}")
 print(f"📁 File raster configurato: {raster_config}")
 
 # Seleziona i file basandosi sulla configurazione (ora con nomi generici)
-vector_file = find_configured_file(vector_files, shapefile_config, "file vettoriale")
-raster_file = find_configured_file(raster_files, raster_config, "file raster")
+vector_file = find_configured_file(vector_files, shapefile_config, "file vettoriale", index=input_index)
+raster_file = find_configured_file(raster_files, raster_config, "file raster", index=input_index)
 
 print(f"\n=== FILE SELEZIONATI PER L'ANALISI ===\n")
 print(f"📄 File vettoriale: {vector_file}")
@@ -1044,11 +1091,12 @@ print(f"\n💡 Per cambiare selezione, modifica il dataset 'configurazione_dati'
 # Download dei file dal folder di input verso directory temporanea locale
 temp_dir = tempfile.mkdtemp()
 print(f"Directory temporanea creata: {temp_dir}")
+input_cache = DiskCache(flood_config.INPUT_CACHE_DIR, flood_config.INPUT_CACHE_MAX_GB) if flood_config.INPUT_CACHE_DIR else None
 
 # Download con funzione robusta migliorata
 print(f"📥 Download in corso: {vector_file}")
 try:
-    vector_local_path = _download_remote_to_tmp(vector_file, minio_input, temp_dir)
+    vector_local_path = _download_remote_to_tmp(vector_file, minio_input, temp_dir, input_cache)
     if vector_local_path:
         print(f"✅ Vector file scaricato: {os.path.basename(vector_local_path)}")
     else:
@@ -1057,16 +1105,25 @@ except Exception as e:
     print(f"❌ Errore download vector: {e}")
     raise
 
-print(f"📥 Download in corso: {raster_file}")
-try:
-    raster_local_path = _download_remote_to_tmp(raster_file, minio_input, temp_dir)
-    if raster_local_path:
-        print(f"✅ Raster file scaricato: {os.path.basename(raster_local_path)}")
-    else:
-        raise Exception(f"Download fallito per {raster_file}")
-except Exception as e:
-    print(f"❌ Errore download raster: {e}")
-    raise
+remote_raster = bool(flood_config.REMOTE_RASTER_PREFIX)
+if remote_raster:
+    # Lettura diretta dall'object storage: solo i blocchi sotto gli edifici vengono trasferiti
+    configure_remote_access(flood_config.S3_ENDPOINT)
+    raster_local_path = remote_raster_path(f"{flood_config.REMOTE_RASTER_PREFIX.rstrip('/')}/{raster_file.lstrip('/')}")
+    print(f"🌐 Raster letto da object storage con richieste range (nessun download): {raster_local_path}")
+    if flood_config.TILE_MEMORY_MB is None:
+        flood_config.TILE_MEMORY_MB = 1  # tile di pochi blocchi interni, letti solo sotto gli anelli
+else:
+    print(f"📥 Download in corso: {raster_file}")
+    try:
+        raster_local_path = _download_remote_to_tmp(raster_file, minio_input, temp_dir, input_cache)
+        if raster_local_path:
+            print(f"✅ Raster file scaricato: {os.path.basename(raster_local_path)}")
+        else:
+            raise Exception(f"Download fallito per {raster_file}")
+    except Exception as e:
+        print(f"❌ Errore download raster: {e}")
+        raise
 
 # Informazioni sui file scaricati
 if vector_local_path.lower().endswith('.shp'):
@@ -1075,24 +1132,28 @@ elif vector_local_path.lower().endswith(('.gpkg', '.gdb')):
     print(f"📁 File vettoriale database rilevato - formato autocontenuto")
 elif vector_local_path.lower().endswith(('.parquet', '.geoparquet')):
     print(f"📁 File GeoParquet rilevato - formato colonnare ottimizzato")
+elif vector_local_path.lower().endswith('.zip'):
+    print(f"📁 Archivio zip DBTR rilevato - layer {ZIP_LAYER} letto direttamente dall'archivio (senza estrazione)")
 else:
     vector_ext = vector_local_path.split('.')[-1].upper()
     print(f"📁 File vettoriale {vector_ext} - formato autocontenuto")
 
 # Informazioni sui file raster
 raster_ext = raster_local_path.split('.')[-1].upper() 
-print(f"📁 File raster {raster_ext} scaricato")
+print(f"📁 File raster {raster_ext} {'remoto (letture range)' if remote_raster else 'scaricato'}")
 
 print(f"\n=== DOWNLOAD COMPLETATO ===")
 print(f"File vettoriale: {vector_local_path}")
 print(f"File raster: {raster_local_path}")
 print(f"Directory di lavoro: {temp_dir}")
+if input_cache is not None:
+    print(f"Cache input ({flood_config.INPUT_CACHE_DIR}): {input_cache.summary()}")
 print(f"Formato vettoriale: {vector_local_path.split('.')[-1].upper()}")
 print(f"Formato raster: {raster_local_path.split('.')[-1].upper()}")
 
 # -------------------------------------------------------------------------------- NOTEBOOK-CELL: CODE
-# Carica dati vettoriali e raster con geopandas e rasterio
-vector = gpd.read_file(vector_local_path)
+# Carica dati vettoriali (solo geometria, campo altezza e FID; Arrow se disponibile) e raster con rasterio
+vector = read_buildings(vector_local_path, HEIGHT_FIELD)
 raster = rasterio.open(raster_local_path)
 
 print("=== DATI CARICATI ===")
@@ -1103,11 +1164,11 @@ print(f"CRS raster: {raster.crs}")
 
 # Controlla i campi disponibili nel vettoriale
 print(f"\nCampi disponibili nel vettoriale:")
-print(list(vector.columns))
+print(list_fields(vector_local_path))
 
 # Verifica che il campo altezza sia presente
 if HEIGHT_FIELD not in vector.columns:
-    raise ValueError(f"Campo altezza '{HEIGHT_FIELD}' non trovato nel vettoriale! Campi disponibili: {list(vector.columns)}")
+    raise ValueError(f"Campo altezza '{HEIGHT_FIELD}' non trovato nel vettoriale! Campi disponibili: {list_fields(vector_local_path)}")
     
 print(f"\n✓ Campo altezza '{HEIGHT_FIELD}' trovato nel vettoriale")
 
@@ -1150,6 +1211,35 @@ if vector_crs != raster_crs:
             vector = vector.to_crs(target_crs)
             print("✓ Vettoriale riproiettato.")
             
+        elif REPROJECTION_OPTION in (2, 3) and (flood_config.REPROJECTION_CACHE_DIR or flood_config.LAZY_REPROJECTION):
+            target_crs = vector_crs if REPROJECTION_OPTION == 2 else f"EPSG:{TARGET_EPSG}"
+            if REPROJECTION_OPTION == 3:
+                print(f"Riproiettando entrambi in {target_crs}...")
+                vector = vector.to_crs(target_crs)
+                print("✓ Vettoriale riproiettato.")
+            if flood_config.REPROJECTION_CACHE_DIR and not remote_raster:
+                # Raster riproiettato (COG) riusato tra esecuzioni sullo stesso evento
+                print(f"Riproiettando il raster in {target_crs} (cache: {flood_config.REPROJECTION_CACHE_DIR})...")
+                reprojection_cache = DiskCache(flood_config.REPROJECTION_CACHE_DIR, flood_config.REPROJECTION_CACHE_MAX_GB)
+                cached_raster_path = cached_reprojection(raster, target_crs, reprojection_cache)
+                raster.close()
+                raster = rasterio.open(cached_raster_path)
+                print(f"✓ Raster riproiettato (cache {reprojection_cache.summary()}).")
+            else:
+                # Riproiezione limitata al riquadro degli edifici, su griglia fissa: tutte le modalità
+                # (finestra unica, tile, processi worker, mask) leggono gli stessi pixel
+                print(f"Riproiettando il raster in {target_crs} (solo riquadro edifici)...")
+                temp_raster = tempfile.NamedTemporaryFile(suffix='.tif', delete=False)
+                temp_raster_path = temp_raster.name
+                temp_raster.close()
+                margin = BUFFER_DISTANCE or 0.0
+                minx, miny, maxx, maxy = vector.total_bounds
+                reproject_raster(raster, target_crs, temp_raster_path,
+                                 bounds=(minx - margin, miny - margin, maxx + margin, maxy + margin))
+                raster.close()
+                raster = rasterio.open(temp_raster_path)
+                print(f"✓ Raster riproiettato ({raster.width}x{raster.height} pixel).")
+            
         elif REPROJECTION_OPTION == 2:
             # Riproietta raster nel CRS del vettoriale
             target_crs = vector_crs
@@ -1294,7 +1384,8 @@ print("✓ Funzione get_external_pixels() definita con soppressione warning")
 
 # -------------------------------------------------------------------------------- NOTEBOOK-CELL: CODE
 # WORKFLOW MODULARE - FASE PROCESSING EDIFICI
-def run_flood_analysis_workflow(config: FloodAnalysisConfig, vector, raster, error_handler: ErrorHandler):
+def run_flood_analysis_workflow(config: FloodAnalysisConfig, vector, raster, error_handler: ErrorHandler,
+                                vector_path=None):
     """
     Workflow modulare per analisi sommersione edifici con error handling robusto
     
@@ -1303,6 +1394,7 @@ def run_flood_analysis_workflow(config: FloodAnalysisConfig, vector, raster, err
         vector: GeoDataFrame edifici 
         raster: Rasterio dataset profondità acqua
         error_handler: Gestore errori centralizzato
+        vector_path: File vettoriale sorgente (chiave dell'archivio anelli)
     
     Returns:
         tuple: (results_list, processing_stats)
@@ -1368,8 +1460,50 @@ def run_flood_analysis_workflow(config: FloodAnalysisConfig, vector, raster, err
         'skipped_other_error': 0
     }
     
+    # Motore batch: una sola lettura raster e riduzioni raggruppate per tutti gli edifici
+    ring_stats = None
+    if config.ZONAL_ENGINE == "exact":
+        try:
+            # Copertura esatta: ogni pixel toccato dall'anello pesa per la frazione di area coperta
+            buffer_distance = config.BUFFER_DISTANCE if config.BUFFER_DISTANCE is not None else abs(raster.transform[0])
+            if config.RING_STORE_DIR and vector_path:
+                ring_store = DiskCache(config.RING_STORE_DIR)
+                rings = load_or_build_rings(vector_path, vector, buffer_distance, ring_store)
+            else:
+                rings = build_rings(vector.geometry, buffer_distance)
+            ring_stats = coverage_ring_stats(raster, rings, tile_memory_mb=config.TILE_MEMORY_MB)
+            print("⚡ Statistiche anelli calcolate con copertura esatta dei pixel")
+        except Exception as e:
+            error_handler.add_warning("EXACT_ENGINE", f"Motore a copertura esatta non disponibile ({e}), uso rasterio.mask per edificio")
+    elif config.ZONAL_ENGINE == "batch":
+        try:
+            buffer_distance = config.BUFFER_DISTANCE if config.BUFFER_DISTANCE is not None else abs(raster.transform[0])
+            rings = None
+            if config.RING_STORE_DIR and vector_path:
+                ring_store = DiskCache(config.RING_STORE_DIR)
+                rings = load_or_build_rings(vector_path, vector, buffer_distance, ring_store)
+                print(f"📦 Archivio anelli: {ring_store.summary()}")
+            elif not (config.PIXEL_INDEX_DIR and vector_path):
+                rings = build_rings(vector.geometry, buffer_distance)
+            if config.PIXEL_INDEX_DIR and vector_path:
+                # Indice pixel per la griglia raster: statistiche con sole letture indicizzate
+                index_store = DiskCache(config.PIXEL_INDEX_DIR)
+                pixel_index = load_or_build_pixel_index(vector_path, vector, raster, buffer_distance, index_store,
+                                                        rings=rings, tile_memory_mb=config.TILE_MEMORY_MB)
+                print(f"📦 Archivio indici pixel: {index_store.summary()}")
+                ring_stats = pixel_index_stats(raster, *pixel_index, tile_memory_mb=config.TILE_MEMORY_MB)
+            elif config.WORKERS > 1:
+                # Partizioni spaziali compatte, un handle raster in sola lettura per processo
+                ring_stats = zonal_ring_stats_parallel(raster.name, rings, config.WORKERS,
+                                                       tile_memory_mb=config.TILE_MEMORY_MB)
+            else:
+                ring_stats = zonal_ring_stats(raster, rings, tile_memory_mb=config.TILE_MEMORY_MB)
+            print(f"⚡ Statistiche anelli calcolate con motore batch ({config.WORKERS} processi)")
+        except Exception as e:
+            error_handler.add_warning("BATCH_ENGINE", f"Motore batch non disponibile ({e}), uso rasterio.mask per edificio")
+    
     # Loop principale con error handling robusto
-    for idx, row in vector.iterrows():
+    for pos, (idx, row) in enumerate(vector.iterrows()):
         building_id = f"building_{idx}"
         
         try:
@@ -1397,13 +1531,22 @@ def run_flood_analysis_workflow(config: FloodAnalysisConfig, vector, raster, err
             
             # Estrazione valori con error handling
             try:
-                external_values = get_external_pixels(geom, raster, config.BUFFER_DISTANCE)
+                if ring_stats is not None:
+                    n_pixels = ring_stats['count'][pos]
+                else:
+                    external_values = get_external_pixels(geom, raster, config.BUFFER_DISTANCE)
+                    n_pixels = external_values.size
                 
-                if external_values.size > 0:
+                if n_pixels > 0:
                     # Calcola statistiche sommersione
-                    depth_mean = float(np.mean(external_values))
-                    depth_min = float(np.min(external_values))
-                    depth_max = float(np.max(external_values))
+                    if ring_stats is not None:
+                        depth_mean = float(ring_stats['mean'][pos])
+                        depth_min = float(ring_stats['min'][pos])
+                        depth_max = float(ring_stats['max'][pos])
+                    else:
+                        depth_mean = float(np.mean(external_values))
+                        depth_min = float(np.min(external_values))
+                        depth_max = float(np.max(external_values))
                     
                     # Calcola percentuale sommersione con cap
                     perc_submerged = min((depth_mean / h_uvl) * 100, config.MAX_SUBMERSION_PERCENT)
@@ -1547,7 +1690,8 @@ results, processing_stats = run_flood_analysis_workflow(
     config=flood_config,
     vector=vector,
     raster=raster, 
-    error_handler=error_handler
+    error_handler=error_handler,
+    vector_path=vector_local_path
 )
 
 # Aggiorna variabili per backward compatibility
@@ -1592,8 +1736,9 @@ print(f"✓ GeoDataFrame di output pronto: {len(out_gdf)} record con campi anali
 # Converti GeoDataFrame in DataFrame standard per Dataiku
 output_inondazioni_df = pd.DataFrame(out_gdf.drop(columns='geometry'))
 
-# Aggiungi colonna WKT come prima colonna per il CSV
-output_inondazioni_df.insert(0, 'geometry_wkt', out_gdf['geometry'].apply(lambda x: x.wkt))
+# Aggiungi colonna WKT come prima colonna per il CSV (i formati colonnari mantengono la geometria WKB)
+if flood_config.OUTPUT_FORMAT == "csv":
+    output_inondazioni_df.insert(0, 'geometry_wkt', out_gdf['geometry'].apply(lambda x: x.wkt))
 
 # Assicura che FID sia la seconda colonna
 if 'FID' in output_inondazioni_df.columns:
@@ -1610,8 +1755,43 @@ print(f"\n📊 Esempio primi 3 record:")
 print(output_inondazioni_df.head(3))
 
 # -------------------------------------------------------------------------------- NOTEBOOK-CELL: CODE
-# Salvataggio risultati come CSV (condizionale)
-if flood_config.CREATE_REPORT:
+# Salvataggio risultati come CSV o formato colonnare (condizionale)
+if flood_config.CREATE_REPORT and flood_config.OUTPUT_FORMAT != "csv":
+    print(f"📝 Salvataggio file {flood_config.OUTPUT_FORMAT}...")
+
+    italian_tz = pytz.timezone('Europe/Rome')
+    timestamp = datetime.now(italian_tz).strftime("%Y%m%d_%H%M%S") 
+    if flood_config.OUTPUT_FORMAT == "attributes":
+        columnar_filename = f"risultati_inondazioni_{timestamp}_attributi.feather"
+    else:
+        columnar_filename = f"risultati_inondazioni_{timestamp}.{flood_config.OUTPUT_FORMAT}"
+
+    # Scrittura in blocco: FID prima colonna, geometria WKB (nessuna geometria per "attributes")
+    from io import BytesIO
+    columnar_stream = BytesIO()
+    if flood_config.OUTPUT_FORMAT == "attributes":
+        columnar_gdf = output_inondazioni_df
+        columnar_gdf.reset_index(drop=True).to_feather(columnar_stream, compression='zstd')
+    else:
+        columnar_gdf = out_gdf[['FID'] + [c for c in out_gdf.columns if c != 'FID']] if 'FID' in out_gdf.columns else out_gdf
+        if flood_config.OUTPUT_FORMAT == "parquet":
+            columnar_gdf.to_parquet(columnar_stream, index=False, geometry_encoding='WKB')
+        else:
+            columnar_gdf.to_feather(columnar_stream, index=False)
+
+    try:
+        output_folder = dataiku.Folder("output_inondazioni")
+        output_folder.upload_stream(columnar_filename, columnar_stream.getvalue())
+        print(f"✅ File {flood_config.OUTPUT_FORMAT} salvato: {columnar_filename}")
+        print(f"✅ {len(columnar_gdf)} record salvati")
+        
+    except Exception as e:
+        local_columnar = f"C:\\temp\\{columnar_filename}"
+        with open(local_columnar, 'wb') as f:
+            f.write(columnar_stream.getvalue())
+        print(f"✅ File salvato in locale: {local_columnar}")
+        print(f"✅ {len(columnar_gdf)} record salvati")
+elif flood_config.CREATE_REPORT:
     print("📝 Salvataggio file CSV...")
 
     italian_tz = pytz.timezone('Europe/Rome')
@@ -1687,22 +1867,23 @@ if flood_config.CREATE_SHAPEFILE:
     }
 
     print("💾 Salvataggio vettoriale...")
+    # Scrittura a blocchi (writerecords) direttamente dalle colonne, senza iterrows
+    OUTPUT_CHUNK_SIZE = 10000
+    field_values = {field: out_gdf[field].to_numpy() for field in schema['properties']}
+    geometries = out_gdf.geometry.values
     with fiona.open(shapefile_path, 'w', driver='ESRI Shapefile', crs=out_gdf.crs, schema=schema) as f:
-        for idx, row in out_gdf.iterrows():
-            feature = {
-                'geometry': mapping(row.geometry),
-                'properties': {
-                    'FID': int(row['FID']),
-                    'A_BASE': float(row['A_BASE']),
-                    HEIGHT_FIELD: float(row[HEIGHT_FIELD]),
-                    'VOL': float(row['VOL']),
-                    'DEPTH_MEAN': float(row['DEPTH_MEAN']),
-                    'DEPTH_MIN': float(row['DEPTH_MIN']),
-                    'DEPTH_MAX': float(row['DEPTH_MAX']),
-                    'PERC_SUBM': float(row['PERC_SUBM'])
+        for start in range(0, len(out_gdf), OUTPUT_CHUNK_SIZE):
+            stop = min(start + OUTPUT_CHUNK_SIZE, len(out_gdf))
+            f.writerecords(
+                {
+                    'geometry': mapping(geometries[pos]),
+                    'properties': {
+                        field: int(values[pos]) if field == 'FID' else float(values[pos])
+                        for field, values in field_values.items()
+                    }
                 }
-            }
-            f.write(feature)
+                for pos in range(start, stop)
+            )
 else:
     print("⏭️ Salvataggio shapefile disabilitato (create_shapefile=false)")
     shapefile_path = None  # Prevent file operations later
@@ -2180,6 +2361,19 @@ except Exception as e:
 # | **Parametro JSON** | **Tipo** | **Descrizione** | **Valore Default** | **Esempio** |
 # |-------------------|----------|----------------|-------------------|-------------|
 # | `min_valid_height` | float | Altezza minima valida edifici (metri) | `3.0` | `0.5` |
+# | `zonal_engine` | string | Motore statistiche anelli (`batch` = vettoriale unico, `mask` = per edificio, `exact` = copertura esatta) | `"batch"` | `"mask"` |
+# | `tile_memory_mb` | float | Budget memoria per tile raster in MB (lettura a tile per raster più grandi della RAM) | `null` (lettura unica) | `256` |
+# | `workers` | int | Processi paralleli per le statistiche anelli (risultato identico al seriale) | `1` | `4` |
+# | `lazy_reprojection` | boolean | Riproiezione raster limitata al riquadro degli edifici invece della copia completa (valori anche leggermente diversi: GDAL ricampiona la sola finestra) | `false` | `true` |
+# | `reprojection_cache_dir` | string | Cartella cache persistente dei raster riproiettati (COG) | `null` (disattivata) | `"/data/cache/reproj"` |
+# | `reprojection_cache_max_gb` | float | Dimensione massima della cache riproiezioni (eliminazione LRU) | `20` | `50` |
+# | `input_cache_dir` | string | Cache locale persistente dei file scaricati dal folder (chiave: percorso, dimensione, data modifica/ETag), collegati nella cartella di lavoro con hardlink | `null` (disattivata) | `"/data/cache/input"` |
+# | `input_cache_max_gb` | float | Dimensione massima della cache input (eliminazione LRU) | `50` | `200` |
+# | `remote_raster_prefix` | string | URL del folder input su object storage: il raster (COG) è letto con richieste HTTP range dei soli blocchi sotto gli edifici, senza download | `null` (download) | `"s3://flood/minio_input"` |
+# | `s3_endpoint` | string | Endpoint S3 compatibile (MinIO) per `remote_raster_prefix`; credenziali da `AWS_ACCESS_KEY_ID`/`AWS_SECRET_ACCESS_KEY` | `null` (AWS) | `"http://minio:9000"` |
+# | `ring_store_dir` | string | Archivio anelli edifici precalcolati (GeoParquet), riusati tra eventi sullo stesso vettoriale | `null` (ricalcolo) | `"/data/cache/rings"` |
+# | `output_format` | string | Formato dei risultati nel folder (`csv` con WKT, `parquet` GeoParquet WKB, `feather` Arrow IPC, `attributes` solo FID e metriche senza geometria) | `"csv"` | `"parquet"` |
+# | `pixel_index_dir` | string | Archivio indici edificio → pixel (.npy) per scenari sulla stessa griglia raster | `null` (disattivato) | `"/data/cache/pixel_index"` |
 # 
 # ## Controlli di Output
 # 
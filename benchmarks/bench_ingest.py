@@ -0,0 +1,129 @@
+"""
+BENCHMARK INGEST COG - LETTURE PER EDIFICIO PRIMA E DOPO
+Misura il costo delle letture a finestra per edificio sul raster così come
+consegnato (GeoTIFF a strisce, non compresso, senza overview: come gli
+emilia_extract) e sul COG prodotto da wd_cache.cached_cog:
+
+- tempo di conversione (una tantum, poi servito dalla cache)
+- rasterio.mask per edificio (get_external_pixels di wd_estimation.py)
+- motore batch a tile (zonal_ring_stats con TILE_MEMORY_MB)
+
+Per ogni lettura sono riportati tempo, letture effettive sul file e MB
+letti (wd_engine.BlockReadCounter). La block cache di GDAL è limitata
+(--cache-mb) per simulare un raster molto più grande della memoria: su un
+file già nella cache del sistema operativo il tempo è dominato dal costo
+Python per edificio, i byte letti misurano il costo di I/O su disco/rete.
+
+Uso:
+    python benchmarks/bench_ingest.py raster.tif [vettoriale] [--as-strips] [--cache-mb 16]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import geopandas as gpd
+import numpy as np
+import rasterio
+import rasterio.mask
+from shapely.geometry import mapping
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from wd_cache import DiskCache, cached_cog, cog_problems  # noqa: E402
+from wd_engine import BlockReadCounter, build_rings, zonal_ring_stats  # noqa: E402
+
+DEFAULT_VECTOR = os.path.join(os.path.dirname(__file__), '..', 'GORO_V_UVL_GPG.shp')
+
+
+def write_strips(src_path, dst_path):
+    """Copia del raster in layout a strisce di una riga, non compressa (stesso nodata)"""
+    with rasterio.open(src_path) as src:
+        profile = src.profile
+        profile.update(tiled=False, blockysize=1, compress=None)
+        profile.pop('blockxsize', None)
+        with rasterio.open(dst_path, 'w', **profile) as dst:
+            for _, window in src.block_windows(1):
+                dst.write(src.read(window=window), window=window)
+
+
+def mask_reads(raster, rings):
+    """Una lettura rasterio.mask per edificio (media dei pixel validi)"""
+    means = np.zeros(len(rings))
+    for i, ring in enumerate(rings):
+        try:
+            out_image, _ = rasterio.mask.mask(raster, [mapping(ring)], crop=True, filled=True)
+        except ValueError:
+            continue
+        values = out_image[0][out_image[0] != raster.nodata]
+        if values.size:
+            means[i] = values.mean()
+    return means
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark letture per edificio prima e dopo l'ingest COG")
+    parser.add_argument('raster')
+    parser.add_argument('vector', nargs='?', default=DEFAULT_VECTOR)
+    parser.add_argument('--as-strips', action='store_true',
+                        help="converte prima il raster in strisce non compresse (consegna tipica)")
+    parser.add_argument('--nodata', type=float, default=-9999.0, help="nodata da dichiarare se assente")
+    parser.add_argument('--cache-mb', type=int, default=16, help="block cache GDAL (MB)")
+    parser.add_argument('--tile-memory-mb', type=float, default=4)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_ingest_')
+    try:
+        incoming = args.raster
+        if args.as_strips:
+            incoming = os.path.join(work_dir, 'incoming.tif')
+            write_strips(args.raster, incoming)
+
+        cache = DiskCache(os.path.join(work_dir, 'cog'))
+        start = time.perf_counter()
+        cog_path = cached_cog(incoming, cache, nodata=args.nodata)
+        convert_time = time.perf_counter() - start
+        start = time.perf_counter()
+        cached_cog(incoming, cache, nodata=args.nodata)
+        hit_time = time.perf_counter() - start
+
+        vector = gpd.read_file(args.vector, columns=[])
+        with rasterio.open(incoming) as src:
+            print(f"Raster in ingresso: {src.width}x{src.height}, {os.path.getsize(incoming) / 1024 ** 2:.1f} MB, "
+                  f"{', '.join(cog_problems(src)) or 'già COG'}")
+            if vector.crs != src.crs:
+                vector = vector.to_crs(src.crs)
+            rings = build_rings(vector.geometry.values, abs(src.transform.a))
+        print(f"COG: {os.path.getsize(cog_path) / 1024 ** 2:.1f} MB, conversione {convert_time:.1f}s "
+              f"(esecuzioni successive: {hit_time:.2f}s dalla cache)")
+        print(f"Edifici: {len(rings)}, block cache GDAL {args.cache_mb} MB")
+
+        print(f"\n{'raster':>10} {'lettura':>18} {'tempo':>8} {'ms/edificio':>12} {'letture':>8} "
+              f"{'MB letti':>9} {'KB/edificio':>12}")
+        results = {}
+        for name, path in (('ingresso', incoming), ('COG', cog_path)):
+            # GDAL_CACHEMAX in byte (rasterio lo passa a GDALSetCacheMax)
+            with rasterio.Env(GDAL_CACHEMAX=args.cache_mb * 1024 * 1024):
+                for label, engine in (('mask per edificio', mask_reads),
+                                      ('batch a tile', lambda r, g: zonal_ring_stats(
+                                          r, g, tile_memory_mb=args.tile_memory_mb)['mean'])):
+                    counter = BlockReadCounter()
+                    raster = counter.open(path)
+                    start = time.perf_counter()
+                    means = engine(raster, rings)
+                    elapsed = time.perf_counter() - start
+                    raster.close()
+                    results.setdefault(name, means)
+                    print(f"{name:>10} {label:>18} {elapsed:7.2f}s {elapsed / len(rings) * 1000:12.2f} "
+                          f"{counter.reads:8d} {counter.bytes / 1024 ** 2:9.1f} "
+                          f"{counter.bytes / len(rings) / 1024:12.1f}")
+        identical = np.array_equal(results['ingresso'], results['COG'])
+        print(f"\nMedie per edificio identiche: {'sì' if identical else 'NO'}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
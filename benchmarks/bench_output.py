@@ -0,0 +1,145 @@
+"""
+BENCHMARK FORMATI DI OUTPUT
+Confronta i tempi di scrittura e le dimensioni dei formati di output dei
+risultati su un vettoriale edifici reale (default: COMACCHIO_V_UVL_GPG.shp,
+~14.000 edifici) con metriche sintetiche:
+
+- shapefile (schema fiona di wd_estimation.py, writerecords a blocchi)
+- CSV con geometria WKT (come il notebook Dataiku)
+- GeoParquet (geometria WKB)
+- solo attributi (FID + metriche, Feather senza geometria)
+
+Uso:
+    python benchmarks/bench_output.py [vettoriale] [--repeat N]
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import fiona
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely.geometry import mapping
+
+DEFAULT_VECTOR = os.path.join(os.path.dirname(__file__), '..', 'COMACCHIO_V_UVL_GPG.shp')
+CHUNK_SIZE = 10000
+
+SCHEMA = {
+    'geometry': 'Polygon',
+    'properties': {
+        'A_BASE': 'float:10.2',
+        'H_UVL': 'float:8.2',
+        'VOL': 'float:12.2',
+        'DEPTH_MEAN': 'float:8.2',
+        'DEPTH_MIN': 'float:8.2',
+        'DEPTH_MAX': 'float:8.2',
+        'PERC_SUBM': 'float:6.2'
+    }
+}
+
+
+def synthetic_table(vector, seed=0):
+    """Tabella risultati con valori plausibili (arrotondati a 2 decimali come wd_estimation.py)"""
+    rng = np.random.default_rng(seed)
+    n = len(vector)
+    areas = vector.geometry.area.to_numpy()
+    heights = rng.uniform(3, 15, n)
+    depth_min = rng.uniform(0, 1, n)
+    depth_max = depth_min + rng.uniform(0, 2, n)
+    depth_mean = (depth_min + depth_max) / 2
+    return pd.DataFrame({
+        'A_BASE': np.round(areas, 2),
+        'H_UVL': np.round(heights, 2),
+        'VOL': np.round(areas * heights, 2),
+        'DEPTH_MEAN': np.round(depth_mean, 2),
+        'DEPTH_MIN': np.round(depth_min, 2),
+        'DEPTH_MAX': np.round(depth_max, 2),
+        'PERC_SUBM': np.round(np.minimum(depth_mean / heights * 100, 100.0), 2),
+    })
+
+
+def write_shapefile(path, vector, table):
+    geometries = vector.geometry.values
+    columns = {field: table[field].to_numpy() for field in SCHEMA['properties']}
+    with fiona.open(path, 'w', driver='ESRI Shapefile', crs=vector.crs, schema=SCHEMA) as f:
+        for start in range(0, len(vector), CHUNK_SIZE):
+            f.writerecords(
+                {'geometry': mapping(geometries[pos]),
+                 'properties': {field: float(values[pos]) for field, values in columns.items()}}
+                for pos in range(start, min(start + CHUNK_SIZE, len(vector))))
+    return path
+
+
+def write_csv_wkt(path, vector, table):
+    df = table.copy()
+    df.insert(0, 'geometry_wkt', vector.geometry.apply(lambda x: x.wkt))
+    df.insert(1, 'FID', np.arange(len(vector)))
+    df.to_csv(path, index=False)
+    return path
+
+
+def write_geoparquet(path, vector, table):
+    gpd.GeoDataFrame(table, geometry=vector.geometry.values, crs=vector.crs).to_parquet(
+        path, index=False, geometry_encoding='WKB')
+    return path
+
+
+def write_attributes(path, vector, table):
+    df = table.copy()
+    df.insert(0, 'FID', np.arange(len(vector), dtype=np.int32))
+    df.to_feather(path, compression='zstd')
+    return path
+
+
+def output_size(path):
+    """Dimensione complessiva del file (per lo shapefile, somma dei file collegati)"""
+    stem, ext = os.path.splitext(path)
+    if ext == '.shp':
+        return sum(os.path.getsize(stem + sidecar) for sidecar in ('.shp', '.shx', '.dbf', '.prj', '.cpg')
+                   if os.path.exists(stem + sidecar))
+    return os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark formati di output dei risultati")
+    parser.add_argument('vector', nargs='?', default=DEFAULT_VECTOR)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    vector = gpd.read_file(args.vector, columns=[])
+    table = synthetic_table(vector)
+    print(f"Vettoriale: {os.path.basename(args.vector)} ({len(vector)} edifici)")
+
+    writers = [
+        ('shapefile', 'out.shp', write_shapefile),
+        ('csv + WKT', 'out.csv', write_csv_wkt),
+        ('geoparquet', 'out.parquet', write_geoparquet),
+        ('solo attributi', 'out_attributi.feather', write_attributes),
+    ]
+
+    work_dir = tempfile.mkdtemp(prefix='bench_output_')
+    try:
+        timings = {}
+        for name, filename, writer in writers:
+            best = float('inf')
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                path = writer(os.path.join(work_dir, filename), vector, table)
+                best = min(best, time.perf_counter() - start)
+            timings[name] = best
+            print(f"{name:>15}: {best * 1000:8.1f} ms  {output_size(path) / 1024 ** 2:7.2f} MB")
+
+        baseline = timings['shapefile']
+        saved = baseline - timings['solo attributi']
+        print(f"\nSolo attributi vs shapefile: {saved * 1000:.1f} ms risparmiati "
+              f"({baseline / timings['solo attributi']:.0f}x più veloce)")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
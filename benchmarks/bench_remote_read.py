@@ -0,0 +1,107 @@
+"""
+BENCHMARK LETTURA REMOTA DEL RASTER (RICHIESTE HTTP RANGE)
+Confronta, per le statistiche degli anelli esterni (motore batch), i byte
+trasferiti da un object storage S3 compatibile:
+
+- download completo del file (implementazione precedente: file scaricato
+  nella cartella temporanea prima di rasterio.open)
+- lettura remota /vsis3/ con finestra unica sugli anelli
+- lettura remota /vsis3/ a tile allineati ai blocchi (solo tile sotto gli anelli)
+
+L'object storage è simulato da un server HTTP locale (s3_stand_in.S3StandIn)
+che risponde alle richieste GET/HEAD in stile path (/bucket/chiave) con
+supporto Range e conta i byte inviati; le statistiche remote sono
+confrontate con quelle calcolate sul file locale.
+
+Ogni modalità è misurata in un processo nuovo (spawn): la cache delle
+regioni di /vsicurl/ e la block cache di GDAL sono per processo, e in un
+unico processo la seconda modalità leggerebbe dalla cache della prima.
+
+Uso:
+    python benchmarks/bench_remote_read.py raster.tif [vettoriale] [--tile-memory-mb 1]
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import geopandas as gpd
+import numpy as np
+import rasterio
+from rasterio.shutil import copy as raster_copy
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from wd_engine import build_rings, configure_remote_access, zonal_ring_stats  # noqa: E402
+from s3_stand_in import S3StandIn  # noqa: E402
+
+DEFAULT_VECTOR = os.path.join(os.path.dirname(__file__), '..', 'GORO_V_UVL_GPG.shp')
+BUCKET = 'bench'
+
+
+def remote_stats(endpoint, remote_path, rings, tile_memory_mb):
+    """Statistiche degli anelli lette da /vsis3/ (eseguita in un processo nuovo, cache GDAL vuote)"""
+    configure_remote_access(endpoint, anonymous=True)
+    os.environ['VSI_CACHE'] = 'FALSE'
+    start = time.perf_counter()
+    with rasterio.open(remote_path) as remote:
+        stats = zonal_ring_stats(remote, rings, tile_memory_mb=tile_memory_mb)
+    return stats, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark lettura remota del raster con richieste range")
+    parser.add_argument('raster')
+    parser.add_argument('vector', nargs='?', default=DEFAULT_VECTOR)
+    parser.add_argument('--tile-memory-mb', type=float, default=1)
+    args = parser.parse_args()
+
+    vector = gpd.read_file(args.vector, columns=[])
+    work_dir = tempfile.mkdtemp(prefix='bench_remote_')
+    server = None
+    try:
+        # COG (tile 256x256 compressi) nel bucket simulato
+        os.makedirs(os.path.join(work_dir, BUCKET))
+        cog_path = os.path.join(work_dir, BUCKET, 'depth_cog.tif')
+        raster_copy(args.raster, cog_path, driver='GTiff', tiled=True, blockxsize=256, blockysize=256,
+                    compress='deflate', predictor=3, copy_src_overviews=True)
+        size = os.path.getsize(cog_path)
+
+        with rasterio.open(cog_path) as local:
+            if vector.crs != local.crs:
+                vector = vector.to_crs(local.crs)
+            rings = build_rings(vector.geometry.values, abs(local.transform.a))
+            reference = zonal_ring_stats(local, rings)
+            print(f"Raster: {local.width}x{local.height} pixel, COG {size / 1024 ** 2:.1f} MB; "
+                  f"edifici: {len(rings)}")
+
+        server = S3StandIn(work_dir)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        context = multiprocessing.get_context('spawn')
+
+        print(f"\n{'modalità':>28} {'tempo':>8} {'richieste':>10} {'MB trasferiti':>14} {'% file':>7}")
+        print(f"{'download completo':>28} {'':>8} {1:10d} {size / 1024 ** 2:14.1f} {100:7.1f}")
+        for name, tile_memory_mb in (('remota, finestra unica', None),
+                                     (f'remota, tile {args.tile_memory_mb:g} MB', args.tile_memory_mb)):
+            # un processo per modalità: nessuna cache GDAL condivisa tra le prove
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                server.reset()
+                stats, elapsed = pool.submit(remote_stats, server.endpoint, f"/vsis3/{BUCKET}/depth_cog.tif",
+                                             rings, tile_memory_mb).result()
+                bytes_sent, requests = server.bytes_sent, server.requests
+            identical = all(np.array_equal(stats[key], reference[key], equal_nan=True) for key in reference)
+            print(f"{name:>28} {elapsed:7.2f}s {requests:10d} {bytes_sent / 1024 ** 2:14.1f} "
+                  f"{bytes_sent / size * 100:7.1f}" + ("" if identical else "  DIFFERENZE!"))
+    finally:
+        if server is not None:
+            server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+BENCHMARK TRASFERIMENTI DA FOLDER
+Confronta su una cartella locale che simula il folder Dataiku/MinIO
+(wd_transfer.LocalFolder):
+
+- lettura completa in memoria (out.write(stream.read()), implementazione
+  precedente di _download_remote_to_tmp) e download a blocchi: tempo e
+  picco di memoria Python (tracemalloc) su un file grande
+- file di uno shapefile scaricati in sequenza e in parallelo, con una
+  latenza simulata per ogni apertura di stream (accesso a object storage)
+
+Uso:
+    python benchmarks/bench_transfer.py [--size-mb 256] [--latency-ms 150]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from wd_transfer import LocalFolder, SHAPEFILE_SIDECARS, download_file, download_files  # noqa: E402
+
+DEFAULT_SHAPEFILE = os.path.join(os.path.dirname(__file__), '..', 'DATI', 'GORO', 'V_UVL_GPG.shp')
+
+
+class LatencyFolder(LocalFolder):
+    """LocalFolder con una latenza fissa all'apertura di ogni stream"""
+
+    def __init__(self, root, latency):
+        super().__init__(root)
+        self.latency = latency
+
+    def get_download_stream(self, path):
+        time.sleep(self.latency)
+        return super().get_download_stream(path)
+
+
+def read_whole(folder, remote_path, local_path):
+    """Implementazione precedente: intero file in memoria prima della scrittura"""
+    with folder.get_download_stream(remote_path) as stream, open(local_path, 'wb') as out:
+        out.write(stream.read())
+
+
+def measure(func, *args):
+    """Tempo e picco di memoria Python della chiamata"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark download a blocchi e paralleli")
+    parser.add_argument('--size-mb', type=int, default=256, help="dimensione del file raster simulato")
+    parser.add_argument('--latency-ms', type=float, default=150, help="latenza simulata per file")
+    parser.add_argument('--shapefile', default=DEFAULT_SHAPEFILE)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_transfer_')
+    try:
+        remote_dir = os.path.join(work_dir, 'folder', '202509231300')
+        local_dir = os.path.join(work_dir, 'local')
+        os.makedirs(remote_dir)
+        os.makedirs(local_dir)
+
+        with open(os.path.join(remote_dir, 'depth.tif'), 'wb') as f:
+            block = os.urandom(1024 * 1024)
+            for _ in range(args.size_mb):
+                f.write(block)
+        stem = os.path.splitext(args.shapefile)[0]
+        shapefile_parts = [stem + ext for ext in ('.shp',) + SHAPEFILE_SIDECARS if os.path.exists(stem + ext)]
+        for part in shapefile_parts:
+            shutil.copy(part, remote_dir)
+
+        folder = LocalFolder(os.path.join(work_dir, 'folder'))
+        raster_path = '/202509231300/depth.tif'
+        local_raster = os.path.join(local_dir, 'depth.tif')
+        print(f"File raster simulato: {args.size_mb} MB")
+        for name, func in (('lettura completa', read_whole), ('a blocchi', download_file)):
+            elapsed, peak = measure(func, folder, raster_path, local_raster)
+            print(f"{name:>18}: {elapsed:6.2f}s  {args.size_mb / elapsed:7.0f} MB/s  "
+                  f"picco memoria {peak / 1024 ** 2:7.1f} MB")
+
+        slow_folder = LatencyFolder(os.path.join(work_dir, 'folder'), args.latency_ms / 1000)
+        remote_parts = [f"/202509231300/{os.path.basename(part)}" for part in shapefile_parts]
+        print(f"\nShapefile: {len(remote_parts)} file, latenza simulata {args.latency_ms:g} ms per file")
+        for name, workers in (('sequenziale', 1), ('parallelo', 4)):
+            start = time.perf_counter()
+            download_files(slow_folder, remote_parts, local_dir, workers=workers)
+            print(f"{name:>18}: {time.perf_counter() - start:6.2f}s")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
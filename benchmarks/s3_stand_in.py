@@ -0,0 +1,101 @@
+"""
+OBJECT STORAGE S3 DI PROVA
+Server HTTP locale che serve una cartella come object storage S3
+compatibile: richieste GET/HEAD in stile path (/bucket/chiave) con supporto
+Range, ETag e Last-Modified, sufficienti alle letture /vsis3/ di GDAL.
+Conta richieste e byte inviati.
+
+Usato dal benchmark delle letture remote e dai test (tests/test_remote.py).
+"""
+
+import email.utils
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class S3StandIn(ThreadingHTTPServer):
+    """
+    Server HTTP locale compatibile con le letture S3 path-style di GDAL (/vsis3/)
+
+    Parametri:
+    - root: cartella servita (root/bucket/chiave)
+    """
+
+    daemon_threads = True
+
+    def __init__(self, root):
+        super().__init__(('127.0.0.1', 0), _S3Handler)
+        self.root = root
+        self.bytes_sent = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def endpoint(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, n_bytes):
+        with self._lock:
+            self.bytes_sent += n_bytes
+            self.requests += 1
+
+    def reset(self):
+        with self._lock:
+            self.bytes_sent = 0
+            self.requests = 0
+
+
+class _S3Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def _resolve(self):
+        key = self.path.split('?', 1)[0].lstrip('/')
+        path = os.path.join(self.server.root, *key.split('/'))
+        return path if key and os.path.isfile(path) else None
+
+    def _headers(self, path, status, length, content_range=None):
+        stat = os.stat(path)
+        self.send_response(status)
+        self.send_header('Content-Length', str(length))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', '"' + hashlib.md5(f"{stat.st_size}-{stat.st_mtime_ns}".encode()).hexdigest() + '"')
+        self.send_header('Last-Modified', email.utils.formatdate(stat.st_mtime, usegmt=True))
+        if content_range:
+            self.send_header('Content-Range', content_range)
+        self.end_headers()
+
+    def do_HEAD(self):
+        path = self._resolve()
+        if path is None:
+            self.send_error(404)
+            return
+        self._headers(path, 200, os.path.getsize(path))
+
+    def do_GET(self):
+        path = self._resolve()
+        if path is None:
+            self.send_error(404)
+            return
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        header = self.headers.get('Range')
+        if header and header.startswith('bytes='):
+            first, _, last = header[len('bytes='):].split(',')[0].partition('-')
+            start = int(first) if first else max(0, size - int(last))
+            end = min(int(last), size - 1) if first and last else size - 1
+        if start > end:
+            self.send_error(416)
+            return
+        length = end - start + 1
+        if header:
+            self._headers(path, 206, length, f"bytes {start}-{end}/{size}")
+        else:
+            self._headers(path, 200, length)
+        with open(path, 'rb') as f:
+            f.seek(start)
+            self.wfile.write(f.read(length))
+        self.server.count(length)
@@ -67,14 +67,24 @@ def _create_payload():
         raise
 
 # -------------------------------------------------------------------------------- NOTEBOOK-CELL: CODE
+from wd_cache import DiskCache, cached_download_files
+from wd_transfer import folder_index, shapefile_parts
+
+INPUT_CACHE_DIR = None      # Cache locale persistente degli input scaricati (None = download a ogni esecuzione)
+INPUT_CACHE_MAX_GB = 50     # Dimensione massima della cache input (eliminazione LRU)
+input_cache = DiskCache(INPUT_CACHE_DIR, INPUT_CACHE_MAX_GB) if INPUT_CACHE_DIR else None
+
+
 def _download_remote_to_tmp(remote_path: str, folder_obj, tmpdir: str):
     """
     Scarica risorsa remota da Dataiku Folder in una temp dir
 
     remote_path: percorso relativo nel folder (es. "/202509231300/output/merged_PRE.tif" o "202509231300/output/merged_PRE.tif")
-    folder_obj: oggetto dataiku.Folder
+    folder_obj: oggetto dataiku.Folder (o wd_transfer.LocalFolder per prove su cartella locale)
     tmpdir: directory locale di destinazione
     Restituisce percorso locale al file principale (es. .tif o .shp) oppure None se non trovato.
+    I file sono trasferiti a blocchi (memoria costante); i file di uno shapefile in parallelo.
+    Con INPUT_CACHE_DIR i file invariati sul folder sono presi dalla cache locale (hardlink).
     """
     try:
         tmpdir_path = tmpdir.name if hasattr(tmpdir, "name") else str(tmpdir)
@@ -84,58 +94,30 @@ def _download_remote_to_tmp(remote_path: str, folder_obj, tmpdir: str):
     if not remote_path:
         return None
     rp = str(remote_path).lstrip('/')
-    try:
-        file_list = folder_obj.list_paths_in_partition()
-    except Exception:
-        file_list = []
-
-    # 1) match esatto (case-insensitive)
-    for f in file_list:
-        if f.lower() == rp.lower():
-            local_p = os.path.join(tmpdir_path, os.path.basename(f))
-            with folder_obj.get_download_stream(f) as stream, open(local_p, 'wb') as out:
-                out.write(stream.read())
-            return local_p
+    # indice del folder condiviso tra le chiamate: un solo listing per folder
+    index = folder_index(folder_obj)
+
+    # 1) se è uno shapefile: scarica il .shp e i file con lo stesso stem nella sua cartella
+    if os.path.basename(rp).lower().endswith('.shp'):
+        # .shp per percorso esatto, suffisso o nome file; accessori (.dbf, .shx, .prj, .shp.xml, ...)
+        # della stessa cartella, un file per nome (download concorrente senza collisioni sui .part)
+        parts = shapefile_parts(rp, index)
+        if not parts:
+            return None
+        # il .shp è il primo file: None se il suo download non è riuscito
+        return cached_download_files(folder_obj, parts, tmpdir_path, input_cache)[0]
+
+    # 2) match esatto (case-insensitive)
+    f = index.exact(rp)
+    if f is not None:
+        return cached_download_files(folder_obj, [f], tmpdir_path, input_cache)[0]
 
-    # 2) se è uno shapefile: scarica tutti i files con lo stesso stem
     base_name = os.path.basename(rp)
-    stem, ext = os.path.splitext(base_name)
-    if ext.lower() == '.shp' and stem:
-        # individua tutti i file che contengono lo stem (nella stessa dir o con stesso basename)
-        matched = [f for f in file_list if os.path.basename(f).lower().startswith(stem.lower()) or f.lower().endswith('/' + stem.lower() + '.shp')]
-        if not matched:
-            # fallback: cerca per basename in tutto il folder
-            matched = [f for f in file_list if os.path.basename(f).lower().startswith(stem.lower())]
-        local_paths = []
-        for f in matched:
-            local_p = os.path.join(tmpdir_path, os.path.basename(f))
-            try:
-                with folder_obj.get_download_stream(f) as stream, open(local_p, 'wb') as out:
-                    out.write(stream.read())
-                local_paths.append(local_p)
-            except Exception:
-                continue
-        # ritorna il .shp locale se presente, altrimenti il primo file scaricato
-        for p in local_paths:
-            if p.lower().endswith('.shp'):
-                return p
-        return local_paths[0] if local_paths else None
-
-    # 3) match su filename alone (case-insensitive)
-    for f in file_list:
-        if os.path.basename(f).lower() == base_name.lower():
-            local_p = os.path.join(tmpdir_path, os.path.basename(f))
-            with folder_obj.get_download_stream(f) as stream, open(local_p, 'wb') as out:
-                out.write(stream.read())
-            return local_p
-
-    # 4) match "endswith" (per sicurezza)
-    for f in file_list:
-        if f.lower().endswith(rp.lower()):
-            local_p = os.path.join(tmpdir_path, os.path.basename(f))
-            with folder_obj.get_download_stream(f) as stream, open(local_p, 'wb') as out:
-                out.write(stream.read())
-            return local_p
+    # 3) match su filename alone (case-insensitive), 4) match "endswith" (per sicurezza)
+    matches = index.by_name(base_name)
+    f = matches[0] if matches else index.by_suffix(rp)
+    if f is not None:
+        return cached_download_files(folder_obj, [f], tmpdir_path, input_cache)[0]
 
     return None
 
@@ -194,6 +176,9 @@ def main():
         print(f"Cartella temporanea per download creata: {tmpdir}")
         folder_obj = minio_output
         folder_buildings = dataiku.Folder("minio_input")
+        # listing dei folder riletto a ogni esecuzione (l'indice condiviso sopravvive tra le esecuzioni del kernel)
+        folder_index(folder_obj, refresh=True)
+        folder_index(folder_buildings, refresh=True)
 
         # tenta di scaricare i percorsi (se remoti), altrimenti ritorna None e useremo i percorsi originali
         tmp_local_pre = _download_remote_to_tmp(DSM_PRE_PATH, folder_obj, tmpdir) or DSM_PRE_PATH
@@ -205,6 +190,8 @@ def main():
         print(f"  DSM_POST: {tmp_local_post}")
         print(f"  BUILDINGS:{tmp_local_buildings}")
         print(f"  temp_output_folder:{temp_output_folder}")
+        if input_cache is not None:
+            print(f"Cache input ({INPUT_CACHE_DIR}): {input_cache.summary()}")
        
 
         # Inizializza rilevatore (usa valori di default configurabili)
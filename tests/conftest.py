@@ -0,0 +1,94 @@
+"""
+Dati di prova condivisi: edifici di Goro (shapefile nella cartella del
+progetto) e raster di profondità sintetici sulla stessa area.
+"""
+
+import os
+import sys
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+BUILDINGS_PATH = os.path.join(os.path.dirname(__file__), '..', 'GORO_V_UVL_GPG.shp')
+PIXEL_SIZE = 5.0
+NODATA = -9999.0
+
+
+def write_depth_raster(path, buildings, nodata=NODATA, seed=0, **profile):
+    """
+    Raster di profondità sintetico che copre gli edifici: valori gamma, 30% di
+    pixel asciutti (0) e il terzo occidentale a nodata (-9999 anche se il
+    nodata non è dichiarato)
+    """
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = buildings.total_bounds
+    width = int((maxx - minx) / PIXEL_SIZE) + 40
+    height = int((maxy - miny) / PIXEL_SIZE) + 40
+    data = rng.gamma(1.0, 0.5, (height, width)).astype('float32')
+    data[rng.random((height, width)) < 0.3] = 0
+    data[:, :width // 3] = NODATA
+    options = dict(driver='GTiff', width=width, height=height, count=1, dtype='float32', crs=buildings.crs,
+                   transform=from_origin(minx - 100, maxy + 100, PIXEL_SIZE, PIXEL_SIZE), nodata=nodata,
+                   tiled=True, blockxsize=256, blockysize=256)
+    options.update(profile)
+    with rasterio.open(path, 'w', **options) as dst:
+        dst.write(data, 1)
+    return path
+
+
+@pytest.fixture(scope='session')
+def buildings():
+    return gpd.read_file(BUILDINGS_PATH, columns=[])
+
+
+@pytest.fixture(scope='session')
+def depth_raster(tmp_path_factory, buildings):
+    return write_depth_raster(str(tmp_path_factory.mktemp('raster') / 'depth.tif'), buildings)
+
+
+@pytest.fixture(scope='session')
+def depth_raster_no_nodata(tmp_path_factory, buildings):
+    return write_depth_raster(str(tmp_path_factory.mktemp('raster') / 'depth_no_nodata.tif'), buildings, nodata=None)
+
+
+@pytest.fixture(scope='session')
+def buildings_layer(tmp_path_factory, buildings):
+    """Shapefile edifici con campo altezza H_UVL e FID non posizionale (1000, 1003, ...)"""
+    rng = np.random.default_rng(1)
+    layer = buildings.copy()
+    layer['FID'] = 1000 + 3 * np.arange(len(layer))
+    layer['H_UVL'] = np.round(rng.uniform(0, 12, len(layer)), 2)
+    path = str(tmp_path_factory.mktemp('vector') / 'edifici.shp')
+    layer.to_file(path)
+    return path
+
+
+@pytest.fixture
+def estimation(monkeypatch, tmp_path):
+    """
+    Esecuzione di wd_estimation.main con configurazione di prova
+
+    Ritorna una funzione run(vector_path, raster_path, *argv, **config) che
+    imposta le costanti del modulo, esegue main e restituisce (exit code,
+    percorso dello shapefile di output)
+    """
+    import wd_estimation
+
+    def run(vector_path, raster_path, *argv, **config):
+        output_path = str(tmp_path / 'out' / 'wd_estimation.shp')
+        settings = dict(VECTOR_PATH=vector_path, RASTER_PATH=raster_path, OUTPUT_PATH=output_path,
+                        log_path=str(tmp_path / 'out' / 'wd_estimation.log'))
+        settings.update(config)
+        for name, value in settings.items():
+            monkeypatch.setattr(wd_estimation, name, value)
+        monkeypatch.setattr(sys, 'argv', ['wd_estimation.py', *argv])
+        with pytest.raises(SystemExit) as exit_info:
+            wd_estimation.main()
+        return exit_info.value.code, output_path
+
+    return run
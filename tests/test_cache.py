@@ -0,0 +1,107 @@
+import os
+import stat
+
+from wd_cache import DiskCache, cached_download_files
+from wd_transfer import LocalFolder
+
+
+class CountingFolder(LocalFolder):
+    """LocalFolder che conta i download effettivi"""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.downloads = []
+
+    def get_download_stream(self, path):
+        self.downloads.append(path)
+        return super().get_download_stream(path)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_cached_download_hit_and_miss(tmp_path):
+    remote = tmp_path / 'folder' / 'dati'
+    remote.mkdir(parents=True)
+    (remote / 'depth.tif').write_bytes(b'v1')
+    folder = CountingFolder(str(tmp_path / 'folder'))
+    cache = DiskCache(str(tmp_path / 'cache'))
+    work_dir = tmp_path / 'lavoro'
+    work_dir.mkdir()
+
+    local_path, = cached_download_files(folder, ['/dati/depth.tif'], str(work_dir), cache)
+    assert local_path == str(work_dir / 'depth.tif') and read(local_path) == b'v1'
+    assert folder.downloads == ['/dati/depth.tif'] and cache.misses == 1
+
+    # file invariato (stessa dimensione e data di modifica): nessun download
+    local_path, = cached_download_files(folder, ['/dati/depth.tif'], str(work_dir), cache)
+    assert read(local_path) == b'v1'
+    assert len(folder.downloads) == 1 and cache.hits == 1
+
+    # nuova dimensione: la versione remota cambia e il file viene riscaricato
+    (remote / 'depth.tif').write_bytes(b'v22')
+    local_path, = cached_download_files(folder, ['/dati/depth.tif'], str(work_dir), cache)
+    assert read(local_path) == b'v22' and len(folder.downloads) == 2
+
+    # stessa dimensione, nuova data di modifica: riscaricato
+    (remote / 'depth.tif').write_bytes(b'v33')
+    stat = os.stat(remote / 'depth.tif')
+    os.utime(remote / 'depth.tif', ns=(stat.st_atime_ns, stat.st_mtime_ns + 5_000_000_000))
+    local_path, = cached_download_files(folder, ['/dati/depth.tif'], str(work_dir), cache)
+    assert read(local_path) == b'v33' and len(folder.downloads) == 3
+    assert cache.misses == 3 and cache.hits == 1
+
+
+def test_cached_download_without_version(tmp_path):
+    remote = tmp_path / 'folder'
+    remote.mkdir()
+    (remote / 'a.dbf').write_bytes(b'dbf')
+
+    class NoDetailsFolder(CountingFolder):
+        def get_path_details(self, path):
+            raise NotImplementedError
+
+    folder = NoDetailsFolder(str(remote))
+    cache = DiskCache(str(tmp_path / 'cache'))
+    work_dir = tmp_path / 'lavoro'
+    work_dir.mkdir()
+    for _ in range(2):
+        local_path, = cached_download_files(folder, ['/a.dbf'], str(work_dir), cache)
+        assert read(local_path) == b'dbf'
+    assert len(folder.downloads) == 2
+
+
+def test_evict_read_only_entries(tmp_path, monkeypatch):
+    """Le voci della cache input sono in sola lettura: l'eliminazione LRU deve riuscire anche su Windows"""
+    real_remove = os.remove
+
+    def windows_remove(path):
+        if not os.stat(path).st_mode & stat.S_IWRITE:
+            raise PermissionError(13, 'Accesso negato', path)
+        real_remove(path)
+
+    remote = tmp_path / 'folder'
+    remote.mkdir()
+    (remote / 'a.tif').write_bytes(b'a' * 600)
+    (remote / 'b.tif').write_bytes(b'b' * 600)
+    folder = LocalFolder(str(remote))
+    cache = DiskCache(str(tmp_path / 'cache'), max_gb=1000 / 1024 ** 3)
+    work_dir = tmp_path / 'lavoro'
+    work_dir.mkdir()
+    monkeypatch.setattr(os, 'remove', windows_remove)
+
+    cached_download_files(folder, ['/a.tif'], str(work_dir), cache)
+    entry, = cache._index['entries'].values()
+    first = os.path.join(cache.cache_dir, entry['files'][0])
+    assert not os.stat(first).st_mode & stat.S_IWRITE
+
+    # seconda voce oltre il limite: la prima viene eliminata
+    cached_download_files(folder, ['/b.tif'], str(work_dir), cache)
+    assert not os.path.exists(first)
+    assert len(cache._index['entries']) == 1
+
+    # file di lavoro già presente (hardlink in sola lettura): sostituito
+    local_path, = cached_download_files(folder, ['/b.tif'], str(work_dir), cache)
+    assert read(local_path) == b'b' * 600
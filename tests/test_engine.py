@@ -0,0 +1,142 @@
+import numpy as np
+import rasterio
+import rasterio.mask
+import shapely
+from rasterio.transform import from_origin
+from shapely.geometry import mapping
+
+import wd_engine
+from wd_engine import build_rings, coverage_ring_stats, ring_coverage, zonal_ring_stats
+from wd_estimation import get_external_pixels
+
+
+def mask_stats(raster, rings):
+    """Statistiche per edificio con il percorso rasterio.mask (ZONAL_ENGINE = "mask")"""
+    count = np.zeros(len(rings), dtype=np.int64)
+    mean = np.full(len(rings), np.nan)
+    for i, ring in enumerate(rings):
+        values = get_external_pixels(None, raster, ring=ring)
+        count[i] = values.size
+        if values.size:
+            mean[i] = values.mean()
+    return count, mean
+
+
+def ring_only_count(raster, rings):
+    """Pixel dell'anello (ritaglio non riempito): riferimento per i raster senza nodata"""
+    count = np.zeros(len(rings), dtype=np.int64)
+    for i, ring in enumerate(rings):
+        try:
+            out_image, _ = rasterio.mask.mask(raster, [mapping(ring)], crop=True, filled=False)
+        except ValueError:
+            continue
+        count[i] = out_image[0].count()
+    return count
+
+
+def test_batch_matches_mask_with_nodata(depth_raster, buildings):
+    with rasterio.open(depth_raster) as raster:
+        rings = build_rings(buildings.geometry, abs(raster.transform.a))
+        count, mean = mask_stats(raster, rings)
+        stats = zonal_ring_stats(raster, rings)
+    np.testing.assert_array_equal(stats['count'], count)
+    covered = count > 0
+    assert covered.sum() > 100
+    np.testing.assert_allclose(stats['mean'][covered], mean[covered], rtol=1e-6)
+
+
+def test_batch_counts_ring_pixels_without_nodata(depth_raster_no_nodata, buildings):
+    with rasterio.open(depth_raster_no_nodata) as raster:
+        assert raster.nodata is None
+        rings = build_rings(buildings.geometry, abs(raster.transform.a))
+        stats = zonal_ring_stats(raster, rings)
+        tiled = zonal_ring_stats(raster, rings, tile_memory_mb=0.25)
+        expected = ring_only_count(raster, rings)
+        mask_count, _ = mask_stats(raster, rings)
+    np.testing.assert_array_equal(stats['count'], expected)
+    np.testing.assert_array_equal(tiled['count'], expected)
+    # il percorso mask conta anche lo 0 di riempimento del ritaglio fuori dall'anello
+    covered = expected > 0
+    assert np.all(mask_count[covered] > expected[covered])
+
+
+def reference_coverage(ring, transform):
+    """Copertura per cella da shapely.intersection con i box dei pixel: {(riga, colonna): frazione}"""
+    inv = ~transform
+    minx, miny, maxx, maxy = ring.bounds
+    cols, rows = inv * (np.array([minx, maxx]), np.array([maxy, miny]))
+    pixel_area = abs(transform.a * transform.e)
+    coverage = {}
+    for row in range(int(np.floor(rows.min())), int(np.ceil(rows.max()))):
+        for col in range(int(np.floor(cols.min())), int(np.ceil(cols.max()))):
+            x0, y0 = transform * (col, row)
+            x1, y1 = transform * (col + 1, row + 1)
+            area = shapely.intersection(ring, shapely.box(x0, y1, x1, y0)).area / pixel_area
+            if area > 1e-9:
+                coverage[(row, col)] = area
+    return coverage
+
+
+def assert_coverage(rings, transform):
+    owners, rows, cols, weights = ring_coverage(rings, np.arange(len(rings)), transform)
+    for i, ring in enumerate(rings):
+        mine = owners == i
+        computed = dict(zip(zip(rows[mine].tolist(), cols[mine].tolist()), weights[mine]))
+        expected = reference_coverage(ring, transform)
+        assert computed.keys() == expected.keys()
+        np.testing.assert_allclose([computed[key] for key in expected], list(expected.values()), atol=1e-9)
+    return rows, cols
+
+
+TRANSFORM = from_origin(1000.3, 2000.7, 5.0, 5.0)
+
+
+def test_coverage_polygon_with_hole():
+    outer = shapely.Polygon([(1003, 1981), (1041.2, 1978.4), (1036, 1948.9), (1001.7, 1955)],
+                            holes=[[(1012.1, 1970.2), (1025.3, 1969.9), (1022.8, 1959.6), (1011.4, 1961)]])
+    assert_coverage(np.array([outer]), TRANSFORM)
+
+
+def test_coverage_multipolygon():
+    parts = shapely.MultiPolygon([shapely.box(1004.2, 1962.1, 1019.9, 1979.3),
+                                  shapely.Polygon([(1031, 1990), (1052.5, 1983.3), (1040.1, 1971.2)])])
+    assert_coverage(np.array([parts]), TRANSFORM)
+
+
+def test_coverage_cells_outside_grid():
+    # anello a cavallo dell'origine della griglia: righe e colonne negative restituite
+    ring = shapely.box(990.4, 1991.3, 1011.8, 2008.6).difference(shapely.box(995.1, 1996.2, 1004.9, 2003.3))
+    rows, cols = assert_coverage(np.array([ring]), TRANSFORM)
+    assert (rows < 0).any() and (cols < 0).any()
+
+
+def test_coverage_building_rings(buildings):
+    rings = build_rings(buildings.geometry.iloc[:60], 5.0)
+    assert_coverage(rings, TRANSFORM)
+
+
+def test_coverage_stats_chunks_and_tiles(depth_raster, buildings, monkeypatch):
+    with rasterio.open(depth_raster) as raster:
+        rings = build_rings(buildings.geometry, abs(raster.transform.a))
+        stats = coverage_ring_stats(raster, rings)
+        tiled = coverage_ring_stats(raster, rings, tile_memory_mb=0.25)
+        monkeypatch.setattr(wd_engine, 'COVERAGE_CHUNK', 37)
+        chunked = coverage_ring_stats(raster, rings)
+
+        # riferimento: media pesata sull'area (shapely) dei pixel validi di alcuni edifici
+        data = raster.read(1)
+        for i in range(0, len(rings), 97):
+            coverage = reference_coverage(rings[i], raster.transform)
+            cells = [(key, weight) for key, weight in coverage.items() if data[key] != raster.nodata]
+            if not cells:
+                assert stats['count'][i] == 0
+                continue
+            weights = np.array([weight for _, weight in cells])
+            values = np.array([data[key] for key, _ in cells])
+            np.testing.assert_allclose(stats['count'][i], weights.sum(), rtol=1e-9)
+            np.testing.assert_allclose(stats['mean'][i], np.average(values, weights=weights), rtol=1e-6)
+            assert stats['max'][i] == values.max() and stats['min'][i] == values.min()
+
+    for other in (tiled, chunked):
+        for field in ('count', 'mean', 'min', 'max'):
+            np.testing.assert_allclose(other[field], stats[field], rtol=1e-9)
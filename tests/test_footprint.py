@@ -0,0 +1,77 @@
+import re
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import rasterio
+
+from conftest import write_depth_raster
+from wd_engine import (FOOTPRINT_DRY, FOOTPRINT_NODATA, FOOTPRINT_WET, build_rings, dry_buildings, wet_footprint,
+                       zonal_ring_stats)
+
+
+@pytest.fixture(scope='module')
+def dry_raster(tmp_path_factory, buildings):
+    """Raster di prova con la metà settentrionale asciutta (0): edifici saltati dall'impronta bagnata"""
+    path = write_depth_raster(str(tmp_path_factory.mktemp('raster') / 'dry.tif'), buildings, seed=3)
+    with rasterio.open(path, 'r+') as dst:
+        data = dst.read(1)
+        data[:dst.height // 2][data[:dst.height // 2] != dst.nodata] = 0
+        dst.write(data, 1)
+    return path
+
+
+@pytest.mark.parametrize('cell_size, strip_memory_mb', [(64, 64), (16, 0.01), (50, 0.05)])
+def test_wet_footprint_states(dry_raster, cell_size, strip_memory_mb):
+    with rasterio.open(dry_raster) as raster:
+        data = raster.read(1)
+        footprint = wet_footprint(raster, cell_size=cell_size, strip_memory_mb=strip_memory_mb)
+        nodata = raster.nodata
+    assert footprint.shape == (-(-data.shape[0] // cell_size), -(-data.shape[1] // cell_size))
+    for row, col in np.ndindex(footprint.shape):
+        cell = data[row * cell_size:(row + 1) * cell_size, col * cell_size:(col + 1) * cell_size]
+        valid = cell[cell != nodata]
+        expected = FOOTPRINT_WET if (valid != 0).any() else FOOTPRINT_DRY if valid.size else FOOTPRINT_NODATA
+        assert footprint[row, col] == expected
+
+
+def test_dry_buildings_have_no_wet_pixels(dry_raster, buildings):
+    with rasterio.open(dry_raster) as raster:
+        size = abs(raster.transform.a)
+        footprint = wet_footprint(raster, cell_size=16)
+        dry, has_valid = dry_buildings(buildings.geometry, size, raster, footprint, 16)
+        stats = zonal_ring_stats(raster, build_rings(buildings.geometry, size))
+    assert dry.sum() > 100 and (~dry).sum() > 100
+    assert (stats['max'][dry & (stats['count'] > 0)] == 0).all()
+    # pixel validi nell'anello solo se le celle sotto l'anello ne hanno
+    assert not (dry & ~has_valid & (stats['count'] > 0)).any()
+
+
+def summary(caplog):
+    """Edifici elaborati e non processati dal riepilogo dell'esecuzione"""
+    text = caplog.text
+    return (int(re.search(r'Elaborati con successo: (\d+)', text).group(1)),
+            int(re.search(r'Non processati: (\d+)', text).group(1)))
+
+
+def test_wet_footprint_same_results(estimation, buildings_layer, dry_raster):
+    code, output_path = estimation(buildings_layer, dry_raster)
+    assert code == 0
+    full = gpd.read_file(output_path)
+    code, output_path = estimation(buildings_layer, dry_raster, WET_FOOTPRINT=True)
+    assert code == 0
+    skipped = gpd.read_file(output_path)
+    for field in ('DEPTH_MEAN', 'DEPTH_MIN', 'DEPTH_MAX', 'PERC_SUBM'):
+        np.testing.assert_allclose(skipped[field], full[field])
+
+
+def test_wet_footprint_processed_rule(estimation, buildings_layer, dry_raster, caplog, tmp_path):
+    """Stessa ripartizione elaborati/non processati per motore batch, mask e indice pixel"""
+    caplog.set_level('INFO')
+    summaries = []
+    for config in (dict(), dict(ZONAL_ENGINE="mask"), dict(PIXEL_INDEX_DIR=str(tmp_path / 'indici'))):
+        caplog.clear()
+        assert estimation(buildings_layer, dry_raster, WET_FOOTPRINT=True, **config)[0] == 0
+        assert re.search(r'Edifici in area asciutta/nodata .*: [1-9]', caplog.text)
+        summaries.append(summary(caplog))
+    assert summaries[0] == summaries[1] == summaries[2]
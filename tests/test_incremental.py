@@ -0,0 +1,104 @@
+import re
+import shutil
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import rasterio
+
+METRICS = ('DEPTH_MEAN', 'DEPTH_MIN', 'DEPTH_MAX', 'PERC_SUBM')
+
+
+def reused(caplog):
+    """Edifici ripresi e da calcolare secondo il riepilogo dell'esecuzione incrementale"""
+    match = re.search(r'Esecuzione incrementale: (\d+) edifici invariati, (\d+) nuovi/modificati da calcolare, '
+                      r'(\d+) impronte precedenti', caplog.text)
+    return tuple(int(value) for value in match.groups())
+
+
+def incremental_run(estimation, caplog, vector_path, raster_path, **config):
+    caplog.clear()
+    code, output_path = estimation(vector_path, raster_path, '--incremental', **config)
+    assert code == 0
+    return gpd.read_file(output_path), reused(caplog)
+
+
+def full_run(estimation, vector_path, raster_path, **config):
+    code, output_path = estimation(vector_path, raster_path, **config)
+    assert code == 0
+    return gpd.read_file(output_path)
+
+
+def assert_same_metrics(result, expected):
+    for field in METRICS:
+        np.testing.assert_allclose(result[field], expected[field])
+
+
+def test_changed_buildings_recomputed(estimation, caplog, buildings_layer, depth_raster, tmp_path):
+    caplog.set_level('INFO')
+    _, counts = incremental_run(estimation, caplog, buildings_layer, depth_raster)
+    n = counts[1]
+    assert counts == (0, n, 0)
+
+    # 5 altezze cambiate, 3 edifici spostati, 2 eliminati
+    layer = gpd.read_file(buildings_layer)
+    layer.loc[10:14, 'H_UVL'] += 1.5
+    layer.loc[20:22, 'geometry'] = layer.geometry.iloc[20:23].translate(7.0, 0).values
+    layer = layer.drop(index=[30, 31]).reset_index(drop=True)
+    changed_path = str(tmp_path / 'modificato.shp')
+    layer.to_file(changed_path)
+
+    result, counts = incremental_run(estimation, caplog, changed_path, depth_raster)
+    assert counts == (n - 10, 8, 10)
+    assert_same_metrics(result, full_run(estimation, changed_path, depth_raster))
+
+    # nessuna modifica: tutto ripreso
+    _, counts = incremental_run(estimation, caplog, changed_path, depth_raster)
+    assert counts == (n - 2, 0, 0)
+
+
+def test_changed_parameters_recompute_all(estimation, caplog, buildings_layer, depth_raster):
+    caplog.set_level('INFO')
+    _, (_, n, _) = incremental_run(estimation, caplog, buildings_layer, depth_raster)
+    _, counts = incremental_run(estimation, caplog, buildings_layer, depth_raster, BUFFER_DISTANCE=10.0)
+    assert counts == (0, n, 0)
+    assert 'raster o parametri cambiati, ricalcolo completo' in caplog.text
+
+
+def test_changed_raster_tiles_recomputed(estimation, caplog, buildings_layer, depth_raster, tmp_path):
+    caplog.set_level('INFO')
+    raster_path = str(tmp_path / 'depth.tif')
+    shutil.copy(depth_raster, raster_path)
+    _, (_, n, _) = incremental_run(estimation, caplog, buildings_layer, raster_path, INCREMENTAL_TILE_SIZE=128)
+    before = full_run(estimation, buildings_layer, raster_path)
+
+    # raster riconsegnato con un solo tile 128x128 modificato: quello con più edifici nella parte con dati
+    centroids = gpd.read_file(buildings_layer).geometry.centroid
+    with rasterio.open(raster_path, 'r+') as dst:
+        rows, cols = rasterio.transform.rowcol(dst.transform, centroids.x, centroids.y)
+        rows, cols = np.asarray(rows) // 128, np.asarray(cols) // 128
+        east = cols * 128 > dst.width // 3
+        tiles, per_tile = np.unique(np.stack([rows[east], cols[east]]), axis=1, return_counts=True)
+        tile_row, tile_col = tiles[:, per_tile.argmax()]
+        window = rasterio.windows.Window(tile_col * 128, tile_row * 128, 128, 128)
+        data = dst.read(1, window=window)
+        dst.write(np.where(data == dst.nodata, data, data + 0.7), 1, window=window)
+
+    result, counts = incremental_run(estimation, caplog, buildings_layer, raster_path, INCREMENTAL_TILE_SIZE=128)
+    stale = int(re.search(r'Raster modificato in 1/\d+ tile: (\d+) edifici interessati', caplog.text).group(1))
+    assert 0 < stale < n // 4
+    assert counts == (n - stale, stale, 0)
+    after = full_run(estimation, buildings_layer, raster_path)
+    assert_same_metrics(result, after)
+    assert (after['DEPTH_MEAN'] != before['DEPTH_MEAN']).sum() > 0
+
+
+def test_raster_change_without_tiles_recomputes_all(estimation, caplog, buildings_layer, depth_raster, tmp_path):
+    caplog.set_level('INFO')
+    raster_path = str(tmp_path / 'depth.tif')
+    shutil.copy(depth_raster, raster_path)
+    _, (_, n, _) = incremental_run(estimation, caplog, buildings_layer, raster_path, INCREMENTAL_TILE_SIZE=None)
+    with rasterio.open(raster_path, 'r+') as dst:
+        dst.write(dst.read(1) * 1.1, 1)
+    _, counts = incremental_run(estimation, caplog, buildings_layer, raster_path, INCREMENTAL_TILE_SIZE=None)
+    assert counts == (0, n, 0)
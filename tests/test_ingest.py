@@ -0,0 +1,78 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from conftest import NODATA, write_depth_raster
+from wd_cache import COG_BLOCKSIZE, DiskCache, cached_cog, cog_problems
+
+
+@pytest.fixture(scope='module')
+def striped_raster(tmp_path_factory, buildings):
+    """Raster a strisce, non compresso e senza overview (consegna tipica da ingerire)"""
+    return write_depth_raster(str(tmp_path_factory.mktemp('raster') / 'strisce.tif'), buildings,
+                              tiled=False, blockxsize=None, blockysize=None)
+
+
+def assert_same_pixels(source_path, cog_path, nodata):
+    with rasterio.open(source_path) as src, rasterio.open(cog_path) as cog:
+        assert cog.nodata == nodata
+        assert (cog.crs, cog.transform, cog.shape) == (src.crs, src.transform, src.shape)
+        np.testing.assert_array_equal(cog.read(1), src.read(1))
+        assert cog.block_shapes[0] == (COG_BLOCKSIZE, COG_BLOCKSIZE)
+        assert cog.overviews(1)
+        assert cog.compression.name.lower() == 'deflate'
+        assert cog_problems(cog) == []
+
+
+def test_striped_raster_converted(striped_raster, tmp_path):
+    cache = DiskCache(str(tmp_path / 'cog'))
+    with rasterio.open(striped_raster) as src:
+        assert cog_problems(src)
+    path = cached_cog(striped_raster, cache)
+    assert path != striped_raster
+    assert_same_pixels(striped_raster, path, NODATA)
+    assert cached_cog(striped_raster, cache) == path
+    assert cache.hits == 1
+
+
+def test_nodata_declared(depth_raster_no_nodata, tmp_path):
+    path = cached_cog(depth_raster_no_nodata, DiskCache(str(tmp_path / 'cog')), nodata=NODATA)
+    assert_same_pixels(depth_raster_no_nodata, path, NODATA)
+    with rasterio.open(path) as cog:
+        masked = cog.read(1, masked=True)
+    assert masked.mask.any() and not (masked.compressed() == NODATA).any()
+
+
+def test_cog_used_directly(striped_raster, tmp_path):
+    cache = DiskCache(str(tmp_path / 'cog'))
+    path = cached_cog(striped_raster, cache)
+    assert cached_cog(path, DiskCache(str(tmp_path / 'altra'))) == path
+
+
+def test_invalid_rasters(tmp_path):
+    cache = DiskCache(str(tmp_path / 'cog'))
+    no_crs = str(tmp_path / 'senza_crs.tif')
+    with rasterio.open(no_crs, 'w', driver='GTiff', width=8, height=8, count=1, dtype='float32',
+                       transform=from_origin(0, 8, 1, 1)) as dst:
+        dst.write(np.zeros((1, 8, 8), dtype='float32'))
+    with pytest.raises(ValueError, match='sistema di riferimento'):
+        cached_cog(no_crs, cache)
+    byte_raster = str(tmp_path / 'byte.tif')
+    with rasterio.open(byte_raster, 'w', driver='GTiff', width=8, height=8, count=1, dtype='uint8',
+                       crs='EPSG:32632', transform=from_origin(0, 8, 1, 1)) as dst:
+        dst.write(np.zeros((1, 8, 8), dtype='uint8'))
+    with pytest.raises(ValueError, match='non rappresentabile'):
+        cached_cog(byte_raster, cache, nodata=NODATA)
+
+
+def test_ingest_run_same_results(estimation, buildings_layer, striped_raster, tmp_path):
+    code, output_path = estimation(buildings_layer, striped_raster)
+    assert code == 0
+    direct = gpd.read_file(output_path)
+    code, output_path = estimation(buildings_layer, striped_raster, INGEST_CACHE_DIR=str(tmp_path / 'cog'))
+    assert code == 0
+    ingested = gpd.read_file(output_path)
+    for field in ('DEPTH_MEAN', 'DEPTH_MIN', 'DEPTH_MAX', 'PERC_SUBM'):
+        np.testing.assert_allclose(ingested[field], direct[field])
@@ -0,0 +1,59 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+
+import wd_io
+from wd_io import list_fields, projected_columns, read_buildings
+
+
+@pytest.fixture(scope='module')
+def dbtr_layer(tmp_path_factory, buildings):
+    """Layer con attributi non usati dall'analisi, FID in minuscolo e campo altezza"""
+    layer = buildings.iloc[:300].copy()
+    layer['CLASSE'] = 'edificio'
+    layer['fid'] = np.arange(300) * 7
+    layer['H_UVL'] = np.linspace(0, 15, 300)
+    layer['NOTE'] = 'x' * 40
+    directory = tmp_path_factory.mktemp('vector')
+    shapefile = str(directory / 'V_UVL_GPG.shp')
+    layer.to_file(shapefile)
+    parquet = str(directory / 'V_UVL_GPG.parquet')
+    layer.to_parquet(parquet)
+    return shapefile, parquet, layer
+
+
+def test_projected_columns():
+    assert projected_columns(['CLASSE', 'fid', 'H_UVL', 'NOTE'], 'H_UVL') == ['fid', 'H_UVL']
+    assert projected_columns(['CLASSE', 'NOTE'], 'H_UVL') == []
+
+
+@pytest.mark.parametrize('fmt', ['shapefile', 'parquet'])
+def test_read_buildings_projects_columns(dbtr_layer, fmt):
+    shapefile, parquet, layer = dbtr_layer
+    path = shapefile if fmt == 'shapefile' else parquet
+    assert list_fields(path) == ['CLASSE', 'fid', 'H_UVL', 'NOTE']
+    vector = read_buildings(path, 'H_UVL')
+    assert list(vector.columns) == ['fid', 'H_UVL', 'geometry']
+    np.testing.assert_array_equal(vector['fid'], layer['fid'])
+    np.testing.assert_allclose(vector['H_UVL'], layer['H_UVL'])
+    assert vector.crs == layer.crs
+    assert vector.geometry.geom_equals_exact(layer.geometry, tolerance=1e-6).all()
+
+
+def test_read_buildings_fiona_fallback(dbtr_layer, monkeypatch):
+    shapefile, _, layer = dbtr_layer
+    expected = read_buildings(shapefile, 'H_UVL')
+    monkeypatch.setattr(wd_io, 'pyogrio', None)
+    calls = []
+    read_file = gpd.read_file
+    monkeypatch.setattr(gpd, 'read_file', lambda *args, **kwargs: calls.append(kwargs) or read_file(*args, **kwargs))
+    vector = read_buildings(shapefile, 'H_UVL')
+    assert calls == [{'engine': 'fiona'}]
+    assert list(vector.columns) == list(expected.columns)
+    np.testing.assert_array_equal(vector['fid'], expected['fid'])
+    np.testing.assert_allclose(vector['H_UVL'], expected['H_UVL'])
+
+
+def test_read_buildings_missing_height(dbtr_layer):
+    vector = read_buildings(dbtr_layer[0], 'ALTEZZA')
+    assert list(vector.columns) == ['fid', 'geometry']
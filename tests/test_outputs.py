@@ -0,0 +1,71 @@
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+from conftest import write_depth_raster
+from wd_io import building_keys
+
+
+def test_keys_from_layer(buildings_layer):
+    vector = gpd.read_file(buildings_layer)
+    vector = vector.rename(columns={'FID': 'fid'})
+    name, values = building_keys(vector)
+    assert name == 'fid'
+    np.testing.assert_array_equal(values, 1000 + 3 * np.arange(len(vector)))
+
+
+def test_generated_keys(buildings):
+    name, values = building_keys(buildings)
+    assert name == 'FID'
+    np.testing.assert_array_equal(values, np.arange(1, len(buildings) + 1))
+
+
+def test_attribute_output_keys(estimation, buildings_layer, depth_raster):
+    code, output_path = estimation(buildings_layer, depth_raster, COLUMNAR_OUTPUT="attributes")
+    assert code == 0
+    attributes = pd.read_feather(output_path.replace('.shp', '_attributi.feather'))
+    shapefile = gpd.read_file(output_path)
+    expected = gpd.read_file(buildings_layer)['FID'].to_numpy()
+    assert attributes.columns[0] == 'FID'
+    np.testing.assert_array_equal(attributes['FID'], expected)
+    np.testing.assert_allclose(attributes['DEPTH_MEAN'], shapefile['DEPTH_MEAN'])
+
+
+def test_parquet_output_round_trip(estimation, buildings_layer, depth_raster):
+    code, output_path = estimation(buildings_layer, depth_raster, COLUMNAR_OUTPUT="parquet")
+    assert code == 0
+    columnar = gpd.read_parquet(output_path.replace('.shp', '.parquet'))
+    shapefile = gpd.read_file(output_path)
+    layer = gpd.read_file(buildings_layer)
+    assert columnar.columns[0] == 'FID'
+    np.testing.assert_array_equal(columnar['FID'], layer['FID'])
+    for field in ('A_BASE', 'VOL', 'DEPTH_MEAN', 'DEPTH_MAX', 'PERC_SUBM'):
+        np.testing.assert_allclose(columnar[field], shapefile[field])
+    assert columnar.geometry.geom_equals_exact(layer.geometry, tolerance=1e-6).all()
+
+
+def test_scenario_table_keys(estimation, buildings_layer, depth_raster, tmp_path):
+    second = write_depth_raster(str(tmp_path / 'TR200.tif'), gpd.read_file(buildings_layer), seed=5)
+    code, output_path = estimation(buildings_layer, depth_raster, '--scenarios', depth_raster, second)
+    assert code == 0
+    table = pd.read_csv(output_path.replace('.shp', '_scenari.csv'))
+    assert table.columns[0] == 'FID'
+    np.testing.assert_array_equal(table['FID'], 1000 + 3 * np.arange(len(table)))
+
+
+def test_feather_output_without_shapefile(estimation, buildings_layer, depth_raster):
+    code, output_path = estimation(buildings_layer, depth_raster, COLUMNAR_OUTPUT="feather")
+    assert code == 0
+    reference = gpd.read_file(output_path)
+    os.remove(output_path)
+    code, output_path = estimation(buildings_layer, depth_raster, COLUMNAR_OUTPUT="feather", WRITE_SHAPEFILE=False)
+    assert code == 0
+    assert not os.path.exists(output_path)
+    columnar = gpd.read_feather(output_path.replace('.shp', '.feather'))
+    assert columnar.crs == reference.crs
+    assert list(columnar.columns) == ['FID'] + [c for c in reference.columns if c != 'geometry'] + ['geometry']
+    for field in ('A_BASE', 'H_UVL', 'DEPTH_MEAN', 'DEPTH_MIN', 'PERC_SUBM'):
+        np.testing.assert_allclose(columnar[field], reference[field])
+    assert columnar.geometry.geom_equals_exact(reference.geometry, tolerance=1e-6).all()
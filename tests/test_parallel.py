@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+import rasterio
+
+from wd_engine import build_rings, reproject_raster, zonal_ring_stats, zonal_ring_stats_parallel
+
+STAT_KEYS = ('count', 'sum', 'mean', 'min', 'max')
+
+
+def assert_same_stats(expected, actual):
+    for key in STAT_KEYS:
+        np.testing.assert_array_equal(expected[key], actual[key], err_msg=key)
+
+
+@pytest.fixture(scope='module')
+def reprojected(tmp_path_factory, depth_raster, buildings):
+    """Raster riproiettato in EPSG:3004 sul riquadro degli edifici (LAZY_REPROJECTION = True)"""
+    vector = buildings.to_crs('EPSG:3004')
+    path = str(tmp_path_factory.mktemp('parallel') / 'depth_3004.tif')
+    with rasterio.open(depth_raster) as src:
+        reproject_raster(src, 'EPSG:3004', path, bounds=tuple(vector.total_bounds))
+    return path, vector
+
+
+@pytest.mark.parametrize('tile_memory_mb', [None, 0.25])
+def test_parallel_matches_serial(depth_raster, buildings, tile_memory_mb):
+    with rasterio.open(depth_raster) as raster:
+        rings = build_rings(buildings.geometry, abs(raster.transform.a))
+        serial = zonal_ring_stats(raster, rings, tile_memory_mb=tile_memory_mb)
+    parallel = zonal_ring_stats_parallel(depth_raster, rings, 2, tile_memory_mb=tile_memory_mb)
+    assert_same_stats(serial, parallel)
+
+
+@pytest.mark.parametrize('tile_memory_mb', [None, 0.25])
+def test_parallel_matches_serial_reprojected(reprojected, tile_memory_mb):
+    path, vector = reprojected
+    with rasterio.open(path) as raster:
+        rings = build_rings(vector.geometry, abs(raster.transform.a))
+        serial = zonal_ring_stats(raster, rings)
+    parallel = zonal_ring_stats_parallel(path, rings, 3, tile_memory_mb=tile_memory_mb)
+    assert serial['count'].sum() > 0
+    assert_same_stats(serial, parallel)
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+import rasterio
+
+from conftest import BUILDINGS_PATH
+from wd_cache import DiskCache, load_or_build_pixel_index
+from wd_engine import build_pixel_index, build_rings, pixel_index_stats, zonal_ring_stats
+
+
+@pytest.mark.parametrize('raster_fixture', ['depth_raster', 'depth_raster_no_nodata'])
+def test_pixel_index_matches_batch(request, buildings, raster_fixture):
+    with rasterio.open(request.getfixturevalue(raster_fixture)) as raster:
+        rings = build_rings(buildings.geometry, abs(raster.transform.a))
+        expected = zonal_ring_stats(raster, rings)
+        indptr, indices = build_pixel_index(raster, rings)
+        tiled_index = build_pixel_index(raster, rings, tile_memory_mb=0.25)
+        stats = pixel_index_stats(raster, indptr, indices)
+        tiled = pixel_index_stats(raster, indptr, indices, tile_memory_mb=0.25)
+    assert len(indptr) == len(buildings) + 1
+    np.testing.assert_array_equal(tiled_index[0], indptr)
+    np.testing.assert_array_equal(tiled_index[1], indices)
+    for result in (stats, tiled):
+        np.testing.assert_array_equal(result['count'], expected['count'])
+        for field in ('mean', 'min', 'max'):
+            np.testing.assert_allclose(result[field], expected[field], rtol=1e-6)
+
+
+def test_pixel_index_store(tmp_path, buildings, depth_raster):
+    cache = DiskCache(str(tmp_path / 'indici'))
+    with rasterio.open(depth_raster) as raster:
+        built = load_or_build_pixel_index(BUILDINGS_PATH, buildings, raster, 5.0, cache)
+        stored = load_or_build_pixel_index(BUILDINGS_PATH, buildings, raster, 5.0, cache)
+        assert cache.hits == 1
+        assert isinstance(stored[1], np.memmap)
+        np.testing.assert_array_equal(stored[0], built[0])
+        np.testing.assert_array_equal(stored[1], built[1])
+        stats = pixel_index_stats(raster, *stored)
+        expected = zonal_ring_stats(raster, build_rings(buildings.geometry, 5.0))
+    np.testing.assert_array_equal(stats['count'], expected['count'])
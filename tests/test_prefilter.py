@@ -0,0 +1,70 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+import rasterio
+from rasterio.windows import Window
+
+from wd_engine import build_rings, overlapping_buildings, raster_extent, zonal_ring_stats
+
+
+@pytest.fixture(scope='module')
+def partial_raster(tmp_path_factory, depth_raster):
+    """Metà orientale di depth.tif con una cornice di nodata: copre solo parte degli edifici"""
+    path = str(tmp_path_factory.mktemp('raster') / 'parziale.tif')
+    with rasterio.open(depth_raster) as src:
+        window = Window(src.width // 2, 0, src.width - src.width // 2, src.height)
+        data = src.read(1, window=window)
+        profile = src.profile
+        profile.update(width=window.width, height=window.height, transform=src.window_transform(window))
+    data[:40] = data[-40:] = src.nodata
+    data[:, :40] = data[:, -40:] = src.nodata
+    with rasterio.open(path, 'w', **profile) as dst:
+        dst.write(data, 1)
+    return path
+
+
+def test_raster_extent(partial_raster):
+    with rasterio.open(partial_raster) as raster:
+        assert raster_extent(raster) == tuple(raster.bounds)
+        minx, miny, maxx, maxy = raster_extent(raster, valid_data=True)
+        size = raster.transform.a
+        left, bottom, right, top = raster.bounds
+    np.testing.assert_allclose([minx, miny, maxx, maxy],
+                               [left + 40 * size, bottom + 40 * size, right - 40 * size, top - 40 * size])
+
+
+@pytest.mark.parametrize('valid_data', [False, True])
+def test_only_non_overlapping_buildings_skipped(partial_raster, buildings, valid_data):
+    with rasterio.open(partial_raster) as raster:
+        size = abs(raster.transform.a)
+        overlap = overlapping_buildings(buildings.geometry, raster_extent(raster, valid_data=valid_data),
+                                        margin=2 * size)
+        stats = zonal_ring_stats(raster, build_rings(buildings.geometry, size))
+    assert 0 < overlap.sum() < len(buildings)
+    # gli edifici esclusi non hanno pixel validi nell'anello; tra quelli inclusi molti ne hanno
+    assert (stats['count'][~overlap] == 0).all()
+    assert (stats['count'][overlap] > 0).sum() > 100
+
+
+def test_no_valid_data(tmp_path, buildings):
+    path = str(tmp_path / 'vuoto.tif')
+    with rasterio.open(path, 'w', driver='GTiff', width=64, height=64, count=1, dtype='float32',
+                       nodata=-9999.0, transform=rasterio.transform.from_origin(0, 64, 1, 1)) as dst:
+        dst.write(np.full((1, 64, 64), -9999.0, dtype='float32'))
+    with rasterio.open(path) as raster:
+        extent = raster_extent(raster, valid_data=True)
+    assert extent is None
+    assert not overlapping_buildings(buildings.geometry, extent, margin=1.0).any()
+
+
+@pytest.mark.parametrize('mode', ['bounds', 'data'])
+def test_prefilter_same_results(estimation, buildings_layer, partial_raster, mode):
+    code, output_path = estimation(buildings_layer, partial_raster)
+    assert code == 0
+    full = gpd.read_file(output_path)
+    code, output_path = estimation(buildings_layer, partial_raster, BBOX_PREFILTER=mode)
+    assert code == 0
+    filtered = gpd.read_file(output_path)
+    assert len(filtered) == len(full)
+    for field in ('A_BASE', 'VOL', 'DEPTH_MEAN', 'DEPTH_MIN', 'DEPTH_MAX', 'PERC_SUBM'):
+        np.testing.assert_allclose(filtered[field], full[field])
@@ -0,0 +1,62 @@
+import os
+import shutil
+import threading
+import uuid
+from urllib.request import Request, urlopen
+
+import numpy as np
+import pytest
+import rasterio
+
+from benchmarks.s3_stand_in import S3StandIn
+from wd_engine import build_rings, configure_remote_access, remote_raster_path, zonal_ring_stats
+
+BUCKET = 'test'
+
+
+@pytest.fixture
+def s3(tmp_path):
+    """S3StandIn su tmp_path con le opzioni GDAL ripristinate a fine test"""
+    (tmp_path / BUCKET).mkdir()
+    server = S3StandIn(str(tmp_path))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    environ = dict(os.environ)
+    configure_remote_access(server.endpoint, anonymous=True)
+    yield server
+    os.environ.clear()
+    os.environ.update(environ)
+    server.shutdown()
+    server.server_close()
+
+
+def upload(s3, path):
+    """Copia il file nel bucket con una chiave nuova (nessuna cache GDAL da letture precedenti)"""
+    key = f"{uuid.uuid4().hex}/{os.path.basename(path)}"
+    os.makedirs(os.path.join(s3.root, BUCKET, os.path.dirname(key)))
+    shutil.copy(path, os.path.join(s3.root, BUCKET, key))
+    return f"s3://{BUCKET}/{key}"
+
+
+@pytest.mark.parametrize('tile_memory_mb', [None, 0.25])
+def test_vsis3_matches_local(s3, depth_raster, buildings, tile_memory_mb):
+    with rasterio.open(depth_raster) as local:
+        rings = build_rings(buildings.geometry, abs(local.transform.a))
+        expected = zonal_ring_stats(local, rings, tile_memory_mb=tile_memory_mb)
+    remote_path = remote_raster_path(upload(s3, depth_raster))
+    assert remote_path.startswith(f"/vsis3/{BUCKET}/")
+    s3.reset()
+    with rasterio.open(remote_path) as remote:
+        actual = zonal_ring_stats(remote, rings, tile_memory_mb=tile_memory_mb)
+    assert s3.requests > 0
+    for key in ('count', 'sum', 'mean', 'min', 'max'):
+        np.testing.assert_array_equal(expected[key], actual[key], err_msg=key)
+
+
+def test_s3_stand_in_range(s3, tmp_path):
+    (tmp_path / BUCKET / 'dati.bin').write_bytes(bytes(range(100)))
+    request = Request(f"{s3.endpoint}/{BUCKET}/dati.bin", headers={'Range': 'bytes=10-19'})
+    with urlopen(request) as response:
+        assert response.status == 206
+        assert response.headers['Content-Range'] == 'bytes 10-19/100'
+        assert response.read() == bytes(range(10, 20))
+    assert s3.bytes_sent == 10
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+import rasterio
+from rasterio.warp import calculate_default_transform, reproject, Resampling
+
+from wd_cache import DiskCache, cached_reprojection
+from wd_engine import build_rings, reproject_raster, zonal_ring_stats
+
+TARGET_CRS = 'EPSG:3004'
+
+
+def full_copy(raster, dst_crs):
+    """Riproiezione completa come in wd_estimation.main() (LAZY_REPROJECTION = False)"""
+    transform, width, height = calculate_default_transform(
+        raster.crs, dst_crs, raster.width, raster.height, *raster.bounds)
+    data = np.full((height, width), raster.nodata, dtype=raster.dtypes[0])
+    reproject(source=rasterio.band(raster, 1), destination=data, src_transform=raster.transform,
+              src_crs=raster.crs, dst_transform=transform, dst_crs=dst_crs, dst_nodata=raster.nodata,
+              resampling=Resampling.bilinear)
+    return data, transform
+
+
+@pytest.fixture(scope='module')
+def warped(tmp_path_factory, depth_raster, buildings):
+    """Raster riproiettato nel solo riquadro degli edifici (LAZY_REPROJECTION = True)"""
+    vector = buildings.to_crs(TARGET_CRS)
+    path = str(tmp_path_factory.mktemp('warped') / 'depth_3004.tif')
+    with rasterio.open(depth_raster) as src:
+        reproject_raster(src, TARGET_CRS, path, bounds=tuple(vector.total_bounds))
+    with rasterio.open(path) as raster:
+        rings = build_rings(vector.geometry, abs(raster.transform.a))
+    return path, rings
+
+
+def test_full_grid_matches_full_copy(tmp_path, depth_raster):
+    with rasterio.open(depth_raster) as src:
+        expected, transform = full_copy(src, TARGET_CRS)
+        path = reproject_raster(src, TARGET_CRS, str(tmp_path / 'full.tif'))
+    with rasterio.open(path) as raster:
+        assert raster.transform == transform
+        np.testing.assert_array_equal(raster.read(1), expected)
+
+
+def test_bounded_grid_is_window_of_full_grid(warped, depth_raster):
+    path, _ = warped
+    with rasterio.open(depth_raster) as src:
+        _, full_transform = full_copy(src, TARGET_CRS)
+    with rasterio.open(path) as raster:
+        col, row = ~full_transform * (raster.transform.c, raster.transform.f)
+        assert (col, row) == (round(col), round(row))
+        assert raster.transform.a == full_transform.a and raster.transform.e == full_transform.e
+
+
+def test_bounded_grid_engines_agree(warped):
+    path, rings = warped
+    with rasterio.open(path) as raster:
+        single = zonal_ring_stats(raster, rings)
+        tiled = zonal_ring_stats(raster, rings, tile_memory_mb=0.25)
+    assert single['count'].sum() > 0
+    for key in ('count', 'sum', 'mean', 'min', 'max'):
+        np.testing.assert_array_equal(single[key], tiled[key])
+
+
+def test_cached_reprojection_matches_full_copy(tmp_path, depth_raster):
+    cache = DiskCache(str(tmp_path / 'cache'))
+    with rasterio.open(depth_raster) as src:
+        expected, transform = full_copy(src, TARGET_CRS)
+        path = cached_reprojection(src, TARGET_CRS, cache)
+        assert cached_reprojection(src, TARGET_CRS, cache) == path
+    assert cache.hits == 1
+    with rasterio.open(path) as raster:
+        assert raster.transform == transform
+        np.testing.assert_array_equal(raster.read(1), expected)
@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+from wd_estimation import scenario_names
+
+
+def test_unique_file_names():
+    assert scenario_names(['dati/TR50.tif', 'dati/TR200.tif']) == ['TR50', 'TR200']
+
+
+def test_same_file_name_in_different_directories(tmp_path):
+    paths = [str(tmp_path / 'modello_a' / 'TR50.tif'), str(tmp_path / 'modello_b' / 'TR50.tif'),
+             str(tmp_path / 'modello_b' / 'sub' / 'TR200.tif')]
+    assert scenario_names(paths) == ['modello_a_TR50', 'modello_b_TR50', 'modello_b_sub_TR200']
+
+
+def test_relative_paths(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert scenario_names([os.path.join('a', 'TR50.tif'), os.path.join('b', 'tr50.TIF')]) == ['a_TR50', 'b_tr50']
+
+
+def test_unresolvable_duplicates(tmp_path):
+    with pytest.raises(ValueError, match='a_b_TR50'):
+        scenario_names([str(tmp_path / 'a_b' / 'TR50.tif'), str(tmp_path / 'a' / 'b' / 'TR50.tif')])
+
+
+@pytest.mark.parametrize('argv, config', [
+    (['--incremental'], {}),
+    ([], {'ZONAL_ENGINE': 'mask'}),
+    ([], {'ZONAL_ENGINE': 'exact'}),
+])
+def test_unsupported_scenario_options(estimation, buildings_layer, depth_raster, argv, config):
+    code, _ = estimation(buildings_layer, depth_raster, '--scenarios', depth_raster, *argv, **config)
+    assert code == 1
+    code, _ = estimation(buildings_layer, depth_raster, '--temporal', *argv, **config)
+    assert code == 1
@@ -0,0 +1,177 @@
+import io
+import os
+
+import pytest
+
+from wd_transfer import (FolderIndex, LocalFolder, download_file, download_files, file_stem, folder_index,
+                         shapefile_parts, shapefile_sidecars)
+
+
+def make_folder(root, paths):
+    for path in paths:
+        full_path = root / path.lstrip('/')
+        full_path.parent.mkdir(parents=True, exist_ok=True)
+        full_path.write_bytes(path.encode())
+    return LocalFolder(str(root))
+
+
+@pytest.fixture
+def index(tmp_path):
+    folder = make_folder(tmp_path, [
+        '/202509231300/output/merged_PRE.tif',
+        '/202509231300/vettoriali/V_UVL_GPG.shp',
+        '/202509231300/vettoriali/V_UVL_GPG.dbf',
+        '/202509231300/vettoriali/V_UVL_GPG.shp.xml',
+        '/202509231300/vettoriali/zona.v2.shp',
+        '/202509231300/vettoriali/zona.v2.dbf',
+        '/202509231300/vettoriali/zona.shp',
+        '/archivio/V_UVL_GPG.shp',
+    ])
+    return FolderIndex(folder)
+
+
+@pytest.mark.parametrize('name, stem', [
+    ('V_UVL_GPG.shp', 'V_UVL_GPG'),
+    ('V_UVL_GPG.shp.xml', 'V_UVL_GPG'),
+    ('V_UVL_GPG.SHP.XML', 'V_UVL_GPG'),
+    ('zona.v2.shp', 'zona.v2'),
+    ('/a/b/zona.v2.dbf', 'zona.v2'),
+    ('a\\b\\merged_PRE.tif', 'merged_PRE'),
+    ('README', 'README'),
+])
+def test_file_stem(name, stem):
+    assert file_stem(name) == stem
+
+
+def test_exact(index):
+    assert index.exact('202509231300/output/merged_PRE.tif') == '/202509231300/output/merged_PRE.tif'
+    assert index.exact('/202509231300/OUTPUT/merged_pre.TIF') == '/202509231300/output/merged_PRE.tif'
+    assert index.exact('\\202509231300\\output\\merged_PRE.tif') == '/202509231300/output/merged_PRE.tif'
+    assert index.exact('output/merged_PRE.tif') is None
+    assert '/202509231300/vettoriali/zona.shp' in index
+    assert len(index) == 8
+
+
+def test_by_name(index):
+    assert index.by_name('v_uvl_gpg.SHP') == ['/202509231300/vettoriali/V_UVL_GPG.shp', '/archivio/V_UVL_GPG.shp']
+    assert index.by_name('missing.shp') == []
+
+
+def test_by_stem(index):
+    assert index.by_stem(file_stem('V_UVL_GPG.shp')) == [
+        '/202509231300/vettoriali/V_UVL_GPG.dbf',
+        '/202509231300/vettoriali/V_UVL_GPG.shp',
+        '/202509231300/vettoriali/V_UVL_GPG.shp.xml',
+        '/archivio/V_UVL_GPG.shp',
+    ]
+    assert index.by_stem(file_stem('zona.v2.shp')) == [
+        '/202509231300/vettoriali/zona.v2.dbf',
+        '/202509231300/vettoriali/zona.v2.shp',
+    ]
+    assert index.by_stem('zona') == ['/202509231300/vettoriali/zona.shp']
+
+
+def test_by_suffix(index):
+    assert index.by_suffix('output/merged_PRE.tif') == '/202509231300/output/merged_PRE.tif'
+    assert index.by_suffix('VETTORIALI/zona.shp') == '/202509231300/vettoriali/zona.shp'
+    assert index.by_suffix('ali/zona.shp') is None
+    assert index.by_suffix('archivio/V_UVL_GPG.shp') == '/archivio/V_UVL_GPG.shp'
+
+
+
+def test_shapefile_parts_same_directory(index):
+    assert shapefile_parts('V_UVL_GPG.shp', index) == [
+        '/202509231300/vettoriali/V_UVL_GPG.shp',
+        '/202509231300/vettoriali/V_UVL_GPG.dbf',
+        '/202509231300/vettoriali/V_UVL_GPG.shp.xml',
+    ]
+    assert shapefile_parts('archivio/v_uvl_gpg.shp', index) == ['/archivio/V_UVL_GPG.shp']
+    assert shapefile_parts('zona.v2.shp', index) == [
+        '/202509231300/vettoriali/zona.v2.shp',
+        '/202509231300/vettoriali/zona.v2.dbf',
+    ]
+    assert shapefile_parts('missing.shp', index) == []
+
+
+def test_folder_index_refresh(tmp_path):
+    folder = make_folder(tmp_path, ['/dati/zona.shp'])
+    index = folder_index(folder)
+    assert folder_index(folder) is index
+    make_folder(tmp_path, ['/dati/nuovo.tif'])
+    assert '/dati/nuovo.tif' not in index
+    assert '/dati/nuovo.tif' in folder_index(folder, refresh=True)
+
+
+def test_folder_index_ttl(tmp_path, monkeypatch):
+    folder = make_folder(tmp_path, ['/dati/zona.shp'])
+    index = folder_index(folder, ttl=None)
+    make_folder(tmp_path, ['/dati/nuovo.tif'])
+    assert '/dati/nuovo.tif' not in index
+    # un ttl diverso alla chiamata successiva sostituisce quello dell'indice esistente
+    assert folder_index(folder, ttl=60) is index and index.ttl == 60
+    monkeypatch.setattr(index, 'built', index.built - 61)
+    assert '/dati/nuovo.tif' in index
+
+
+def test_shapefile_parts_dedupes_names(tmp_path):
+    folder = make_folder(tmp_path, ['/dati/zona.shp', '/dati/zona.dbf', '/dati/ZONA.DBF'])
+    parts = shapefile_parts('dati/zona.shp', FolderIndex(folder))
+    assert parts[0] == '/dati/zona.shp'
+    assert len(parts) == 2 and parts[1].lower() == '/dati/zona.dbf'
+
+
+def test_shapefile_sidecars(index):
+    assert shapefile_sidecars('/202509231300/vettoriali/zona.v2.shp', index) == [
+        '/202509231300/vettoriali/zona.v2.dbf']
+
+
+def test_download_file_replaces_part(tmp_path, monkeypatch):
+    folder = make_folder(tmp_path / 'folder', ['/dati/depth.tif'])
+    local_path = str(tmp_path / 'depth.tif')
+    replaced = []
+    real_replace = os.replace
+
+    def replace(src, dst):
+        assert os.path.exists(src) and not os.path.exists(dst)
+        replaced.append((src, dst))
+        real_replace(src, dst)
+
+    monkeypatch.setattr(os, 'replace', replace)
+    n_bytes, _ = download_file(folder, '/dati/depth.tif', local_path, chunk_size=4)
+    assert replaced == [(local_path + '.part', local_path)]
+    assert n_bytes == len(b'/dati/depth.tif')
+    with open(local_path, 'rb') as f:
+        assert f.read() == b'/dati/depth.tif'
+
+
+class BrokenFolder(LocalFolder):
+    """Folder con trasferimento interrotto dopo il primo blocco"""
+
+    def get_download_stream(self, path):
+        class Stream(io.BytesIO):
+            def read(self, size=-1):
+                if self.tell():
+                    raise ConnectionError('connessione interrotta')
+                return super().read(size)
+        return Stream(b'x' * 64)
+
+
+def test_download_file_error_leaves_no_files(tmp_path):
+    folder = BrokenFolder(str(tmp_path))
+    local_path = str(tmp_path / 'depth.tif')
+    with pytest.raises(ConnectionError):
+        download_file(folder, '/depth.tif', local_path, chunk_size=8)
+    assert not os.path.exists(local_path)
+    assert not os.path.exists(local_path + '.part')
+    assert download_files(folder, ['/depth.tif'], str(tmp_path)) == [None]
+    assert os.listdir(tmp_path) == []
+
+
+def test_download_files_skips_repeated_names(tmp_path):
+    folder = make_folder(tmp_path / 'folder', ['/a/zona.dbf', '/b/zona.dbf', '/a/zona.shp'])
+    local_dir = tmp_path / 'local'
+    local_dir.mkdir()
+    local_paths = download_files(folder, ['/a/zona.shp', '/a/zona.dbf', '/b/zona.dbf'], str(local_dir))
+    assert local_paths == [str(local_dir / 'zona.shp'), str(local_dir / 'zona.dbf'), None]
+    assert (local_dir / 'zona.dbf').read_bytes() == b'/a/zona.dbf'
+    assert sorted(os.listdir(local_dir)) == ['zona.dbf', 'zona.shp']
@@ -0,0 +1,68 @@
+import glob
+import io
+import os
+import zipfile
+
+import geopandas as gpd
+import numpy as np
+import pytest
+
+import wd_estimation
+import wd_io
+from wd_cache import DiskCache, load_or_read_buildings
+from wd_io import archive_path, read_buildings, zip_vector_path
+
+
+@pytest.fixture(scope='module')
+def dbtr_zip(tmp_path_factory, buildings_layer):
+    """Consegna DBTR di prova: zip esterno con lo zip dei dati annidato (DBTR/dati.zip/V_UVL_GPG/V_UVL_GPG.shp)"""
+    inner = io.BytesIO()
+    with zipfile.ZipFile(inner, 'w') as archive:
+        archive.writestr('LEGGIMI.txt', 'consegna di prova')
+        for path in glob.glob(os.path.splitext(buildings_layer)[0] + '.*'):
+            archive.write(path, 'V_UVL_GPG/V_UVL_GPG' + os.path.splitext(path)[1])
+    path = str(tmp_path_factory.mktemp('zip') / 'downloadDBTR_312556.zip')
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('DBTR/dati.zip', inner.getvalue())
+    return path
+
+
+def test_zip_vector_path(dbtr_zip):
+    path = zip_vector_path(dbtr_zip)
+    assert path == f"/vsizip/{{/vsizip/{{{os.path.abspath(dbtr_zip)}}}/DBTR/dati.zip}}/V_UVL_GPG/V_UVL_GPG.shp"
+    assert zip_vector_path(path) == path
+    assert archive_path(path) == os.path.abspath(dbtr_zip)
+    with pytest.raises(FileNotFoundError, match='EDIFICI'):
+        zip_vector_path(dbtr_zip, layer='EDIFICI')
+
+
+def test_read_nested_zip(dbtr_zip, buildings_layer):
+    expected = read_buildings(buildings_layer, 'H_UVL')
+    vector = read_buildings(dbtr_zip, 'H_UVL')
+    assert list(vector.columns) == list(expected.columns)
+    np.testing.assert_array_equal(vector['FID'], expected['FID'])
+    assert vector.geometry.geom_equals_exact(expected.geometry, tolerance=0).all()
+    assert not os.path.exists(os.path.join(os.path.dirname(dbtr_zip), 'DBTR'))
+
+
+def test_layer_cache(dbtr_zip, tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path / 'vettoriali'))
+    first = load_or_read_buildings(dbtr_zip, 'H_UVL', cache)
+    # alla seconda lettura l'archivio non viene riaperto
+    monkeypatch.setattr(wd_io, 'zip_vector_path', lambda *args: pytest.fail("archivio riaperto"))
+    second = load_or_read_buildings(dbtr_zip, 'H_UVL', cache)
+    assert cache.hits == 1
+    assert list(second.columns) == list(first.columns)
+    assert second.geometry.geom_equals_exact(first.geometry, tolerance=0).all()
+
+
+def test_cached_run_does_not_reopen_zip(estimation, dbtr_zip, depth_raster, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'vettoriali')
+    code, output_path = estimation(dbtr_zip, depth_raster, VECTOR_CACHE_DIR=cache_dir)
+    assert code == 0
+    first = gpd.read_file(output_path)
+    monkeypatch.setattr(wd_io, 'zip_vector_path', lambda *args: pytest.fail("archivio riaperto"))
+    monkeypatch.setattr(wd_estimation, 'list_fields', lambda *args, **kwargs: pytest.fail("archivio riaperto"))
+    code, output_path = estimation(dbtr_zip, depth_raster, VECTOR_CACHE_DIR=cache_dir)
+    assert code == 0
+    np.testing.assert_allclose(gpd.read_file(output_path)['DEPTH_MEAN'], first['DEPTH_MEAN'])
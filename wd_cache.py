@@ -0,0 +1,589 @@
+"""
+CACHE SU DISCO PER ELABORAZIONI RIPETUTE
+Conserva tra un'esecuzione e l'altra i prodotti intermedi costosi (raster
+riproiettati, anelli esterni degli edifici, indici pixel, impronte bagnate,
+layer edifici estratti dagli archivi zip DBTR, ...) in una cartella di cache con
+indice JSON ed eliminazione LRU in base alla dimensione totale.
+
+Le chiavi sono calcolate dal contenuto dei file sorgente (checksum SHA-256)
+e dai parametri di elaborazione: un input modificato produce una nuova voce.
+
+I raster di profondità consegnati in layout a strisce, non compressi o senza
+overview vengono convertiti una volta in Cloud-Optimized GeoTIFF (cached_cog):
+le esecuzioni successive sullo stesso file usano il COG in cache.
+
+Anche gli input scaricati dai folder Dataiku/MinIO possono essere
+conservati (cached_download_files): la chiave è folder + percorso remoto +
+dimensione + data di modifica (o ETag), quindi un file riconsegnato viene
+riscaricato; i file in cache sono resi disponibili nella cartella di lavoro
+con un hardlink (symlink o copia se non possibile).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import stat
+import tempfile
+import time
+
+import geopandas as gpd
+import numpy as np
+import rasterio
+import rasterio.shutil
+from rasterio.crs import CRS
+from rasterio.dtypes import in_dtype_range
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import calculate_default_transform, Resampling
+
+from wd_engine import build_pixel_index, build_rings, grid_signature, reproject_raster, wet_footprint
+from wd_io import KEY_FIELDS, ZIP_LAYER, archive_path, is_zip, read_buildings
+from wd_transfer import DOWNLOAD_WORKERS, download_files, folder_id, format_size, remote_version
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'cache_index.json'
+CHUNK_SIZE = 8 * 1024 * 1024
+COG_BLOCKSIZE = 512
+
+
+def _remove_file(path):
+    """
+    Elimina un file, anche in sola lettura: su Windows os.remove fallisce sui
+    file senza permesso di scrittura (voci della cache input), che vengono
+    prima resi scrivibili
+    """
+    try:
+        os.remove(path)
+    except PermissionError:
+        os.chmod(path, stat.S_IREAD | stat.S_IWRITE)
+        os.remove(path)
+
+
+def make_key(*parts):
+    """Chiave di cache (SHA-256) dai parametri che identificano il prodotto"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """
+    Cache su disco con indice JSON ed eliminazione LRU per dimensione
+
+    Ogni voce è un file (o un gruppo di file con lo stesso prefisso) nella
+    cartella di cache; l'indice registra dimensione e ultimo accesso.
+
+    Parametri:
+    - cache_dir: cartella della cache (creata se non esiste)
+    - max_gb: dimensione massima complessiva in GB
+    """
+
+    def __init__(self, cache_dir, max_gb=20):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_gb * 1024 ** 3)
+        self.hits = 0
+        self.misses = 0
+        self.hit_bytes = 0   # byte serviti dalla cache (input scaricati)
+        self.miss_bytes = 0  # byte scaricati e memorizzati
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index_path = os.path.join(cache_dir, INDEX_FILE)
+        self._index = self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self._index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        index.setdefault('entries', {})
+        index.setdefault('checksums', {})
+        return index
+
+    def _save_index(self):
+        tmp_path = self._index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f, indent=1)
+        os.replace(tmp_path, self._index_path)
+
+    def path_for(self, key, suffix):
+        """Percorso del file di cache per la chiave"""
+        return os.path.join(self.cache_dir, f"{key}{suffix}")
+
+    def checksum(self, path):
+        """
+        SHA-256 del file sorgente, memorizzato nell'indice per (percorso, dimensione, data modifica)
+        così che un file invariato non venga riletto a ogni esecuzione
+        """
+        stat = os.stat(path)
+        memo_key = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+        cached = self._index['checksums'].get(memo_key)
+        if cached:
+            return cached
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        self._index['checksums'][memo_key] = digest.hexdigest()
+        self._save_index()
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Ritorna il percorso della voce se presente (aggiorna l'ultimo accesso), altrimenti None"""
+        entry = self._index['entries'].get(key)
+        if entry and all(os.path.exists(os.path.join(self.cache_dir, name)) for name in entry['files']):
+            entry['last_access'] = time.time()
+            self._save_index()
+            self.hits += 1
+            logger.info(f"Cache HIT: {entry['files'][0]} ({entry.get('description', '')})")
+            return os.path.join(self.cache_dir, entry['files'][0])
+
+        if entry:
+            # voce incompleta (file rimossi a mano): la scarta
+            del self._index['entries'][key]
+        self.misses += 1
+        logger.info(f"Cache MISS: {key[:12]}")
+        return None
+
+    def put(self, key, paths, description=''):
+        """
+        Registra una voce già scritta nella cartella di cache e applica l'eliminazione LRU
+
+        Parametri:
+        - key: chiave (da make_key)
+        - paths: percorso o lista di percorsi nella cartella di cache (il primo è il principale)
+        - description: testo libero per il log
+        """
+        if isinstance(paths, str):
+            paths = [paths]
+        names = [os.path.basename(p) for p in paths]
+        size = sum(os.path.getsize(os.path.join(self.cache_dir, name)) for name in names)
+        now = time.time()
+        self._index['entries'][key] = {
+            'files': names,
+            'size': size,
+            'created': now,
+            'last_access': now,
+            'description': description,
+        }
+        logger.info(f"Cache: memorizzato {names[0]} ({size / 1024 ** 2:.1f} MB) - {description}")
+        self.evict(keep=key)
+        self._save_index()
+        return os.path.join(self.cache_dir, names[0])
+
+    def evict(self, keep=None):
+        """Elimina le voci meno recenti finché la cache rientra nella dimensione massima"""
+        entries = self._index['entries']
+        total = sum(entry['size'] for entry in entries.values())
+        for key in sorted(entries, key=lambda k: entries[k]['last_access']):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            entry = entries[key]
+            try:
+                for name in entry['files']:
+                    file_path = os.path.join(self.cache_dir, name)
+                    if os.path.exists(file_path):
+                        _remove_file(file_path)
+            except OSError as e:
+                # file in uso (es. aperto da un'altra elaborazione): riprova alla prossima eliminazione
+                logger.warning(f"Cache: impossibile eliminare {entry['files'][0]}: {e}")
+                continue
+            total -= entry['size']
+            del entries[key]
+            logger.info(f"Cache: eliminato (LRU) {entry['files'][0]} ({entry['size'] / 1024 ** 2:.1f} MB)")
+
+    def summary(self):
+        """Riepilogo hit/miss per il log"""
+        if self.hit_bytes or self.miss_bytes:
+            return (f"hit {self.hits} ({format_size(self.hit_bytes)}), "
+                    f"miss {self.misses} ({format_size(self.miss_bytes)} scaricati)")
+        return f"hit {self.hits}, miss {self.misses}"
+
+
+def cached_reprojection(raster, dst_crs, cache, resampling=Resampling.bilinear):
+    """
+    Raster riproiettato dalla cache persistente (creato alla prima richiesta)
+
+    La chiave combina checksum del file sorgente, CRS di destinazione, metodo di
+    ricampionamento e risoluzione/griglia di destinazione. Il file in cache è un
+    Cloud-Optimized GeoTIFF a blocchi compresso.
+
+    Parametri:
+    - raster: rasterio dataset sorgente (file locale)
+    - dst_crs: CRS di destinazione
+    - cache: DiskCache
+    - resampling: metodo di ricampionamento
+
+    Ritorna:
+    - percorso del raster riproiettato in cache
+    """
+    transform, width, height = calculate_default_transform(
+        raster.crs, dst_crs, raster.width, raster.height, *raster.bounds)
+    dst_crs_wkt = CRS.from_user_input(dst_crs).to_wkt()
+    key = make_key('reprojection', cache.checksum(raster.name), dst_crs_wkt,
+                   resampling.name, transform.a, transform.e, width, height)
+
+    cached_path = cache.get(key)
+    if cached_path:
+        return cached_path
+
+    path = cache.path_for(key, '.tif')
+    tmp_path = cache.path_for(key, '.tmp.tif')
+    grid_path = cache.path_for(key, '.grid.tif')
+    start = time.time()
+    # riproiezione sull'intera griglia (stessi valori della copia completa), poi conversione COG senza perdita
+    try:
+        reproject_raster(raster, dst_crs, grid_path, resampling=resampling)
+        rasterio.shutil.copy(grid_path, tmp_path, driver='COG', COMPRESS='DEFLATE', BLOCKSIZE=512,
+                             PREDICTOR='YES', BIGTIFF='IF_SAFER')
+    finally:
+        if os.path.exists(grid_path):
+            os.remove(grid_path)
+    os.replace(tmp_path, path)
+    logger.info(f"Raster riproiettato in cache in {time.time() - start:.1f}s")
+    return cache.put(key, path, description=f"{os.path.basename(raster.name)} -> {dst_crs} ({resampling.name})")
+
+
+def cog_problems(raster):
+    """
+    Differenze del raster dal layout Cloud-Optimized GeoTIFF usato dall'analisi
+
+    Ritorna:
+    - lista di descrizioni (vuota se il raster è già a blocchi, compresso,
+      con overview interne e nodata dichiarato)
+    """
+    problems = []
+    block_h, block_w = raster.block_shapes[0]
+    if block_w >= raster.width and raster.height > block_h:
+        problems.append(f"layout a strisce ({block_w}x{block_h})")
+    if raster.compression is None:
+        problems.append("non compresso")
+    if max(raster.width, raster.height) > COG_BLOCKSIZE and not raster.overviews(1):
+        problems.append("senza overview")
+    if raster.nodata is None:
+        problems.append("nodata non dichiarato")
+    return problems
+
+
+def cached_cog(raster_path, cache, nodata=None):
+    """
+    Raster di lavoro in formato COG (convertito alla prima richiesta e conservato in cache)
+
+    Il raster viene validato (CRS presente, nodata compatibile con il tipo dei
+    dati) e, se non è già un COG, riscritto a blocchi di COG_BLOCKSIZE pixel
+    con compressione DEFLATE, overview interne (media) e nodata dichiarato.
+    I valori dei pixel non cambiano. La chiave combina checksum del file
+    sorgente e nodata.
+
+    Parametri:
+    - raster_path: raster sorgente (file locale)
+    - cache: DiskCache
+    - nodata: valore da dichiarare se il raster sorgente non ha nodata (None = nessuno)
+
+    Ritorna:
+    - percorso del raster da usare (il sorgente se è già un COG con nodata)
+    """
+    with rasterio.open(raster_path) as src:
+        if src.crs is None:
+            raise ValueError(f"Raster senza sistema di riferimento: {raster_path}")
+        target_nodata = src.nodata if src.nodata is not None else nodata
+        if target_nodata is not None and not all(in_dtype_range(target_nodata, dtype) for dtype in src.dtypes):
+            raise ValueError(f"Nodata {target_nodata} non rappresentabile nel tipo {src.dtypes[0]}: {raster_path}")
+        problems = cog_problems(src)
+        if src.nodata is None and target_nodata is None:
+            logger.warning(f"Raster senza nodata: tutti i pixel sono considerati validi ({raster_path})")
+            problems.remove("nodata non dichiarato")
+        if not problems:
+            logger.info(f"Raster già in formato COG: {os.path.basename(raster_path)}")
+            return raster_path
+        logger.info(f"Ingest raster {os.path.basename(raster_path)}: {', '.join(problems)}")
+
+        key = make_key('cog', cache.checksum(raster_path), repr(target_nodata), COG_BLOCKSIZE)
+        cached_path = cache.get(key)
+        if cached_path:
+            return cached_path
+
+        path = cache.path_for(key, '.tif')
+        tmp_path = cache.path_for(key, '.tmp.tif')
+        start = time.time()
+        # VRT sulla stessa griglia: assegna il nodata senza ricampionare i pixel
+        with WarpedVRT(src, crs=src.crs, transform=src.transform, width=src.width, height=src.height,
+                       src_nodata=target_nodata, nodata=target_nodata) as vrt:
+            rasterio.shutil.copy(vrt, tmp_path, driver='COG', COMPRESS='DEFLATE', BLOCKSIZE=COG_BLOCKSIZE,
+                                 PREDICTOR='YES', OVERVIEWS='AUTO', OVERVIEW_RESAMPLING='AVERAGE',
+                                 BIGTIFF='IF_SAFER')
+    os.replace(tmp_path, path)
+    logger.info(f"Raster convertito in COG in {time.time() - start:.1f}s "
+                f"({os.path.getsize(raster_path) / 1024 ** 2:.1f} MB -> {os.path.getsize(path) / 1024 ** 2:.1f} MB)")
+    return cache.put(key, path, description=f"COG di {os.path.basename(raster_path)}")
+
+
+def vector_checksum(vector_path, cache):
+    """
+    Checksum del contenuto geometrico del vettoriale edifici
+
+    Per gli shapefile combina .shp (geometrie, nell'ordine dei record) e .prj;
+    gli attributi (.dbf) non influiscono sugli anelli.
+    """
+    if is_zip(vector_path):
+        # archivio DBTR: checksum dell'archivio e percorso del layer al suo interno
+        archive = archive_path(vector_path)
+        return make_key(cache.checksum(archive), vector_path[len(archive):] if vector_path != archive else '')
+    stem, ext = os.path.splitext(vector_path)
+    parts = [vector_path]
+    if ext.lower() == '.shp':
+        parts += [stem + sidecar for sidecar in ('.prj', '.PRJ') if os.path.exists(stem + sidecar)][:1]
+    return make_key(*(cache.checksum(part) for part in parts))
+
+
+def load_or_read_buildings(vector_path, height_field, cache, key_fields=KEY_FIELDS, zip_layer=ZIP_LAYER):
+    """
+    Vettoriale edifici letto da un archivio zip DBTR, con cache del risultato (GeoParquet)
+
+    La chiave combina il checksum dell'archivio, il layer e i campi letti:
+    alle esecuzioni successive sulla stessa consegna il layer non viene
+    riletto dallo zip. Gli altri formati sono letti direttamente.
+
+    Ritorna:
+    - GeoDataFrame come wd_io.read_buildings()
+    """
+    if not is_zip(vector_path):
+        return read_buildings(vector_path, height_field, key_fields=key_fields)
+
+    key = make_key('buildings', vector_checksum(vector_path, cache), zip_layer, height_field, *key_fields)
+    cached_path = cache.get(key)
+    if cached_path:
+        return gpd.read_parquet(cached_path)
+
+    start = time.time()
+    vector = read_buildings(vector_path, height_field, key_fields=key_fields, zip_layer=zip_layer)
+    path = cache.path_for(key, '.parquet')
+    tmp_path = cache.path_for(key, '.tmp.parquet')
+    vector.to_parquet(tmp_path, index=False, geometry_encoding='WKB')
+    os.replace(tmp_path, path)
+    logger.info(f"Layer {zip_layer} letto dall'archivio in {time.time() - start:.1f}s")
+    cache.put(key, path, description=f"{zip_layer} da {os.path.basename(archive_path(vector_path))} "
+                                     f"({len(vector)} edifici)")
+    return vector
+
+
+def load_or_build_rings(vector_path, vector, buffer_distance, cache):
+    """
+    Anelli esterni degli edifici dall'archivio precalcolato (GeoParquet, geometria WKB)
+
+    La chiave combina il checksum del vettoriale sorgente, il CRS del vettoriale
+    (dopo l'eventuale riproiezione), la distanza di buffer e il numero di edifici.
+    Se l'archivio non contiene la voce, gli anelli vengono calcolati e memorizzati.
+
+    Parametri:
+    - vector_path: percorso del vettoriale sorgente
+    - vector: GeoDataFrame edifici (già nel CRS di elaborazione)
+    - buffer_distance: distanza buffer nelle unità del CRS
+    - cache: DiskCache dell'archivio anelli
+
+    Ritorna:
+    - numpy array di anelli (stesso ordine di vector)
+    """
+    crs_wkt = vector.crs.to_wkt() if vector.crs is not None else ''
+    key = make_key('rings', vector_checksum(vector_path, cache), crs_wkt,
+                   repr(float(buffer_distance)), len(vector))
+
+    cached_path = cache.get(key)
+    if cached_path:
+        return np.asarray(gpd.read_parquet(cached_path).geometry.values, dtype=object)
+
+    start = time.time()
+    rings = build_rings(vector.geometry, buffer_distance)
+    path = cache.path_for(key, '.parquet')
+    tmp_path = cache.path_for(key, '.tmp.parquet')
+    gpd.GeoDataFrame(geometry=gpd.GeoSeries(rings, crs=vector.crs)).to_parquet(
+        tmp_path, index=False, geometry_encoding='WKB')
+    os.replace(tmp_path, path)
+    logger.info(f"Anelli calcolati in {time.time() - start:.1f}s")
+    cache.put(key, path, description=f"anelli {os.path.basename(vector_path)} "
+                                     f"(buffer {buffer_distance}, {len(vector)} edifici)")
+    return rings
+
+
+def load_or_build_pixel_index(vector_path, vector, raster, buffer_distance, cache, rings=None,
+                              tile_memory_mb=None):
+    """
+    Indice pixel edificio -> offset (CSR) dall'archivio, come file .npy memory-mapped
+
+    La chiave combina il checksum del vettoriale sorgente, CRS del vettoriale,
+    distanza di buffer, numero di edifici e griglia del raster (CRS, transform,
+    dimensioni): tutti gli scenari sulla stessa griglia condividono l'indice.
+
+    Parametri:
+    - vector_path: percorso del vettoriale sorgente
+    - vector: GeoDataFrame edifici (già nel CRS di elaborazione)
+    - raster: rasterio dataset (serve solo la griglia)
+    - buffer_distance: distanza buffer nelle unità del CRS
+    - cache: DiskCache dell'archivio indici
+    - rings: anelli già calcolati (None = calcolati solo se l'indice manca)
+    - tile_memory_mb: budget memoria per tile nella costruzione dell'indice
+
+    Ritorna:
+    - tuple (indptr, indices) di array (memory-mapped se letti dall'archivio)
+    """
+    crs_wkt = vector.crs.to_wkt() if vector.crs is not None else ''
+    key = make_key('pixel_index', vector_checksum(vector_path, cache), crs_wkt,
+                   repr(float(buffer_distance)), len(vector), *grid_signature(raster))
+    indptr_path = cache.path_for(key, '.indptr.npy')
+    indices_path = cache.path_for(key, '.indices.npy')
+
+    if cache.get(key):
+        return np.load(indptr_path, mmap_mode='r'), np.load(indices_path, mmap_mode='r')
+
+    start = time.time()
+    if rings is None:
+        rings = build_rings(vector.geometry, buffer_distance)
+    indptr, indices = build_pixel_index(raster, rings, tile_memory_mb=tile_memory_mb)
+    for path, array in ((indptr_path, indptr), (indices_path, indices)):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+    logger.info(f"Indice pixel calcolato in {time.time() - start:.1f}s ({len(indices)} pixel)")
+    cache.put(key, [indptr_path, indices_path],
+              description=f"indice pixel {os.path.basename(vector_path)} "
+                          f"({raster.width}x{raster.height}, {len(vector)} edifici)")
+    return indptr, indices
+
+
+def cached_wet_footprint(raster, cell_size, cache, band=1):
+    """
+    Impronta bagnata del raster dalla cache (calcolata alla prima richiesta)
+
+    La chiave combina il checksum del file raster, la griglia, la dimensione
+    della cella e la banda.
+
+    Ritorna:
+    - array uint8 dell'impronta (vedi wd_engine.wet_footprint)
+    """
+    key = make_key('wet_footprint', cache.checksum(raster.name), *grid_signature(raster), cell_size, band)
+
+    cached_path = cache.get(key)
+    if cached_path:
+        return np.load(cached_path)
+
+    start = time.time()
+    footprint = wet_footprint(raster, cell_size=cell_size, band=band)
+    path = cache.path_for(key, '.npy')
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, footprint)
+    os.replace(tmp_path, path)
+    logger.info(f"Impronta bagnata calcolata in {time.time() - start:.1f}s")
+    cache.put(key, path, description=f"impronta {os.path.basename(raster.name)} (celle {cell_size} px)")
+    return footprint
+
+
+def materialize(cached_path, local_path):
+    """
+    Rende disponibile il file di cache in local_path: hardlink, symlink se la
+    cache è su un altro filesystem, copia come ultima possibilità
+
+    I file in cache sono in sola lettura: con hardlink e symlink la copia di
+    lavoro è lo stesso file e non deve essere modificata.
+
+    Ritorna:
+    - modalità usata ('hardlink', 'symlink' o 'copia')
+    """
+    if os.path.lexists(local_path):
+        _remove_file(local_path)
+    try:
+        os.link(cached_path, local_path)
+        return 'hardlink'
+    except OSError:
+        pass
+    try:
+        os.symlink(os.path.abspath(cached_path), local_path)
+        return 'symlink'
+    except OSError:
+        pass
+    shutil.copyfile(cached_path, local_path)
+    return 'copia'
+
+
+def cached_download_files(folder_obj, remote_paths, local_dir, cache=None, workers=DOWNLOAD_WORKERS):
+    """
+    Scarica i file del folder nella cartella locale passando dalla cache degli input
+
+    La versione di ciascun file è letta da get_path_details (nessun
+    download): i file già in cache sono materializzati senza trasferimento,
+    gli altri scaricati in parallelo nella cartella di cache e poi
+    materializzati. I file senza dettagli di versione sono scaricati
+    direttamente. I file usati nell'esecuzione sono i più recenti per
+    l'eliminazione LRU.
+
+    Parametri:
+    - folder_obj: dataiku.Folder o LocalFolder
+    - remote_paths: percorsi nel folder
+    - local_dir: cartella di lavoro (stesso nome file del percorso remoto)
+    - cache: DiskCache degli input (None = download diretto, come download_files)
+    - workers: thread di download concorrenti
+
+    Ritorna:
+    - lista dei percorsi locali nello stesso ordine (None per i file non scaricati)
+    """
+    if cache is None:
+        return download_files(folder_obj, remote_paths, local_dir, workers=workers)
+
+    source = folder_id(folder_obj)
+    local_paths = [None] * len(remote_paths)
+    keys = [None] * len(remote_paths)
+    to_download = []
+    hits = hit_bytes = 0
+    modes = set()
+    for i, remote_path in enumerate(remote_paths):
+        local_path = os.path.join(local_dir, os.path.basename(remote_path))
+        version = remote_version(folder_obj, remote_path)
+        if version is not None:
+            keys[i] = make_key('input', source, remote_path.replace('\\', '/').lstrip('/'), *version)
+            cached_path = cache.get(keys[i])
+            if cached_path:
+                modes.add(materialize(cached_path, local_path))
+                local_paths[i] = local_path
+                hits += 1
+                hit_bytes += version[0]
+                continue
+        to_download.append(i)
+
+    miss_bytes = 0
+    if to_download:
+        # download nella cartella di cache: lo spostamento nella voce definitiva è atomico
+        staging_dir = tempfile.mkdtemp(prefix='.download_', dir=cache.cache_dir)
+        try:
+            fetched = download_files(folder_obj, [remote_paths[i] for i in to_download], staging_dir,
+                                     workers=workers)
+            for i, staged_path in zip(to_download, fetched):
+                if staged_path is None:
+                    continue
+                local_path = os.path.join(local_dir, os.path.basename(remote_paths[i]))
+                if keys[i] is None:
+                    shutil.move(staged_path, local_path)
+                else:
+                    name = os.path.basename(remote_paths[i])
+                    cached_path = cache.path_for(keys[i], name[name.find('.'):] if '.' in name else '')
+                    os.replace(staged_path, cached_path)
+                    os.chmod(cached_path, 0o444)
+                    miss_bytes += os.path.getsize(cached_path)
+                    cache.put(keys[i], cached_path, description=remote_paths[i])
+                    modes.add(materialize(cached_path, local_path))
+                local_paths[i] = local_path
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    cache.hit_bytes += hit_bytes
+    cache.miss_bytes += miss_bytes
+    logger.info(f"Cache input: {hits} hit ({format_size(hit_bytes)}), {len(to_download)} miss "
+                f"({format_size(miss_bytes)} scaricati)"
+                + (f", file di lavoro via {'/'.join(sorted(modes))}" if modes else ""))
+    return local_paths
@@ -0,0 +1,1132 @@
+"""
+MOTORE ZONALE VETTORIALE - ANELLI ESTERNI EDIFICI
+Calcola in un'unica passata le statistiche di profondità dell'acqua nei pixel
+esterni al perimetro di tutti gli edifici, in sostituzione della chiamata
+rasterio.mask.mask eseguita per ogni singolo edificio.
+
+Metodo: gli anelli (buffer - poligono) vengono rasterizzati in griglie di
+etichette (ID edificio), una per ogni "strato" di anelli che non si toccano,
+e le statistiche media/min/max/conteggio sono calcolate con riduzioni
+raggruppate NumPy (bincount / ufunc.reduceat).
+
+Per raster più grandi della RAM è disponibile la modalità a tile: il raster
+viene suddiviso in tile allineati ai blocchi interni, ogni tile è letto una
+sola volta e le statistiche degli edifici a cavallo dei bordi vengono unite
+negli accumulatori.
+
+La modalità multi-processo suddivide gli edifici in partizioni spaziali
+compatte; ogni processo apre il raster una sola volta in sola lettura.
+
+Per l'elaborazione per edificio sono disponibili l'ordinamento lungo una
+curva di riempimento (Hilbert / Z-order) e un contatore delle letture
+effettive eseguite da GDAL sul file raster.
+
+La riproiezione del raster può essere limitata al riquadro degli edifici
+(reproject_raster): una sola riproiezione su griglia fissa, letta poi da
+tutte le modalità.
+
+Per più scenari sulla stessa griglia raster è disponibile l'indice pixel:
+per ogni edificio gli offset (riga * larghezza + colonna) dei pixel del suo
+anello in formato CSR, calcolato una volta sola; le statistiche diventano
+semplici letture indicizzate NumPy, senza operazioni geometriche.
+
+Per stack temporali (GeoTIFF multi-banda, NetCDF) le bande sono lette una
+alla volta e per ogni edificio sono aggiornati gli aggregati progressivi
+(picco, istante del picco, ore sopra soglia).
+
+Il motore a copertura esatta pesa ogni pixel toccato dall'anello con la sua
+frazione di area coperta (calcolo analitico vettoriale sui lati dei poligoni),
+per medie stabili anche con edifici piccoli su griglie grossolane.
+
+L'impronta bagnata (celle a bassa risoluzione con almeno un pixel non nullo)
+permette di saltare il campionamento degli edifici in aree asciutte o nodata.
+
+I checksum per tile dei valori raster permettono di individuare le aree
+modificate tra due consegne dello stesso raster (esecuzione incrementale).
+
+I raster Cloud-Optimized GeoTIFF possono essere letti direttamente da object
+storage S3/MinIO (s3://bucket/percorso.tif) con richieste HTTP range: con la
+modalità a tile vengono trasferiti solo i blocchi interni sotto gli anelli.
+"""
+
+import hashlib
+import logging
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import rasterio
+import rasterio.windows
+import shapely
+from rasterio.features import rasterize
+from rasterio.warp import calculate_default_transform, reproject, Resampling
+from rasterio.windows import Window, from_bounds
+
+logger = logging.getLogger(__name__)
+
+
+def build_rings(geometries, buffer_distance):
+    """
+    Crea gli anelli esterni (buffer - poligono) di tutti gli edifici
+
+    Parametri:
+    - geometries: GeoSeries o array di poligoni (edifici)
+    - buffer_distance: distanza buffer nelle unità del CRS
+
+    Ritorna:
+    - numpy array di geometrie shapely (anelli), stesso ordine dell'input
+    """
+    geoms = np.asarray(getattr(geometries, 'values', geometries), dtype=object)
+    # quad_segs=16 come geom.buffer() usato dalla versione per edificio
+    external_buffer = shapely.buffer(geoms, buffer_distance, quad_segs=16)
+    return shapely.difference(external_buffer, geoms)
+
+
+def assign_ring_layers(rings):
+    """
+    Suddivide gli anelli in strati privi di sovrapposizioni (colorazione greedy)
+
+    Due anelli che si intersecano non possono condividere la stessa griglia
+    di etichette, altrimenti un pixel comune verrebbe assegnato a un solo edificio.
+
+    Ritorna:
+    - numpy array int con l'indice di strato di ciascun anello (-1 = anello vuoto)
+    """
+    n = len(rings)
+    layers = np.full(n, -1, dtype=np.int32)
+    valid_idx = np.flatnonzero(~(shapely.is_missing(rings) | shapely.is_empty(rings)))
+    if valid_idx.size == 0:
+        return layers
+
+    valid_rings = rings[valid_idx]
+    tree = shapely.STRtree(valid_rings)
+    left, right = tree.query(valid_rings, predicate='intersects')
+    pairs = left != right
+    left, right = left[pairs], right[pairs]
+    order = np.argsort(left, kind='stable')
+    left, right = left[order], right[order]
+    starts = np.searchsorted(left, np.arange(len(valid_rings) + 1))
+
+    local_layers = np.full(len(valid_rings), -1, dtype=np.int32)
+    for i in range(len(valid_rings)):
+        neighbours = local_layers[right[starts[i]:starts[i + 1]]]
+        used = set(neighbours[neighbours >= 0].tolist())
+        layer = 0
+        while layer in used:
+            layer += 1
+        local_layers[i] = layer
+
+    layers[valid_idx] = local_layers
+    return layers
+
+
+def empty_ring_stats(n, weighted=False):
+    """Crea gli accumulatori vuoti per n edifici (weighted: conteggio come somma dei pesi)"""
+    return {
+        'count': np.zeros(n, dtype=np.float64 if weighted else np.int64),
+        'sum': np.zeros(n, dtype=np.float64),
+        'min': np.full(n, np.nan, dtype=np.float64),
+        'max': np.full(n, np.nan, dtype=np.float64),
+    }
+
+
+def accumulate_ring_stats(stats, labels, values, weights=None):
+    """
+    Aggiorna gli accumulatori con una riduzione raggruppata per etichetta
+
+    Parametri:
+    - stats: dizionario creato da empty_ring_stats()
+    - labels: array 1D di indici edificio (0..n-1)
+    - values: array 1D dei valori pixel corrispondenti (già privi di nodata)
+    - weights: frazioni di copertura dei pixel (None = peso unitario);
+      richiede accumulatori creati con empty_ring_stats(n, weighted=True)
+    """
+    if labels.size == 0:
+        return stats
+
+    n = len(stats['count'])
+    values = values.astype(np.float64, copy=False)
+    if weights is None:
+        stats['count'] += np.bincount(labels, minlength=n)
+        stats['sum'] += np.bincount(labels, weights=values, minlength=n)
+    else:
+        stats['count'] += np.bincount(labels, weights=weights, minlength=n)
+        stats['sum'] += np.bincount(labels, weights=weights * values, minlength=n)
+
+    # min/max: ordina per etichetta e riduce ogni gruppo contiguo
+    order = np.argsort(labels, kind='stable')
+    sorted_labels = labels[order]
+    sorted_values = values[order]
+    group_ids, group_starts = np.unique(sorted_labels, return_index=True)
+    stats['min'][group_ids] = np.fmin(stats['min'][group_ids], np.minimum.reduceat(sorted_values, group_starts))
+    stats['max'][group_ids] = np.fmax(stats['max'][group_ids], np.maximum.reduceat(sorted_values, group_starts))
+    return stats
+
+
+def finalize_ring_stats(stats):
+    """Aggiunge la media e azzera le statistiche degli edifici senza pixel validi"""
+    has_pixels = stats['count'] > 0
+    stats['mean'] = np.zeros_like(stats['sum'])
+    stats['mean'][has_pixels] = stats['sum'][has_pixels] / stats['count'][has_pixels]
+    stats['min'][~has_pixels] = 0.0
+    stats['max'][~has_pixels] = 0.0
+    return stats
+
+
+def valid_pixel_mask(data, nodata):
+    """Maschera dei pixel validi (esclude nodata e NaN)"""
+    valid = np.ones(data.shape, dtype=bool)
+    if nodata is not None and not np.isnan(nodata):
+        valid &= data != nodata
+    if np.issubdtype(data.dtype, np.floating):
+        valid &= ~np.isnan(data)
+    return valid
+
+
+def rings_window(raster, rings):
+    """
+    Finestra raster (allineata ai pixel) che copre tutti gli anelli
+
+    Ritorna None se gli anelli non si sovrappongono al raster.
+    """
+    bounds = shapely.bounds(rings)
+    bounds = bounds[~np.isnan(bounds).any(axis=1)]
+    if bounds.size == 0:
+        return None
+    minx, miny = bounds[:, 0].min(), bounds[:, 1].min()
+    maxx, maxy = bounds[:, 2].max(), bounds[:, 3].max()
+    window = from_bounds(minx, miny, maxx, maxy, transform=raster.transform)
+    window = window.round_offsets(op='floor').round_lengths(op='ceil')
+    # margine di un pixel per i bordi arrotondati
+    window = Window(window.col_off - 1, window.row_off - 1, window.width + 2, window.height + 2)
+    full = Window(0, 0, raster.width, raster.height)
+    try:
+        return window.intersection(full)
+    except Exception:
+        return None
+
+
+def sample_window(raster, rings, layers, window, stats, band=1, ids=None):
+    """
+    Legge una finestra raster una sola volta e accumula le statistiche
+    di tutti gli anelli che vi ricadono
+
+    Parametri:
+    - raster: rasterio dataset con profondità acqua
+    - rings: array di anelli (indice = posizione edificio)
+    - layers: strato di ciascun anello (da assign_ring_layers)
+    - window: rasterio Window da leggere
+    - stats: accumulatori (da empty_ring_stats)
+    - ids: posizioni degli anelli da considerare (None = tutti)
+    """
+    if window is None or window.width <= 0 or window.height <= 0:
+        return stats
+    if ids is None:
+        ids = np.arange(len(rings))
+    ids = ids[layers[ids] >= 0]
+    if ids.size == 0:
+        return stats
+
+    data = raster.read(band, window=window)
+    valid = valid_pixel_mask(data, raster.nodata)
+
+    for labels in layer_label_grids(rings, layers, ids, data.shape, raster.window_transform(window)):
+        selected = (labels > 0) & valid
+        accumulate_ring_stats(stats, labels[selected] - 1, data[selected])
+
+    return stats
+
+
+def layer_label_grids(rings, layers, ids, shape, transform):
+    """
+    Griglie di etichette (posizione edificio + 1, 0 = nessun anello),
+    una per ciascuno strato degli anelli selezionati
+    """
+    for layer in np.unique(layers[ids]):
+        layer_ids = ids[layers[ids] == layer]
+        yield rasterize(
+            ((rings[i], int(i) + 1) for i in layer_ids),
+            out_shape=shape,
+            transform=transform,
+            fill=0,
+            all_touched=False,
+            dtype='int32')
+
+
+def plan_tiles(raster, tile_memory_mb, band=1):
+    """
+    Dimensione dei tile allineata ai blocchi interni del raster
+
+    Il budget copre i valori del tile, la griglia di etichette (int32)
+    e la maschera dei pixel validi.
+
+    Ritorna:
+    - tuple (tile_height, tile_width) in pixel
+    """
+    block_h, block_w = raster.block_shapes[band - 1]
+    bytes_per_pixel = np.dtype(raster.dtypes[band - 1]).itemsize + 4 + 2
+    max_pixels = max(int(tile_memory_mb * 1024 * 1024 // bytes_per_pixel), block_h * block_w)
+
+    if block_w >= raster.width:
+        # layout a strisce: tile a larghezza piena
+        tile_w = raster.width
+    else:
+        tile_w = min(raster.width, block_w * max(1, int(math.sqrt(max_pixels)) // block_w))
+    tile_h = min(raster.height, block_h * max(1, max_pixels // (tile_w * block_h)))
+    return tile_h, tile_w
+
+
+def assign_rings_to_tiles(raster, rings, tile_shape):
+    """
+    Assegna ciascun anello ai tile intersecati dal suo bounding box
+
+    Ritorna:
+    - dizionario {(tile_row, tile_col): array posizioni anelli}
+    """
+    tile_h, tile_w = tile_shape
+    bounds = shapely.bounds(rings)
+    has_bounds = ~np.isnan(bounds).any(axis=1)
+    ids = np.flatnonzero(has_bounds)
+    if ids.size == 0:
+        return {}
+
+    inv = ~raster.transform
+    cols_a, rows_a = inv * (bounds[ids, 0], bounds[ids, 3])
+    cols_b, rows_b = inv * (bounds[ids, 2], bounds[ids, 1])
+    col0 = np.floor(np.minimum(cols_a, cols_b)).astype(np.int64) - 1
+    col1 = np.ceil(np.maximum(cols_a, cols_b)).astype(np.int64) + 1
+    row0 = np.floor(np.minimum(rows_a, rows_b)).astype(np.int64) - 1
+    row1 = np.ceil(np.maximum(rows_a, rows_b)).astype(np.int64) + 1
+
+    # scarta anelli fuori dal raster e limita agli indici dei tile esistenti
+    inside = (col1 > 0) & (row1 > 0) & (col0 < raster.width) & (row0 < raster.height)
+    ids, col0, col1, row0, row1 = ids[inside], col0[inside], col1[inside], row0[inside], row1[inside]
+    tc0 = np.clip(col0, 0, raster.width - 1) // tile_w
+    tc1 = np.clip(col1, 0, raster.width - 1) // tile_w
+    tr0 = np.clip(row0, 0, raster.height - 1) // tile_h
+    tr1 = np.clip(row1, 0, raster.height - 1) // tile_h
+
+    tiles = {}
+    for i, r0, r1, c0, c1 in zip(ids, tr0, tr1, tc0, tc1):
+        for tr in range(r0, r1 + 1):
+            for tc in range(c0, c1 + 1):
+                tiles.setdefault((int(tr), int(tc)), []).append(i)
+    return {key: np.asarray(val, dtype=np.int64) for key, val in tiles.items()}
+
+
+def tile_window(raster, tile_key, tile_shape):
+    """Finestra raster del tile (tile_row, tile_col)"""
+    tile_h, tile_w = tile_shape
+    tr, tc = tile_key
+    row_off, col_off = tr * tile_h, tc * tile_w
+    return Window(col_off, row_off,
+                  min(tile_w, raster.width - col_off),
+                  min(tile_h, raster.height - row_off))
+
+
+def zonal_ring_stats(raster, rings, band=1, tile_memory_mb=None):
+    """
+    Statistiche dei pixel esterni al perimetro per tutti gli edifici
+
+    Equivalente a chiamare get_external_pixels() per ogni edificio e calcolarne
+    media/min/max, ma con una sola lettura raster e una rasterizzazione per strato.
+    Sono contati solo i pixel dell'anello: su un raster senza nodata
+    get_external_pixels conta anche lo 0 con cui rasterio.mask riempie il
+    ritaglio fuori dall'anello (edificio compreso), quindi conteggi e medie
+    differiscono; con nodata i risultati coincidono.
+
+    Parametri:
+    - raster: rasterio dataset con profondità acqua
+    - rings: array di anelli (da build_rings)
+    - band: banda raster da campionare
+    - tile_memory_mb: budget memoria per tile in MB (None = finestra unica sugli anelli)
+
+    Ritorna:
+    - dizionario di array (uno per edificio): count, sum, mean, min, max
+    """
+    stats = empty_ring_stats(len(rings))
+    layers = assign_ring_layers(rings)
+
+    windows = ring_windows(raster, rings, layers, band=band, tile_memory_mb=tile_memory_mb)
+    if tile_memory_mb is not None:
+        tile_h, tile_w = plan_tiles(raster, tile_memory_mb, band=band)
+        logger.info(f"Modalità a tile: {len(windows)} tile da {tile_w}x{tile_h} pixel "
+                    f"(budget {tile_memory_mb} MB)")
+    # ordine riga/colonna: letture sequenziali sul file
+    for window, ids in windows:
+        sample_window(raster, rings, layers, window, stats, band=band, ids=ids)
+    return finalize_ring_stats(stats)
+
+
+def ring_windows(raster, rings, layers, band=1, tile_memory_mb=None):
+    """
+    Finestre raster da elaborare con gli anelli che vi ricadono
+
+    Ritorna:
+    - lista di tuple (window, posizioni anelli): finestra unica sugli anelli
+      oppure tile allineati ai blocchi (in ordine riga/colonna)
+    """
+    if tile_memory_mb is None:
+        window = rings_window(raster, rings[layers >= 0])
+        return [(window, np.arange(len(rings)))] if window is not None else []
+
+    tile_shape = plan_tiles(raster, tile_memory_mb, band=band)
+    tiles = assign_rings_to_tiles(raster, rings, tile_shape)
+    return [(tile_window(raster, key, tile_shape), tiles[key]) for key in sorted(tiles)]
+
+
+# Frazione di copertura minima perché un pixel entri in min/max (scarta residui numerici)
+COVERAGE_EPSILON = 1e-9
+# Anelli elaborati per blocco nel calcolo delle coperture (limita la memoria delle griglie)
+COVERAGE_CHUNK = 20000
+
+
+def ring_coverage(rings, ids, transform):
+    """
+    Frazioni di copertura esatte degli anelli sui pixel della griglia
+
+    Per ogni cella la frazione è area(anello ∩ pixel) / area pixel, calcolata
+    analiticamente dai lati dei poligoni senza intersezioni geometriche:
+    i lati vengono spezzati sulle linee della griglia e ogni segmento
+    contribuisce -∫ clamp(v - riga, 0, 1) du alla cella che lo contiene e
+    -Δu alle celle della stessa colonna sopra di esso (somma cumulata per
+    colonna sul bounding box dell'anello). Fori e multipoligoni sono gestiti
+    dall'orientamento degli anelli lineari.
+
+    Parametri:
+    - rings: array di anelli (indice = posizione edificio)
+    - ids: posizioni degli anelli da considerare
+    - transform: trasformazione affine della griglia (senza rotazione)
+
+    Ritorna:
+    - tuple (owners, rows, cols, weights): posizione edificio, riga e colonna
+      della cella (anche fuori griglia) e frazione di copertura in (0, 1]
+    """
+    if transform.b != 0 or transform.d != 0:
+        raise ValueError("Copertura esatta non disponibile per raster con rotazione")
+    empty = (np.empty(0, dtype=np.int64),) * 3 + (np.empty(0, dtype=np.float64),)
+
+    parts, part_owner = shapely.get_parts(rings[ids], return_index=True)
+    linear, ring_part = shapely.get_rings(parts, return_index=True)
+    if len(linear) == 0:
+        return empty
+    coords, coord_ring = shapely.get_coordinates(linear, return_index=True)
+
+    # coordinate pixel: u = colonna, v = riga (frazionarie)
+    u = (coords[:, 0] - transform.c) / transform.a
+    v = (coords[:, 1] - transform.f) / transform.e
+    same = coord_ring[:-1] == coord_ring[1:]
+    edge_ring = coord_ring[:-1][same]
+    u0, v0, u1, v1 = u[:-1][same], v[:-1][same], u[1:][same], v[1:][same]
+    edge_owner = part_owner[ring_part[edge_ring]]
+
+    # orientamento: anelli esterni con area positiva nel piano (u, v), fori negativa
+    signed = np.bincount(edge_ring, weights=u0 * v1 - u1 * v0, minlength=len(linear))
+    exterior = np.r_[True, ring_part[1:] != ring_part[:-1]]
+    edge_sign = np.where(((signed > 0) != exterior)[edge_ring], -1.0, 1.0)
+
+    # parametri t dei tagli sulle linee intere della griglia (estremi inclusi)
+    n_edges = len(u0)
+    cut_edges = [np.arange(n_edges), np.arange(n_edges)]
+    cut_t = [np.zeros(n_edges), np.ones(n_edges)]
+    for a0, a1 in ((u0, u1), (v0, v1)):
+        first = np.floor(np.minimum(a0, a1)) + 1
+        n_cuts = np.maximum(np.ceil(np.maximum(a0, a1)) - first, 0).astype(np.int64)
+        edges = np.repeat(np.arange(n_edges), n_cuts)
+        step = np.arange(len(edges)) - np.repeat(np.cumsum(n_cuts) - n_cuts, n_cuts)
+        cut_edges.append(edges)
+        cut_t.append((first[edges] + step - a0[edges]) / (a1[edges] - a0[edges]))
+    cut_edges = np.concatenate(cut_edges)
+    cut_t = np.concatenate(cut_t)
+    order = np.lexsort((cut_t, cut_edges))
+    cut_edges, cut_t = cut_edges[order], cut_t[order]
+
+    # segmenti interni a una sola cella
+    keep = (cut_edges[:-1] == cut_edges[1:]) & (cut_t[1:] > cut_t[:-1])
+    seg = cut_edges[:-1][keep]
+    t_mid = (cut_t[:-1][keep] + cut_t[1:][keep]) / 2
+    seg_du = (cut_t[1:][keep] - cut_t[:-1][keep]) * (u1[seg] - u0[seg])
+    u_mid = u0[seg] + t_mid * (u1[seg] - u0[seg])
+    v_mid = v0[seg] + t_mid * (v1[seg] - v0[seg])
+    seg_col = np.floor(u_mid).astype(np.int64)
+    seg_row = np.floor(v_mid).astype(np.int64)
+    seg_owner = edge_owner[seg]
+    full = -edge_sign[seg] * seg_du
+    partial = full * (v_mid - seg_row)
+
+    # griglia locale per anello (bounding box in celle, colonne contigue)
+    n_owners = len(ids)
+    row0 = np.full(n_owners, np.iinfo(np.int64).max)
+    row1 = np.full(n_owners, np.iinfo(np.int64).min)
+    col0, col1 = row0.copy(), row1.copy()
+    np.minimum.at(row0, seg_owner, seg_row)
+    np.maximum.at(row1, seg_owner, seg_row + 1)
+    np.minimum.at(col0, seg_owner, seg_col)
+    np.maximum.at(col1, seg_owner, seg_col + 1)
+    has_cells = row1 > row0
+    n_rows = np.where(has_cells, row1 - row0, 0)
+    n_cols = np.where(has_cells, col1 - col0, 0)
+    sizes = n_rows * n_cols
+    offsets = np.cumsum(sizes) - sizes
+    total = int(sizes.sum())
+    if total == 0:
+        return empty
+
+    def cell(owner, row, col):
+        return offsets[owner] + (col - col0[owner]) * n_rows[owner] + (row - row0[owner])
+
+    seg_cell = cell(seg_owner, seg_row, seg_col)
+    coverage = np.bincount(seg_cell, weights=partial, minlength=total)
+    # contributo pieno -Δu alle righe da row0 a riga del segmento (esclusa)
+    steps = (np.bincount(cell(seg_owner, row0[seg_owner], seg_col), weights=full, minlength=total)
+             - np.bincount(seg_cell, weights=full, minlength=total))
+    running = np.cumsum(steps)
+    column_rows = np.repeat(n_rows, n_cols)
+    column_start = np.cumsum(column_rows) - column_rows
+    coverage += running - np.repeat(running[column_start] - steps[column_start], column_rows)
+
+    cell_owner = np.repeat(np.arange(n_owners), sizes)
+    local = np.arange(total) - np.repeat(offsets, sizes)
+    cell_rows = row0[cell_owner] + local % n_rows[cell_owner]
+    cell_cols = col0[cell_owner] + local // n_rows[cell_owner]
+    covered = coverage > COVERAGE_EPSILON
+    return (np.asarray(ids)[cell_owner[covered]], cell_rows[covered], cell_cols[covered],
+            np.minimum(coverage[covered], 1.0))
+
+
+def coverage_ring_stats(raster, rings, band=1, tile_memory_mb=None):
+    """
+    Statistiche dei pixel esterni al perimetro pesate sulla copertura esatta
+
+    A differenza di zonal_ring_stats() (regola del centro pixel) ogni pixel
+    toccato dall'anello contribuisce con la sua frazione di copertura:
+    la media è pesata sull'area, min/max considerano tutti i pixel con
+    copertura non nulla e il conteggio è l'area dell'anello in pixel validi.
+
+    Parametri:
+    - raster: rasterio dataset con profondità acqua
+    - rings: array di anelli (da build_rings)
+    - band: banda raster da campionare
+    - tile_memory_mb: budget memoria per tile in MB (None = finestra unica sugli anelli)
+
+    Ritorna:
+    - dizionario di array (uno per edificio): count (float), sum, mean, min, max
+    """
+    stats = empty_ring_stats(len(rings), weighted=True)
+    layers = np.where(shapely.is_empty(rings) | shapely.is_missing(rings), -1, 0)
+
+    for window, ids in ring_windows(raster, rings, layers, band=band, tile_memory_mb=tile_memory_mb):
+        ids = ids[layers[ids] >= 0]
+        if window is None or ids.size == 0:
+            continue
+        data = raster.read(band, window=window)
+        transform = raster.window_transform(window)
+        for start in range(0, len(ids), COVERAGE_CHUNK):
+            owners, rows, cols, weights = ring_coverage(rings, ids[start:start + COVERAGE_CHUNK], transform)
+            inside = (rows >= 0) & (rows < data.shape[0]) & (cols >= 0) & (cols < data.shape[1])
+            owners, weights = owners[inside], weights[inside]
+            values = data[rows[inside], cols[inside]]
+            valid = valid_pixel_mask(values, raster.nodata)
+            accumulate_ring_stats(stats, owners[valid], values[valid], weights=weights[valid])
+    return finalize_ring_stats(stats)
+
+
+def build_pixel_index(raster, rings, band=1, tile_memory_mb=None):
+    """
+    Indice CSR edificio -> pixel dell'anello sulla griglia del raster
+
+    I pixel sono gli stessi campionati da zonal_ring_stats() (centro pixel
+    nell'anello); l'indice dipende solo dalla griglia (CRS, transform,
+    dimensioni), non dai valori, e vale per tutti gli scenari sulla stessa griglia.
+
+    Parametri:
+    - raster: rasterio dataset (serve solo la griglia)
+    - rings: array di anelli (da build_rings)
+    - band: banda di riferimento per i blocchi interni
+    - tile_memory_mb: budget memoria per tile in MB (None = finestra unica)
+
+    Ritorna:
+    - tuple (indptr, indices): i pixel dell'edificio i sono
+      indices[indptr[i]:indptr[i + 1]], offset riga * larghezza + colonna
+      in ordine crescente
+    """
+    n = len(rings)
+    layers = assign_ring_layers(rings)
+    owners, offsets = [], []
+    for window, ids in ring_windows(raster, rings, layers, band=band, tile_memory_mb=tile_memory_mb):
+        ids = ids[layers[ids] >= 0]
+        if ids.size == 0 or window.width <= 0 or window.height <= 0:
+            continue
+        shape = (int(window.height), int(window.width))
+        for labels in layer_label_grids(rings, layers, ids, shape, raster.window_transform(window)):
+            rows, cols = np.nonzero(labels)
+            owners.append(labels[rows, cols].astype(np.int64) - 1)
+            offsets.append((rows.astype(np.int64) + int(window.row_off)) * raster.width
+                           + cols + int(window.col_off))
+
+    owners = np.concatenate(owners) if owners else np.zeros(0, dtype=np.int64)
+    offsets = np.concatenate(offsets) if offsets else np.zeros(0, dtype=np.int64)
+    order = np.lexsort((offsets, owners))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(owners, minlength=n))
+    # offset a 32 bit quando la griglia lo consente (indice più compatto)
+    dtype = np.uint32 if raster.width * raster.height <= np.iinfo(np.uint32).max else np.int64
+    return indptr, offsets[order].astype(dtype)
+
+
+def pixel_index_layout(raster, indptr, indices):
+    """
+    Edificio, riga e colonna di ciascun pixel dell'indice e finestra che li contiene
+
+    Ritorna:
+    - tuple (owners, rows, cols, (row0, row1, col0, col1))
+    """
+    offsets = np.asarray(indices, dtype=np.int64)
+    owners = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    rows, cols = np.divmod(offsets, raster.width)
+    bounds = (int(rows.min()), int(rows.max()) + 1, int(cols.min()), int(cols.max()) + 1)
+    return owners, rows, cols, bounds
+
+
+def pixel_index_stats(raster, indptr, indices, band=1, tile_memory_mb=None, layout=None):
+    """
+    Statistiche dei pixel esterni al perimetro dall'indice pixel (build_pixel_index)
+
+    Legge la finestra che contiene tutti i pixel indicizzati (a strisce di righe
+    allineate ai blocchi se è indicato un budget di memoria) e riduce i valori
+    per edificio: nessuna operazione geometrica.
+
+    Parametri:
+    - raster: rasterio dataset sulla stessa griglia usata per l'indice
+    - indptr, indices: indice CSR (anche memory-mapped)
+    - band: banda raster da campionare
+    - tile_memory_mb: budget memoria per striscia in MB (None = finestra unica)
+    - layout: risultato di pixel_index_layout() riusato tra bande/scenari (None = calcolato)
+
+    Ritorna:
+    - dizionario di array (uno per edificio): count, sum, mean, min, max
+    """
+    n = len(indptr) - 1
+    stats = empty_ring_stats(n)
+    if len(indices) == 0:
+        return finalize_ring_stats(stats)
+
+    if layout is None:
+        layout = pixel_index_layout(raster, indptr, indices)
+    owners, rows, cols, (row0, row1, col0, col1) = layout
+
+    strip_h = row1 - row0
+    if tile_memory_mb is not None:
+        block_h = raster.block_shapes[band - 1][0]
+        bytes_per_row = (col1 - col0) * (np.dtype(raster.dtypes[band - 1]).itemsize + 1)
+        strip_h = max(block_h, int(tile_memory_mb * 1024 * 1024 // bytes_per_row) // block_h * block_h)
+
+    for r0 in range(row0, row1, strip_h):
+        r1 = min(r0 + strip_h, row1)
+        window = Window(col0, r0, col1 - col0, r1 - r0)
+        data = raster.read(band, window=window)
+        selected = np.flatnonzero((rows >= r0) & (rows < r1)) if strip_h < row1 - row0 else slice(None)
+        values = data[rows[selected] - r0, cols[selected] - col0]
+        valid = valid_pixel_mask(values, raster.nodata)
+        accumulate_ring_stats(stats, owners[selected][valid], values[valid])
+    return finalize_ring_stats(stats)
+
+
+def temporal_ring_stats(raster, indptr, indices, thresholds=(), time_step_hours=1.0, tile_memory_mb=None):
+    """
+    Aggregati temporali per edificio su uno stack multi-banda (una banda = un passo)
+
+    Le bande sono lette una alla volta tramite l'indice pixel: in memoria c'è
+    al più una finestra di una banda più gli aggregati per edificio. La
+    profondità di un passo è la media dei pixel dell'anello (come DEPTH_MEAN).
+
+    Parametri:
+    - raster: rasterio dataset multi-banda sulla griglia dell'indice
+    - indptr, indices: indice pixel (da build_pixel_index)
+    - thresholds: soglie di profondità (m) per le ore sopra soglia
+    - time_step_hours: durata di un passo temporale in ore
+    - tile_memory_mb: budget memoria per striscia in MB (None = finestra unica)
+
+    Ritorna:
+    - dizionario di array (uno per edificio): peak_mean, peak_max,
+      peak_band (banda del picco, 1..N; 0 = mai bagnato) e
+      hours_above {soglia: ore con profondità media > soglia}
+    """
+    n = len(indptr) - 1
+    peak_mean = np.zeros(n, dtype=np.float64)
+    peak_max = np.zeros(n, dtype=np.float64)
+    peak_band = np.zeros(n, dtype=np.int32)
+    hours_above = {threshold: np.zeros(n, dtype=np.float64) for threshold in thresholds}
+    if len(indices) == 0:
+        return {'peak_mean': peak_mean, 'peak_max': peak_max, 'peak_band': peak_band,
+                'hours_above': hours_above}
+
+    layout = pixel_index_layout(raster, indptr, indices)
+    for band in range(1, raster.count + 1):
+        stats = pixel_index_stats(raster, indptr, indices, band=band,
+                                  tile_memory_mb=tile_memory_mb, layout=layout)
+        wet = stats['count'] > 0
+        rising = wet & (stats['mean'] > peak_mean)
+        peak_mean[rising] = stats['mean'][rising]
+        peak_band[rising] = band
+        peak_max = np.maximum(peak_max, np.where(wet, stats['max'], 0.0))
+        for threshold, hours in hours_above.items():
+            hours[wet & (stats['mean'] > threshold)] += time_step_hours
+        if band % 24 == 0:
+            logger.info(f"Passo temporale {band}/{raster.count} elaborato")
+
+    return {'peak_mean': peak_mean, 'peak_max': peak_max, 'peak_band': peak_band,
+            'hours_above': hours_above}
+
+
+def raster_extent(raster, valid_data=False, band=1, strip_memory_mb=64):
+    """
+    Estensione del raster nel suo CRS: bounds del dataset oppure, con valid_data=True,
+    il rettangolo che contiene i pixel validi (maschera letta a strisce di righe)
+
+    Ritorna:
+    - tuple (minx, miny, maxx, maxy) oppure None se il raster non ha pixel validi
+    """
+    if not valid_data:
+        return tuple(raster.bounds)
+
+    valid_rows = np.zeros(raster.height, dtype=bool)
+    valid_cols = np.zeros(raster.width, dtype=bool)
+    block_h = raster.block_shapes[band - 1][0]
+    strip_h = max(block_h, int(strip_memory_mb * 1024 * 1024 // raster.width) // block_h * block_h)
+    for row_off in range(0, raster.height, strip_h):
+        height = min(strip_h, raster.height - row_off)
+        valid = raster.read_masks(band, window=Window(0, row_off, raster.width, height)) > 0
+        valid_rows[row_off:row_off + height] = valid.any(axis=1)
+        valid_cols |= valid.any(axis=0)
+
+    rows, cols = np.flatnonzero(valid_rows), np.flatnonzero(valid_cols)
+    if rows.size == 0:
+        return None
+    window = Window(cols[0], rows[0], cols[-1] + 1 - cols[0], rows[-1] + 1 - rows[0])
+    return rasterio.windows.bounds(window, raster.transform)
+
+
+def overlapping_buildings(geometries, extent, margin):
+    """
+    Edifici il cui anello può cadere nell'estensione del raster
+
+    Confronto vettoriale sulle geometrie già lette (nessun filtro bbox in
+    lettura: gli edifici esterni restano nell'output come record vuoti).
+
+    Parametri:
+    - geometries: GeoSeries o array di poligoni (nel CRS del raster)
+    - extent: (minx, miny, maxx, maxy) da raster_extent(), None = nessuna sovrapposizione
+    - margin: allargamento dell'estensione (buffer anello + un pixel)
+
+    Ritorna:
+    - array booleano (True = edificio da elaborare)
+    """
+    geoms = np.asarray(getattr(geometries, 'values', geometries), dtype=object)
+    if extent is None:
+        return np.zeros(len(geoms), dtype=bool)
+    minx, miny, maxx, maxy = extent
+    area = shapely.box(minx - margin, miny - margin, maxx + margin, maxy + margin)
+    return shapely.intersects(geoms, area)
+
+
+FOOTPRINT_NODATA, FOOTPRINT_DRY, FOOTPRINT_WET = 0, 1, 2
+
+
+def wet_footprint(raster, cell_size=64, band=1, strip_memory_mb=64):
+    """
+    Impronta bagnata a bassa risoluzione: una cella ogni cell_size x cell_size pixel
+
+    Stato della cella: FOOTPRINT_NODATA (solo nodata), FOOTPRINT_DRY (pixel validi
+    tutti a profondità zero) o FOOTPRINT_WET (almeno un pixel valido non nullo).
+    Il raster è letto una volta a strisce di righe.
+
+    Ritorna:
+    - array uint8 (righe celle, colonne celle)
+    """
+    n_rows = -(-raster.height // cell_size)
+    n_cols = -(-raster.width // cell_size)
+    footprint = np.zeros((n_rows, n_cols), dtype=np.uint8)
+    itemsize = np.dtype(raster.dtypes[band - 1]).itemsize
+    strip_cells = max(1, int(strip_memory_mb * 1024 * 1024 // (raster.width * cell_size * itemsize)))
+    padded_w = n_cols * cell_size
+
+    for cell_row0 in range(0, n_rows, strip_cells):
+        cell_row1 = min(cell_row0 + strip_cells, n_rows)
+        row_off = cell_row0 * cell_size
+        height = min(cell_row1 * cell_size, raster.height) - row_off
+        data = raster.read(band, window=Window(0, row_off, raster.width, height))
+        valid = valid_pixel_mask(data, raster.nodata)
+        wet = valid & (data != 0)
+
+        padded_h = (cell_row1 - cell_row0) * cell_size
+        cells = (cell_row1 - cell_row0, cell_size, n_cols, cell_size)
+        for state, mask in ((FOOTPRINT_DRY, valid), (FOOTPRINT_WET, wet)):
+            padded = np.zeros((padded_h, padded_w), dtype=bool)
+            padded[:height, :raster.width] = mask
+            footprint[cell_row0:cell_row1][padded.reshape(cells).any(axis=(1, 3))] = state
+    return footprint
+
+
+def dry_buildings(geometries, buffer_distance, raster, footprint, cell_size):
+    """
+    Edifici il cui anello ricade interamente in celle senza pixel bagnati
+
+    Il bounding box dell'anello (poligono allargato del buffer, più un pixel di
+    margine) è confrontato con l'impronta tramite una tabella delle somme
+    cumulate: una interrogazione O(1) per edificio.
+
+    Ritorna:
+    - tuple (dry, has_valid): array booleani; dry = nessuna cella bagnata sotto
+      l'anello, has_valid = almeno una cella con pixel validi
+    """
+    geoms = np.asarray(getattr(geometries, 'values', geometries), dtype=object)
+    bounds = shapely.bounds(geoms)
+    has_bounds = ~np.isnan(bounds).any(axis=1)
+    bounds = np.where(has_bounds[:, None], bounds, 0.0)
+
+    inv = ~raster.transform
+    cols_a, rows_a = inv * (bounds[:, 0] - buffer_distance, bounds[:, 3] + buffer_distance)
+    cols_b, rows_b = inv * (bounds[:, 2] + buffer_distance, bounds[:, 1] - buffer_distance)
+    col0 = np.floor(np.minimum(cols_a, cols_b)).astype(np.int64) - 1
+    col1 = np.ceil(np.maximum(cols_a, cols_b)).astype(np.int64) + 1
+    row0 = np.floor(np.minimum(rows_a, rows_b)).astype(np.int64) - 1
+    row1 = np.ceil(np.maximum(rows_a, rows_b)).astype(np.int64) + 1
+
+    n_rows, n_cols = footprint.shape
+    c0 = np.clip(col0 // cell_size, 0, n_cols)
+    c1 = np.clip(col1 // cell_size + 1, 0, n_cols)
+    r0 = np.clip(row0 // cell_size, 0, n_rows)
+    r1 = np.clip(row1 // cell_size + 1, 0, n_rows)
+
+    def cells_in_bbox(mask):
+        integral = np.zeros((n_rows + 1, n_cols + 1), dtype=np.int64)
+        integral[1:, 1:] = mask.astype(np.int64).cumsum(axis=0).cumsum(axis=1)
+        return integral[r1, c1] - integral[r0, c1] - integral[r1, c0] + integral[r0, c0]
+
+    dry = (cells_in_bbox(footprint == FOOTPRINT_WET) == 0) & has_bounds
+    has_valid = cells_in_bbox(footprint != FOOTPRINT_NODATA) > 0
+    return dry, has_valid
+
+
+def grid_signature(raster):
+    """Identificativo della griglia raster (CRS, transform, dimensioni) per l'indice pixel"""
+    crs_wkt = raster.crs.to_wkt() if raster.crs is not None else ''
+    return (crs_wkt, *tuple(raster.transform)[:6], raster.width, raster.height)
+
+
+def tile_checksums(raster, tile_size=512, band=1):
+    """
+    Checksum (BLAKE2b a 128 bit) dei valori di ciascun tile tile_size x tile_size
+
+    Il raster è letto una volta a strisce di una riga di tile; i tile seguono
+    la stessa numerazione di tile_window() / assign_rings_to_tiles().
+
+    Ritorna:
+    - array (righe tile, colonne tile) di stringhe esadecimali
+    """
+    n_rows = -(-raster.height // tile_size)
+    n_cols = -(-raster.width // tile_size)
+    checksums = np.empty((n_rows, n_cols), dtype=object)
+    for tr in range(n_rows):
+        row_off = tr * tile_size
+        data = raster.read(band, window=Window(0, row_off, raster.width, min(tile_size, raster.height - row_off)))
+        for tc in range(n_cols):
+            tile = np.ascontiguousarray(data[:, tc * tile_size:(tc + 1) * tile_size])
+            checksums[tr, tc] = hashlib.blake2b(tile.tobytes(), digest_size=16).hexdigest()
+    return checksums
+
+
+def spatial_partitions(rings, n_parts):
+    """
+    Suddivide gli anelli in partizioni spazialmente compatte (bisezione ricorsiva
+    sulla mediana dei centri dei bounding box, lungo l'asse più esteso)
+
+    Ritorna:
+    - lista di array di posizioni anelli
+    """
+    bounds = shapely.bounds(rings)
+    cx = np.nan_to_num((bounds[:, 0] + bounds[:, 2]) / 2)
+    cy = np.nan_to_num((bounds[:, 1] + bounds[:, 3]) / 2)
+
+    parts = [np.arange(len(rings))]
+    while len(parts) < n_parts:
+        parts.sort(key=len)
+        largest = parts.pop()
+        if len(largest) < 2:
+            parts.append(largest)
+            break
+        xs, ys = cx[largest], cy[largest]
+        axis = xs if np.ptp(xs) >= np.ptp(ys) else ys
+        order = np.argsort(axis, kind='stable')
+        half = len(largest) // 2
+        parts.extend([largest[order[:half]], largest[order[half:]]])
+    return [np.sort(part) for part in parts if part.size]
+
+
+# Handle raster del processo worker (aperto una sola volta da _init_worker)
+_worker_raster = None
+
+
+def _init_worker(raster_path):
+    global _worker_raster
+    _worker_raster = rasterio.open(raster_path)
+
+
+def _worker_ring_stats(task):
+    ids, rings, band, tile_memory_mb = task
+    return ids, zonal_ring_stats(_worker_raster, rings, band=band, tile_memory_mb=tile_memory_mb)
+
+
+def zonal_ring_stats_parallel(raster_path, rings, workers, band=1, tile_memory_mb=None):
+    """
+    Come zonal_ring_stats(), distribuendo partizioni spaziali su più processi
+
+    Ogni edificio appartiene a una sola partizione e i suoi pixel vengono
+    ridotti nello stesso ordine del percorso seriale: il risultato è identico.
+    Il raster è riaperto da ogni processo: deve essere un file (eventualmente
+    già riproiettato con reproject_raster).
+
+    Parametri:
+    - raster_path: percorso del raster (riaperto da ogni processo)
+    - rings: array di anelli (da build_rings)
+    - workers: numero di processi
+
+    Ritorna:
+    - dizionario di array (uno per edificio): count, sum, mean, min, max
+    """
+    stats = finalize_ring_stats(empty_ring_stats(len(rings)))
+    partitions = spatial_partitions(rings, workers * 4)
+    tasks = [(ids, rings[ids], band, tile_memory_mb) for ids in partitions]
+    logger.info(f"Modalità multi-processo: {len(tasks)} partizioni spaziali su {workers} processi")
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(raster_path,)) as pool:
+        for ids, part_stats in pool.map(_worker_ring_stats, tasks):
+            for key in ('count', 'sum', 'mean', 'min', 'max'):
+                stats[key][ids] = part_stats[key]
+    return stats
+
+
+def _curve_grid(points, order):
+    """Quantizza i punti su una griglia 2^order x 2^order"""
+    finite = np.isfinite(points).all(axis=1)
+    if not finite.any():
+        return np.zeros(len(points), dtype=np.int64), np.zeros(len(points), dtype=np.int64)
+    mins = points[finite].min(axis=0)
+    span = np.maximum(points[finite].max(axis=0) - mins, 1e-9)
+    cells = (1 << order) - 1
+    grid = np.nan_to_num((points - mins) / span * cells).clip(0, cells).astype(np.int64)
+    return grid[:, 0], grid[:, 1]
+
+
+def hilbert_distance(x, y, order=16):
+    """Distanza lungo la curva di Hilbert per coordinate intere di griglia (vettoriale)"""
+    n = 1 << order
+    x, y = x.copy(), y.copy()
+    d = np.zeros(len(x), dtype=np.int64)
+    s = n >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx.astype(np.int64)) ^ ry.astype(np.int64))
+        # rotazione del quadrante
+        flip = ~ry & rx
+        x[flip] = n - 1 - x[flip]
+        y[flip] = n - 1 - y[flip]
+        swap = ~ry
+        x[swap], y[swap] = y[swap], x[swap]
+        s >>= 1
+    return d
+
+
+def zorder_distance(x, y, order=16):
+    """Distanza lungo la curva Z-order (Morton) per coordinate intere di griglia"""
+    d = np.zeros(len(x), dtype=np.int64)
+    for bit in range(order):
+        d |= ((x >> bit) & 1) << (2 * bit)
+        d |= ((y >> bit) & 1) << (2 * bit + 1)
+    return d
+
+
+def space_filling_order(rings, curve='hilbert', order=16):
+    """
+    Ordine di elaborazione degli edifici lungo una curva di riempimento
+
+    Edifici consecutivi cadono su blocchi raster vicini e riusano la block cache
+    di GDAL invece di saltare da un capo all'altro del file.
+
+    Parametri:
+    - rings: array di anelli (si usa il centroide)
+    - curve: "hilbert" o "zorder"
+
+    Ritorna:
+    - permutazione delle posizioni degli edifici
+    """
+    centroids = shapely.get_coordinates(shapely.centroid(rings), include_z=False)
+    points = np.full((len(rings), 2), np.nan)
+    has_centroid = ~(shapely.is_missing(rings) | shapely.is_empty(rings))
+    points[has_centroid] = centroids
+    x, y = _curve_grid(points, order)
+    if curve == 'hilbert':
+        distance = hilbert_distance(x, y, order)
+    elif curve == 'zorder':
+        distance = zorder_distance(x, y, order)
+    else:
+        raise ValueError(f"Curva di ordinamento non valida: {curve}")
+    return np.argsort(distance, kind='stable')
+
+
+class _CountingFile:
+    """File Python che conta le letture richieste da GDAL"""
+
+    def __init__(self, fileobj, counter):
+        self._fileobj = fileobj
+        self._counter = counter
+
+    def read(self, size=-1):
+        data = self._fileobj.read(size)
+        self._counter.reads += 1
+        self._counter.bytes += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._fileobj, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._fileobj.close()
+
+
+class BlockReadCounter:
+    """
+    Contatore delle letture effettive di GDAL sul file raster
+
+    Il raster viene aperto tramite un opener Python (rasterio >= 1.4): ogni
+    lettura conteggiata è un accesso al file non servito dalla block cache.
+    """
+
+    def __init__(self):
+        self.reads = 0
+        self.bytes = 0
+
+    def opener(self, path, mode='rb'):
+        return _CountingFile(open(path, mode), self)
+
+    def open(self, path):
+        """Apre il raster con conteggio e azzera i contatori (esclude la lettura header)"""
+        raster = rasterio.open(path, opener=self.opener)
+        self.reset()
+        return raster
+
+    def reset(self):
+        self.reads = 0
+        self.bytes = 0
+
+
+def reproject_raster(raster, dst_crs, path, bounds=None, resampling=Resampling.bilinear):
+    """
+    Riproiezione del raster in un GeoTIFF su griglia fissa
+
+    La griglia di destinazione è quella di calculate_default_transform (la
+    stessa della copia completa). Con bounds viene scritta solo la finestra
+    della griglia che copre il riquadro (più un pixel di margine): lo spazio
+    su disco e il tempo di riproiezione dipendono dall'area degli edifici,
+    non dall'intero raster.
+
+    Tutte le letture successive (finestra unica, tile, processi worker,
+    rasterio.mask) vedono gli stessi pixel. Una finestra ridotta (bounds) può
+    differire leggermente dalla copia completa: GDAL ricampiona solo la
+    finestra richiesta.
+
+    Parametri:
+    - raster: rasterio dataset sorgente
+    - dst_crs: CRS di destinazione
+    - path: GeoTIFF di destinazione
+    - bounds: (minx, miny, maxx, maxy) nel CRS di destinazione (None = griglia completa)
+    - resampling: metodo di ricampionamento (default bilineare)
+
+    Ritorna:
+    - path
+    """
+    transform, width, height = calculate_default_transform(
+        raster.crs, dst_crs, raster.width, raster.height, *raster.bounds)
+    if bounds is not None:
+        window = from_bounds(*bounds, transform=transform)
+        window = window.round_offsets(op='floor').round_lengths(op='ceil')
+        window = Window(window.col_off - 1, window.row_off - 1, window.width + 2, window.height + 2)
+        window = window.intersection(Window(0, 0, width, height))
+        transform = rasterio.windows.transform(window, transform)
+        width, height = int(window.width), int(window.height)
+
+    profile = raster.meta.copy()
+    profile.update(driver='GTiff', crs=dst_crs, transform=transform, width=width, height=height,
+                   tiled=True, blockxsize=256, blockysize=256, BIGTIFF='IF_SAFER')
+    with rasterio.open(path, 'w', **profile) as dst:
+        for band in range(1, raster.count + 1):
+            reproject(source=rasterio.band(raster, band), destination=rasterio.band(dst, band),
+                      src_transform=raster.transform, src_crs=raster.crs,
+                      dst_transform=transform, dst_crs=dst_crs, resampling=resampling)
+    return path
+
+
+# Opzioni GDAL per la lettura remota (/vsis3/, /vsicurl/)
+REMOTE_READ_OPTIONS = {
+    'GDAL_DISABLE_READDIR_ON_OPEN': 'EMPTY_DIR',        # nessun listing del bucket all'apertura
+    'CPL_VSIL_CURL_ALLOWED_EXTENSIONS': '.tif,.tiff,.ovr,.msk',
+    'GDAL_HTTP_MERGE_CONSECUTIVE_RANGES': 'YES',        # blocchi contigui in un'unica richiesta range
+    'GDAL_HTTP_MAX_RETRY': '3',
+    'GDAL_HTTP_RETRY_DELAY': '1',
+    'VSI_CACHE': 'TRUE',                                # byte già letti (header, blocchi riletti) in memoria
+    'VSI_CACHE_SIZE': str(64 * 1024 * 1024),
+}
+REMOTE_PREFIXES = ('s3://', 'http://', 'https://', '/vsis3/', '/vsicurl/')
+
+
+def is_remote(path):
+    """True se il raster è su object storage / HTTP (lettura con richieste range)"""
+    return str(path).startswith(REMOTE_PREFIXES)
+
+
+def remote_raster_path(path):
+    """Percorso virtuale GDAL del raster remoto (s3://b/k -> /vsis3/b/k, https://... -> /vsicurl/https://...)"""
+    path = str(path)
+    if path.startswith('s3://'):
+        return '/vsis3/' + path[len('s3://'):]
+    if path.startswith(('http://', 'https://')):
+        return '/vsicurl/' + path
+    return path
+
+
+def configure_remote_access(endpoint=None, anonymous=None):
+    """
+    Configura GDAL per la lettura dei raster da object storage S3 compatibile
+
+    Le opzioni sono impostate come variabili d'ambiente, così valgono anche
+    per i processi worker (zonal_ring_stats_parallel). Le credenziali sono
+    quelle standard (AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY).
+
+    Parametri:
+    - endpoint: endpoint S3 compatibile, es. "http://minio.local:9000" (None = AWS S3)
+    - anonymous: accesso senza firma (None = automatico se non ci sono credenziali)
+
+    Ritorna:
+    - dizionario delle opzioni impostate
+    """
+    options = dict(REMOTE_READ_OPTIONS)
+    if endpoint:
+        scheme, _, host = endpoint.rpartition('://')
+        options['AWS_S3_ENDPOINT'] = host.rstrip('/')
+        options['AWS_HTTPS'] = 'NO' if scheme.lower() == 'http' else 'YES'
+        options['AWS_VIRTUAL_HOSTING'] = 'FALSE'  # MinIO: bucket nel percorso
+    if anonymous is None:
+        anonymous = not (os.environ.get('AWS_ACCESS_KEY_ID') or os.environ.get('AWS_PROFILE')
+                         or os.path.exists(os.path.expanduser('~/.aws/credentials')))
+    if anonymous:
+        options['AWS_NO_SIGN_REQUEST'] = 'YES'
+    os.environ.update(options)
+    return options
+
@@ -3,8 +3,10 @@ ANALISI SOMMERSIONE EDIFICI
 Calcola la percentuale di sommersione degli edifici durante eventi alluvionali
 analizzando la profondità dell'acqua nei pixel esterni al perimetro di ciascun edificio.
 
-Input: shapefile edifici + raster profondità acqua
+Input: vettoriale edifici (shapefile, GeoPackage, GeoParquet) + raster profondità acqua
 Output: shapefile con percentuali sommersione + report statistico
+        (modalità multi-scenario: tabella CSV con una terna di colonne per raster;
+         modalità temporale: tabella CSV con picco, istante del picco e ore sopra soglia)
 Metodo: campionamento pixels esterni (buffer 1 pixel)
 """
 
@@ -13,14 +15,29 @@ import rasterio
 import rasterio.mask
 from rasterio.warp import calculate_default_transform, reproject, Resampling
 import numpy as np
+import pandas as pd
+import shapely
 from shapely.geometry import mapping
-from shapely.ops import unary_union
 import fiona
 import os
 import sys
+import argparse
+import glob
 import tempfile
+import time
 import logging
 from datetime import datetime
+from wd_engine import (build_rings, zonal_ring_stats, zonal_ring_stats_parallel,
+                       space_filling_order, BlockReadCounter, reproject_raster,
+                       pixel_index_stats, build_pixel_index, grid_signature,
+                       temporal_ring_stats, raster_extent, overlapping_buildings, wet_footprint,
+                       dry_buildings, plan_tiles, assign_rings_to_tiles, rings_window, FOOTPRINT_WET,
+                       coverage_ring_stats, is_remote, remote_raster_path, configure_remote_access)
+from wd_cache import (DiskCache, cached_reprojection, load_or_build_rings, load_or_build_pixel_index,
+                      cached_wet_footprint, load_or_read_buildings, cached_cog)
+from wd_io import building_keys, is_zip, read_buildings, list_fields
+from wd_incremental import (building_fingerprints, run_signature, load_state, save_state, match_previous,
+                            changed_tiles, stale_buildings)
 
 # Percorsi input/output
 VECTOR_PATH = r"E:\RECOVERY\WORK\IN-TIME\FLOODING\WATER-DEPTH\GORO_V_UVL_GPG.shp"
@@ -29,20 +46,55 @@ OUTPUT_PATH = r"E:\RECOVERY\WORK\IN-TIME\FLOODING\WATER-DEPTH\wd_analysis\wd_est
 
 # Parametri configurazione
 HEIGHT_FIELD = "H_UVL"  # Nome del campo altezza edificio nel vettoriale di input
+ZIP_LAYER = "V_UVL_GPG"  # Layer letto se VECTOR_PATH è un archivio zip DBTR (es. downloadDBTR_312556.zip),
+                         # direttamente dall'archivio (/vsizip) senza estrazione su disco
+VECTOR_CACHE_DIR = None  # Cache del layer estratto dall'archivio zip (GeoParquet; None = rilettura dallo zip a ogni esecuzione)
 REPROJECTION_OPTION = 1  # 1=riproietta vettoriale, 2=riproietta raster, 3=riproietta entrambi
 TARGET_EPSG = "32632"    # EPSG di destinazione (usato solo se REPROJECTION_OPTION = 3)
+LAZY_REPROJECTION = False  # Opzioni 2/3: riproietta solo il riquadro degli edifici (False = copia completa temporanea);
+                          # i valori possono differire leggermente dalla copia completa (ricampionamento della sola finestra)
+REPROJECTION_CACHE_DIR = None  # Opzioni 2/3: cartella cache persistente dei raster riproiettati (None = disattivata)
+REPROJECTION_CACHE_MAX_GB = 20  # Dimensione massima della cache (eliminazione LRU)
 BUFFER_DISTANCE = None   # Distanza buffer in metri (None = automatico = risoluzione pixel)
+ZONAL_ENGINE = "batch"   # "batch" = motore vettoriale unico (wd_engine), "mask" = rasterio.mask.mask per edificio,
+                         # "exact" = copertura esatta dei pixel (media pesata sull'area, per griglie grossolane);
+                         # raster senza nodata: "mask" conta anche lo 0 di riempimento fuori dall'anello, "batch" no
+TILE_MEMORY_MB = None    # Budget memoria per tile in MB (None = lettura unica; es. 256 per raster più grandi della RAM)
+S3_ENDPOINT = None       # Raster su object storage (RASTER_PATH = "s3://bucket/percorso.tif"): endpoint S3 compatibile,
+                         # es. "http://minio.local:9000" (None = AWS); COG letto con richieste HTTP range, senza download
+REMOTE_TILE_MEMORY_MB = 1  # Raster remoto senza TILE_MEMORY_MB: tile di pochi blocchi interni, trasferiti solo sotto gli edifici
+INGEST_CACHE_DIR = None  # Ingest raster: conversione in COG (blocchi 512, DEFLATE, overview interne) conservata in questa
+                         # cartella e usata al posto di RASTER_PATH; i raster già COG sono usati direttamente (None = disattivato)
+INGEST_NODATA = None     # Nodata dichiarato nel COG se il raster in ingresso non lo ha (es. -9999.0; None = nessuno)
+WORKERS = 1              # Processi per le statistiche anelli (1 = seriale; sovrascrivibile con --workers N)
+SPATIAL_SORT = None      # Ordine di elaborazione: None = ordine file, "hilbert" o "zorder" (curva sui centroidi degli anelli)
+BBOX_PREFILTER = None    # Pre-filtro edifici sull'estensione raster: None, "bounds" (estensione file) o "data" (pixel validi, una lettura della maschera)
+                         # (filtro in memoria: il layer è letto per intero perché l'output ha un record, con geometria,
+                         # per ogni edificio; si evitano anelli e letture raster degli edifici esterni)
+WET_FOOTPRINT = False    # Salta il campionamento degli edifici con anello in celle asciutte/nodata (impronta bagnata)
+                         # (profondità zero; elaborati se le celle sotto l'anello hanno pixel validi)
+WET_CELL_SIZE = 64       # Lato delle celle dell'impronta bagnata (pixel)
+FOOTPRINT_CACHE_DIR = None  # Cache delle impronte bagnate per raster (None = ricalcolo a ogni esecuzione)
+COUNT_BLOCK_READS = False  # Conta le letture effettive di GDAL sul file raster (richiede rasterio >= 1.4)
+RING_STORE_DIR = None    # Archivio anelli precalcolati (GeoParquet) riusati tra eventi (None = ricalcolo a ogni esecuzione)
+PIXEL_INDEX_DIR = None   # Archivio indici edificio -> pixel per griglia raster (.npy memory-mapped; None = disattivato)
+TEMPORAL_MODE = False    # Raster multi-banda / NetCDF come serie temporale (una banda = un passo;
+                         # NetCDF: RASTER_PATH = r'NETCDF:"E:\...\sim.nc":depth')
+TIME_STEP_HOURS = 1.0    # Durata di un passo temporale (ore)
+DEPTH_THRESHOLDS = [0.1, 0.5, 1.0]  # Soglie di profondità (m) per le ore sopra soglia
+OUTPUT_CHUNK_SIZE = 10000  # Record per blocco di scrittura dello shapefile di output
+WRITE_SHAPEFILE = True   # Shapefile di output (formato storico)
+COLUMNAR_OUTPUT = None   # Output colonnare aggiuntivo: None, "parquet" (GeoParquet, geometria WKB), "feather" (Arrow IPC)
+                         # o "attributes" (solo FID del layer e metriche, Feather senza geometria, per join sul catasto edifici)
+INCREMENTAL = False      # Riusa i risultati degli edifici invariati (geometria, altezza) dall'esecuzione precedente
+                         # (stato in <OUTPUT>_incrementale.parquet; sovrascrivibile con --incremental)
+INCREMENTAL_TILE_SIZE = 512  # Lato (pixel) dei tile di checksum del raster: con raster riconsegnato si ricalcolano
+                             # solo gli edifici sui tile modificati (None = raster modificato -> ricalcolo completo)
+SCENARIO_RASTERS = None  # Multi-scenario: lista di raster o pattern glob, es. [r"E:\...\TR*.tif"] (None = solo RASTER_PATH);
+                         # multi-scenario e serie temporale solo con ZONAL_ENGINE = "batch", senza --incremental
 
-# Configura logging
+# Percorso file di log
 log_path = OUTPUT_PATH.replace('wd_estimation.shp', 'wd_estimation.log')
-os.makedirs(os.path.dirname(log_path), exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_path, mode='w', encoding='utf-8')
-    ]
-)
 
 # Ridefinisci print per logging
 original_print = print
@@ -50,391 +102,924 @@ def print(*args, **kwargs):
     message = ' '.join(str(arg) for arg in args)
     logging.info(message)
 
-# Log inizio elaborazione
-logging.info("=== INIZIO ELABORAZIONE ===")
-logging.info(f"File vettoriale: {VECTOR_PATH}")
-logging.info(f"File raster: {RASTER_PATH}")
-logging.info(f"File output: {OUTPUT_PATH}")
-
-# Carica dati vettoriali e raster
-vector = gpd.read_file(VECTOR_PATH)
-raster = rasterio.open(RASTER_PATH)
-
-# Controlla i campi disponibili nel vettoriale
-print("Campi disponibili nel vettoriale:")
-print(list(vector.columns))
-print()
-
-# Controllo CRS
-vector_crs = vector.crs
-raster_crs = raster.crs
-
-if vector_crs != raster_crs:
-    print(f"ATTENZIONE: I sistemi di riferimento non coincidono!")
-    print(f"CRS vettoriale: {vector_crs}")
-    print(f"CRS raster: {raster_crs}")
-    print(f"Applicando opzione di riproiezione: {REPROJECTION_OPTION}")
-    
+# Funzione per ottenere i pixel esterni al perimetro
+def get_external_pixels(geom, raster, buffer_distance=None, ring=None):
+    """
+    Estrae i valori dei pixel immediatamente esterni al perimetro del poligono
+    (ring = anello precalcolato dall'archivio anelli, se disponibile)
+    """
     try:
-        if REPROJECTION_OPTION == 1:
-            # Riproietta vettoriale nel CRS del raster
-            target_crs = raster_crs
-            print(f"Riproiettando il vettoriale in {target_crs}...")
-            vector = vector.to_crs(target_crs)
-            print("Vettoriale riproiettato.")
+        if ring is None:
+            # Se non specificato, usa la risoluzione del raster come buffer
+            if buffer_distance is None:
+                buffer_distance = abs(raster.transform[0])  # risoluzione pixel
             
-        elif REPROJECTION_OPTION == 2:
-            # Riproietta raster nel CRS del vettoriale
-            target_crs = vector_crs
-            print(f"Riproiettando il raster in {target_crs}...")
-            # Crea file temporaneo per raster riproiettato
+            # Crea buffer esterno molto piccolo
+            external_buffer = geom.buffer(buffer_distance)
+            
+            # Crea anello: buffer esterno - poligono originale
+            ring = external_buffer.difference(geom)
+        
+        # Estrai valori raster dall'anello
+        out_image, out_transform = rasterio.mask.mask(raster, [mapping(ring)], crop=True, filled=True)
+        data = out_image[0]
+        
+        # Escludi nodata
+        valid_data = data[data != raster.nodata]
+        
+        return valid_data
+        
+    except Exception as e:
+        return np.array([])
+
+
+def parse_args():
+    """Legge le opzioni da riga di comando (default = parametri configurazione)"""
+    parser = argparse.ArgumentParser(description="Analisi sommersione edifici")
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help="Numero di processi per il calcolo delle statistiche (1 = seriale)")
+    parser.add_argument('--build-rings', action='store_true',
+                        help="Calcola e archivia anelli (RING_STORE_DIR) e indice pixel (PIXEL_INDEX_DIR), poi termina")
+    parser.add_argument('--scenarios', nargs='+', default=SCENARIO_RASTERS,
+                        help="Raster scenario (percorsi o pattern glob): un solo passaggio edifici, tabella ampia in output")
+    parser.add_argument('--incremental', action='store_true', default=INCREMENTAL,
+                        help="Ricalcola solo gli edifici nuovi o modificati rispetto all'esecuzione precedente")
+    parser.add_argument('--temporal', action='store_true', default=TEMPORAL_MODE,
+                        help="Serie temporale: picco, istante del picco e ore sopra soglia per edificio")
+    return parser.parse_args()
+
+
+def resolve_scenarios(patterns):
+    """Espande percorsi e pattern glob nella lista ordinata (senza duplicati) dei raster scenario"""
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        paths.extend(path for path in matches if path not in paths)
+    return paths
+
+
+def scenario_names(paths):
+    """
+    Nomi degli scenari per le colonne della tabella: nome file senza estensione,
+    oppure, se due file hanno lo stesso nome in cartelle diverse, percorso
+    relativo alla cartella comune con i separatori sostituiti da '_'
+
+    Ritorna:
+    - lista dei nomi nello stesso ordine dei percorsi (ValueError se restano nomi ripetuti)
+    """
+    names = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    if len({name.lower() for name in names}) < len(names):
+        full_paths = [os.path.abspath(path) for path in paths]
+        common = os.path.commonpath([os.path.dirname(path) for path in full_paths])
+        names = [os.path.splitext(os.path.relpath(path, common))[0].replace(os.sep, '_').replace('/', '_')
+                 for path in full_paths]
+    seen = {}
+    for name, path in zip(names, paths):
+        if name.lower() in seen:
+            raise ValueError(f"Raster scenario con lo stesso nome colonna '{name}': {seen[name.lower()]}, {path}")
+        seen[name.lower()] = path
+    return names
+
+
+def process_scenarios(vector, raster, scenario_paths, buffer_distance, rings=None, pixel_index=None,
+                      tile_memory_mb=TILE_MEMORY_MB):
+    """
+    Analisi multi-scenario: anelli e indice pixel calcolati una sola volta,
+    poi per ogni raster una lettura e riduzioni NumPy
+
+    Parametri:
+    - vector: GeoDataFrame edifici (nel CRS di elaborazione)
+    - raster: primo scenario, già aperto (ed eventualmente riproiettato)
+    - scenario_paths: percorsi di tutti i raster scenario (il primo è raster)
+    - buffer_distance: distanza buffer nelle unità del CRS
+    - rings, pixel_index: anelli / indice pixel già disponibili (None = calcolati qui)
+    - tile_memory_mb: budget memoria per tile in MB (None = lettura unica)
+
+    Ritorna:
+    - DataFrame con A_BASE, altezza, VOL e <scenario>_DEPTH_MEAN/_DEPTH_MAX/_PERC_SUBM
+    """
+    heights = vector[HEIGHT_FIELD].to_numpy(dtype=np.float64)
+    areas = vector.geometry.area.to_numpy()
+    columns = {
+        'A_BASE': np.round(areas, 2),
+        HEIGHT_FIELD: np.round(heights, 2),
+        'VOL': np.round(areas * heights, 2),
+    }
+
+    # un indice pixel per griglia raster (scenari dello stesso modello idraulico la condividono)
+    indexes = {}
+    names = scenario_names(scenario_paths)
+    if pixel_index is not None:
+        indexes[grid_signature(raster)] = pixel_index
+
+    for i, path in enumerate(scenario_paths):
+        start = time.time()
+        scenario = raster if i == 0 else rasterio.open(path)
+        warped_path = None
+        if i > 0 and scenario.crs != vector.crs:
+            # riproiezione del riquadro edifici su griglia fissa (stessi pixel per indice e statistiche)
             temp_raster = tempfile.NamedTemporaryFile(suffix='.tif', delete=False)
-            temp_raster_path = temp_raster.name
             temp_raster.close()
+            minx, miny, maxx, maxy = vector.total_bounds
+            warped_path = reproject_raster(scenario, vector.crs, temp_raster.name,
+                                           bounds=(minx - buffer_distance, miny - buffer_distance,
+                                                   maxx + buffer_distance, maxy + buffer_distance))
+            scenario.close()
+            scenario = rasterio.open(warped_path)
+        grid = grid_signature(scenario)
+        if grid not in indexes:
+            if rings is None:
+                rings = build_rings(vector.geometry, buffer_distance)
+            indexes[grid] = build_pixel_index(scenario, rings, tile_memory_mb=tile_memory_mb)
+        stats = pixel_index_stats(scenario, *indexes[grid], tile_memory_mb=tile_memory_mb)
+        if i > 0:
+            scenario.close()
+        if warped_path:
+            os.unlink(warped_path)
+
+        # stesse regole della modalità singola: senza pixel validi o altezza nulla -> 0
+        valid = (stats['count'] > 0) & (heights > 0)
+        depth_mean = np.where(valid, stats['mean'], 0.0)
+        depth_max = np.where(valid, stats['max'], 0.0)
+        perc_submerged = np.zeros_like(depth_mean)
+        perc_submerged[valid] = np.minimum(depth_mean[valid] / heights[valid] * 100, 100.0)
+
+        name = names[i]
+        columns[f"{name}_DEPTH_MEAN"] = np.round(depth_mean, 2)
+        columns[f"{name}_DEPTH_MAX"] = np.round(depth_max, 2)
+        columns[f"{name}_PERC_SUBM"] = np.round(perc_submerged, 2)
+        print(f"Scenario {i + 1}/{len(scenario_paths)} {name}: {int(valid.sum())} edifici elaborati "
+              f"in {time.time() - start:.1f}s")
+
+    return pd.DataFrame(columns)
+
+
+def process_temporal(vector, raster, buffer_distance, rings=None, pixel_index=None, tile_memory_mb=TILE_MEMORY_MB):
+    """
+    Analisi temporale: bande lette una alla volta, aggregati progressivi per edificio
+
+    Parametri:
+    - vector: GeoDataFrame edifici (nel CRS di elaborazione)
+    - raster: stack multi-banda (GeoTIFF o NetCDF aperto da GDAL), una banda per passo
+    - buffer_distance: distanza buffer nelle unità del CRS
+    - rings, pixel_index: anelli / indice pixel già disponibili (None = calcolati qui)
+    - tile_memory_mb: budget memoria per tile in MB (None = lettura unica)
+
+    Ritorna:
+    - DataFrame con A_BASE, altezza, VOL, PEAK_DEPTH, PEAK_MAX, T_PEAK_H,
+      PERC_SUBM (al picco) e H_ABOVE_<soglia> per ogni soglia
+    """
+    if pixel_index is None:
+        if rings is None:
+            rings = build_rings(vector.geometry, buffer_distance)
+        pixel_index = build_pixel_index(raster, rings, tile_memory_mb=tile_memory_mb)
+
+    stats = temporal_ring_stats(raster, *pixel_index, thresholds=DEPTH_THRESHOLDS,
+                                time_step_hours=TIME_STEP_HOURS, tile_memory_mb=tile_memory_mb)
+
+    heights = vector[HEIGHT_FIELD].to_numpy(dtype=np.float64)
+    areas = vector.geometry.area.to_numpy()
+    wet = (stats['peak_band'] > 0) & (heights > 0)
+    perc_submerged = np.zeros(len(vector))
+    perc_submerged[wet] = np.minimum(stats['peak_mean'][wet] / heights[wet] * 100, 100.0)
+    # istante del picco: fine del passo temporale (ore dall'inizio della simulazione)
+    time_of_peak = np.where(stats['peak_band'] > 0, stats['peak_band'] * TIME_STEP_HOURS, np.nan)
+
+    columns = {
+        'A_BASE': np.round(areas, 2),
+        HEIGHT_FIELD: np.round(heights, 2),
+        'VOL': np.round(areas * heights, 2),
+        'PEAK_DEPTH': np.round(stats['peak_mean'], 2),
+        'PEAK_MAX': np.round(stats['peak_max'], 2),
+        'T_PEAK_H': np.round(time_of_peak, 2),
+        'PERC_SUBM': np.round(perc_submerged, 2),
+    }
+    for threshold, hours in stats['hours_above'].items():
+        columns[f"H_ABOVE_{threshold:g}"] = np.round(hours, 2)
+    return pd.DataFrame(columns)
+
+
+def main():
+    args = parse_args()
+
+    # Configura logging
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(log_path, mode='w', encoding='utf-8')
+        ]
+    )
+
+    # Log inizio elaborazione
+    logging.info("=== INIZIO ELABORAZIONE ===")
+    logging.info(f"File vettoriale: {VECTOR_PATH}")
+
+    # Multi-scenario: il primo raster guida controllo CRS e riproiezione
+    scenario_paths = resolve_scenarios(args.scenarios) if args.scenarios else []
+    if args.scenarios and not scenario_paths:
+        logging.error(f"Nessun raster scenario trovato: {args.scenarios}")
+        original_print("Elaborazione fallita - Exit code: 1")
+        sys.exit(1)
+    try:
+        scenario_names(scenario_paths)
+    except ValueError as e:
+        logging.error(f"{e}")
+        original_print("Elaborazione fallita - Exit code: 1")
+        sys.exit(1)
+    if scenario_paths and args.temporal:
+        logging.error("Modalità temporale e multi-scenario non combinabili")
+        original_print("Elaborazione fallita - Exit code: 1")
+        sys.exit(1)
+    # Multi-scenario e serie temporale campionano tutti gli edifici con il motore batch (o l'indice pixel)
+    if scenario_paths or args.temporal:
+        mode = "multi-scenario" if scenario_paths else "temporale"
+        if ZONAL_ENGINE != "batch" or args.incremental:
+            logging.error(f"Modalità {mode} supportata solo con ZONAL_ENGINE = \"batch\" e senza --incremental "
+                          f"(ZONAL_ENGINE = \"{ZONAL_ENGINE}\", incrementale = {args.incremental})")
+            original_print("Elaborazione fallita - Exit code: 1")
+            sys.exit(1)
+        if BBOX_PREFILTER or WET_FOOTPRINT:
+            logging.warning(f"Modalità {mode}: BBOX_PREFILTER e WET_FOOTPRINT ignorati, tutti gli edifici campionati")
+    raster_path = scenario_paths[0] if scenario_paths else RASTER_PATH
+    # Raster su object storage: letture HTTP range dei soli blocchi necessari, nessun download
+    remote_raster = is_remote(raster_path)
+    if remote_raster:
+        configure_remote_access(S3_ENDPOINT)
+        raster_path = remote_raster_path(raster_path)
+    if scenario_paths:
+        logging.info(f"Raster scenario: {len(scenario_paths)} ({', '.join(scenario_paths)})")
+    else:
+        logging.info(f"File raster: {RASTER_PATH}")
+    logging.info(f"File output: {OUTPUT_PATH}")
+
+    # Carica dati vettoriali (solo geometria, campo altezza e FID) e raster
+    if VECTOR_CACHE_DIR:
+        vector_cache = DiskCache(VECTOR_CACHE_DIR)
+        vector = load_or_read_buildings(VECTOR_PATH, HEIGHT_FIELD, vector_cache, zip_layer=ZIP_LAYER)
+    else:
+        vector = read_buildings(VECTOR_PATH, HEIGHT_FIELD, zip_layer=ZIP_LAYER)
+    # Ingest: raster a strisce / non compressi / senza overview riscritti una volta in COG (in cache)
+    if INGEST_CACHE_DIR:
+        if remote_raster or not os.path.isfile(raster_path):
+            print(f"Ingest COG non applicabile a {raster_path} (solo file raster locali)")
+        else:
+            ingest_cache = DiskCache(INGEST_CACHE_DIR)
+            start = time.time()
+            raster_path = cached_cog(raster_path, ingest_cache, nodata=INGEST_NODATA)
+            print(f"Raster di lavoro: {raster_path} (ingest {time.time() - start:.1f}s, cache {ingest_cache.summary()})")
+            if len(scenario_paths) > 1:
+                print("NOTA: ingest COG applicato solo al primo raster scenario")
+    raster = rasterio.open(raster_path)
+
+    tile_memory_mb = TILE_MEMORY_MB
+    if remote_raster:
+        block_h, block_w = raster.block_shapes[0]
+        print(f"Raster remoto {raster_path}: {raster.width}x{raster.height} pixel, blocchi {block_w}x{block_h}")
+        if block_w >= raster.width and raster.height > block_h:
+            print("ATTENZIONE: raster remoto a strisce (non COG): ogni lettura trasferisce righe a larghezza piena")
+        if tile_memory_mb is None:
+            # finestra unica = tutti i blocchi nel riquadro degli edifici; a tile solo quelli sotto gli anelli
+            tile_memory_mb = REMOTE_TILE_MEMORY_MB
+            print(f"Modalità a tile per raster remoto: budget {tile_memory_mb} MB")
+        if args.incremental or REPROJECTION_CACHE_DIR or FOOTPRINT_CACHE_DIR or COUNT_BLOCK_READS:
+            print("ATTENZIONE: con raster remoto esecuzione incrementale, cache riproiezioni/impronte "
+                  "e conteggio letture sono disattivati (richiedono il file raster locale)")
+            args.incremental = False
+
+    # Controlla i campi disponibili nel vettoriale (schema del layer; con la cache del layer estratto
+    # dallo zip i campi letti, senza riaprire l'archivio)
+    print("Campi disponibili nel vettoriale:")
+    if VECTOR_CACHE_DIR and is_zip(VECTOR_PATH):
+        print([column for column in vector.columns if column != vector.geometry.name])
+    else:
+        print(list_fields(VECTOR_PATH, zip_layer=ZIP_LAYER))
+    print()
+
+    # Controllo CRS
+    vector_crs = vector.crs
+    raster_crs = raster.crs
+
+    if vector_crs != raster_crs:
+        print(f"ATTENZIONE: I sistemi di riferimento non coincidono!")
+        print(f"CRS vettoriale: {vector_crs}")
+        print(f"CRS raster: {raster_crs}")
+        print(f"Applicando opzione di riproiezione: {REPROJECTION_OPTION}")
+    
+        try:
+            if REPROJECTION_OPTION == 1:
+                # Riproietta vettoriale nel CRS del raster
+                target_crs = raster_crs
+                print(f"Riproiettando il vettoriale in {target_crs}...")
+                vector = vector.to_crs(target_crs)
+                print("Vettoriale riproiettato.")
             
-            # Calcola trasformazione
-            transform, width, height = calculate_default_transform(
-                raster.crs, target_crs, raster.width, raster.height, *raster.bounds)
+            elif REPROJECTION_OPTION in (2, 3) and (REPROJECTION_CACHE_DIR or LAZY_REPROJECTION):
+                target_crs = vector_crs if REPROJECTION_OPTION == 2 else f"EPSG:{TARGET_EPSG}"
+                if REPROJECTION_OPTION == 3:
+                    print(f"Riproiettando entrambi in {target_crs}...")
+                    vector = vector.to_crs(target_crs)
+                    print("Vettoriale riproiettato.")
+                if REPROJECTION_CACHE_DIR and not remote_raster:
+                    # Raster riproiettato (COG) riusato tra esecuzioni sullo stesso evento
+                    print(f"Riproiettando il raster in {target_crs} (cache: {REPROJECTION_CACHE_DIR})...")
+                    reprojection_cache = DiskCache(REPROJECTION_CACHE_DIR, REPROJECTION_CACHE_MAX_GB)
+                    cached_raster_path = cached_reprojection(raster, target_crs, reprojection_cache)
+                    raster.close()
+                    raster = rasterio.open(cached_raster_path)
+                    print(f"Raster riproiettato (cache {reprojection_cache.summary()}).")
+                else:
+                    # Riproiezione limitata al riquadro degli edifici, su griglia fissa: tutte le modalità
+                    # (finestra unica, tile, processi worker, mask) leggono gli stessi pixel
+                    print(f"Riproiettando il raster in {target_crs} (solo riquadro edifici)...")
+                    temp_raster = tempfile.NamedTemporaryFile(suffix='.tif', delete=False)
+                    temp_raster_path = temp_raster.name
+                    temp_raster.close()
+                    margin = BUFFER_DISTANCE or 0.0
+                    minx, miny, maxx, maxy = vector.total_bounds
+                    reproject_raster(raster, target_crs, temp_raster_path,
+                                     bounds=(minx - margin, miny - margin, maxx + margin, maxy + margin))
+                    raster.close()
+                    raster = rasterio.open(temp_raster_path)
+                    print(f"Raster riproiettato ({raster.width}x{raster.height} pixel).")
             
-            # Parametri per il nuovo raster
-            kwargs = raster.meta.copy()
-            kwargs.update({
-                'crs': target_crs,
-                'transform': transform,
-                'width': width,
-                'height': height
-            })
+            elif REPROJECTION_OPTION == 2:
+                # Riproietta raster nel CRS del vettoriale
+                target_crs = vector_crs
+                print(f"Riproiettando il raster in {target_crs}...")
+                # Crea file temporaneo per raster riproiettato
+                temp_raster = tempfile.NamedTemporaryFile(suffix='.tif', delete=False)
+                temp_raster_path = temp_raster.name
+                temp_raster.close()
             
-            # Esegui riproiezione
-            with rasterio.open(temp_raster_path, 'w', **kwargs) as dst:
-                for i in range(1, raster.count + 1):
-                    reproject(
-                        source=rasterio.band(raster, i),
-                        destination=rasterio.band(dst, i),
-                        src_transform=raster.transform,
-                        src_crs=raster.crs,
-                        dst_transform=transform,
-                        dst_crs=target_crs,
-                        resampling=Resampling.bilinear)
+                # Calcola trasformazione
+                transform, width, height = calculate_default_transform(
+                    raster.crs, target_crs, raster.width, raster.height, *raster.bounds)
             
-            # Chiudi raster originale e apri quello riproiettato
-            raster.close()
-            raster = rasterio.open(temp_raster_path)
-            print("Raster riproiettato.")
+                # Parametri per il nuovo raster
+                kwargs = raster.meta.copy()
+                kwargs.update({
+                    'crs': target_crs,
+                    'transform': transform,
+                    'width': width,
+                    'height': height
+                })
             
-        elif REPROJECTION_OPTION == 3:
-            # Riproietta entrambi nel CRS specificato
-            target_crs = f"EPSG:{TARGET_EPSG}"
-            print(f"Riproiettando entrambi in {target_crs}...")
+                # Esegui riproiezione
+                with rasterio.open(temp_raster_path, 'w', **kwargs) as dst:
+                    for i in range(1, raster.count + 1):
+                        reproject(
+                            source=rasterio.band(raster, i),
+                            destination=rasterio.band(dst, i),
+                            src_transform=raster.transform,
+                            src_crs=raster.crs,
+                            dst_transform=transform,
+                            dst_crs=target_crs,
+                            resampling=Resampling.bilinear)
             
-            # Riproietta vettoriale
-            vector = vector.to_crs(target_crs)
-            print("Vettoriale riproiettato.")
+                # Chiudi raster originale e apri quello riproiettato
+                raster.close()
+                raster = rasterio.open(temp_raster_path)
+                print("Raster riproiettato.")
             
-            # Riproietta raster
-            temp_raster = tempfile.NamedTemporaryFile(suffix='.tif', delete=False)
-            temp_raster_path = temp_raster.name
-            temp_raster.close()
+            elif REPROJECTION_OPTION == 3:
+                # Riproietta entrambi nel CRS specificato
+                target_crs = f"EPSG:{TARGET_EPSG}"
+                print(f"Riproiettando entrambi in {target_crs}...")
             
-            transform, width, height = calculate_default_transform(
-                raster.crs, target_crs, raster.width, raster.height, *raster.bounds)
+                # Riproietta vettoriale
+                vector = vector.to_crs(target_crs)
+                print("Vettoriale riproiettato.")
             
-            kwargs = raster.meta.copy()
-            kwargs.update({
-                'crs': target_crs,
-                'transform': transform,
-                'width': width,
-                'height': height
-            })
+                # Riproietta raster
+                temp_raster = tempfile.NamedTemporaryFile(suffix='.tif', delete=False)
+                temp_raster_path = temp_raster.name
+                temp_raster.close()
             
-            with rasterio.open(temp_raster_path, 'w', **kwargs) as dst:
-                for i in range(1, raster.count + 1):
-                    reproject(
-                        source=rasterio.band(raster, i),
-                        destination=rasterio.band(dst, i),
-                        src_transform=raster.transform,
-                        src_crs=raster.crs,
-                        dst_transform=transform,
-                        dst_crs=target_crs,
-                        resampling=Resampling.bilinear)
+                transform, width, height = calculate_default_transform(
+                    raster.crs, target_crs, raster.width, raster.height, *raster.bounds)
             
-            raster.close()
-            raster = rasterio.open(temp_raster_path)
-            print("Raster riproiettato.")
+                kwargs = raster.meta.copy()
+                kwargs.update({
+                    'crs': target_crs,
+                    'transform': transform,
+                    'width': width,
+                    'height': height
+                })
             
-        else:
-            logging.error(f"Opzione di riproiezione non valida: {REPROJECTION_OPTION}")
+                with rasterio.open(temp_raster_path, 'w', **kwargs) as dst:
+                    for i in range(1, raster.count + 1):
+                        reproject(
+                            source=rasterio.band(raster, i),
+                            destination=rasterio.band(dst, i),
+                            src_transform=raster.transform,
+                            src_crs=raster.crs,
+                            dst_transform=transform,
+                            dst_crs=target_crs,
+                            resampling=Resampling.bilinear)
+            
+                raster.close()
+                raster = rasterio.open(temp_raster_path)
+                print("Raster riproiettato.")
+            
+            else:
+                logging.error(f"Opzione di riproiezione non valida: {REPROJECTION_OPTION}")
+                original_print("Elaborazione fallita - Exit code: 1")
+                sys.exit(1)
+            
+        except Exception as e:
+            logging.error(f"Errore durante la riproiezione: {e}")
             original_print("Elaborazione fallita - Exit code: 1")
             sys.exit(1)
-            
-    except Exception as e:
-        logging.error(f"Errore durante la riproiezione: {e}")
+
+    # Prepara array risultati (uno per campo, indicizzati per posizione edificio) e contatori
+    results = {field: np.zeros(len(vector), dtype=np.float64)
+               for field in ('DEPTH_MEAN', 'DEPTH_MIN', 'DEPTH_MAX', 'PERC_SUBM')}
+    heights = vector[HEIGHT_FIELD].to_numpy(dtype=np.float64)
+    areas = vector.geometry.area.to_numpy()
+    pixel_counts = np.zeros(len(vector), dtype=np.float64)
+    processed_count = 0
+    not_processed_count = 0
+
+    print(f"\nElaborazione di {len(vector)} edifici...")
+
+    buffer_distance = BUFFER_DISTANCE if BUFFER_DISTANCE is not None else abs(raster.transform[0])
+    rings = None
+    if RING_STORE_DIR:
+        # Anelli precalcolati per questo vettoriale, CRS e buffer (calcolati e archiviati se assenti)
+        ring_store = DiskCache(RING_STORE_DIR)
+        rings = load_or_build_rings(VECTOR_PATH, vector, buffer_distance, ring_store)
+        print(f"Archivio anelli: {ring_store.summary()}")
+    elif args.build_rings and not PIXEL_INDEX_DIR:
+        logging.error("--build-rings richiede RING_STORE_DIR o PIXEL_INDEX_DIR")
         original_print("Elaborazione fallita - Exit code: 1")
         sys.exit(1)
+    elif SPATIAL_SORT or ZONAL_ENGINE == "exact" or (ZONAL_ENGINE == "batch" and not PIXEL_INDEX_DIR):
+        rings = build_rings(vector.geometry, buffer_distance)
 
-# Funzione per ottenere i pixel esterni al perimetro
-def get_external_pixels(geom, raster, buffer_distance=None):
-    """
-    Estrae i valori dei pixel immediatamente esterni al perimetro del poligono
-    """
-    try:
-        # Se non specificato, usa la risoluzione del raster come buffer
-        if buffer_distance is None:
-            buffer_distance = abs(raster.transform[0])  # risoluzione pixel
-        
-        # Crea buffer esterno molto piccolo
-        external_buffer = geom.buffer(buffer_distance)
-        
-        # Crea anello: buffer esterno - poligono originale
-        ring = external_buffer.difference(geom)
-        
-        # Estrai valori raster dall'anello
-        out_image, out_transform = rasterio.mask.mask(raster, [mapping(ring)], crop=True, filled=True)
-        data = out_image[0]
-        
-        # Escludi nodata
-        valid_data = data[data != raster.nodata]
-        
-        return valid_data
-        
-    except Exception as e:
-        return np.array([])
+    # Indice pixel: con la stessa griglia raster le statistiche non richiedono geometrie
+    pixel_index = None
+    if PIXEL_INDEX_DIR and (ZONAL_ENGINE == "batch" or args.build_rings):
+        index_store = DiskCache(PIXEL_INDEX_DIR)
+        pixel_index = load_or_build_pixel_index(VECTOR_PATH, vector, raster, buffer_distance, index_store,
+                                                rings=rings, tile_memory_mb=tile_memory_mb)
+        print(f"Archivio indici pixel: {index_store.summary()}")
+
+    if args.build_rings:
+        logging.info("Anelli/indice pixel archiviati - elaborazione terminata (--build-rings)")
+        original_print("Anelli/indice pixel archiviati - Exit code: 0")
+        sys.exit(0)
+
+    if scenario_paths:
+        start = time.time()
+        table = process_scenarios(vector, raster, scenario_paths, buffer_distance,
+                                  rings=rings, pixel_index=pixel_index, tile_memory_mb=tile_memory_mb)
+        table_path = OUTPUT_PATH.replace('.shp', '_scenari.csv')
+        os.makedirs(os.path.dirname(table_path), exist_ok=True)
+        table.insert(0, *building_keys(vector))
+        table.to_csv(table_path, index=False)
+        elapsed = time.time() - start
+        print(f"\n=== RIEPILOGO MULTI-SCENARIO ===")
+        print(f"Edifici: {len(vector)} - scenari: {len(scenario_paths)}")
+        print(f"Tempo scenari: {elapsed:.1f}s ({elapsed / len(scenario_paths):.2f}s per scenario)")
+        print(f"Tabella scritta in: {table_path}")
+        raster.close()
+        if 'temp_raster_path' in locals():
+            os.unlink(temp_raster_path)
+        logging.info("Elaborazione completata con successo")
+        original_print("Elaborazione completata con successo - Exit code: 0")
+        original_print(f"Log completo disponibile in: {log_path}")
+        sys.exit(0)
 
-# Prepara lista risultati e contatori
-results = []
-processed_count = 0
-not_processed_count = 0
+    if args.temporal:
+        start = time.time()
+        print(f"Serie temporale: {raster.count} passi da {TIME_STEP_HOURS} h, soglie {DEPTH_THRESHOLDS} m")
+        table = process_temporal(vector, raster, buffer_distance, rings=rings, pixel_index=pixel_index,
+                                 tile_memory_mb=tile_memory_mb)
+        table_path = OUTPUT_PATH.replace('.shp', '_temporale.csv')
+        os.makedirs(os.path.dirname(table_path), exist_ok=True)
+        table.insert(0, *building_keys(vector))
+        table.to_csv(table_path, index=False)
+        print(f"\n=== RIEPILOGO SERIE TEMPORALE ===")
+        print(f"Edifici: {len(vector)} - edifici bagnati: {int(table['T_PEAK_H'].notna().sum())}")
+        print(f"Tempo: {time.time() - start:.1f}s")
+        print(f"Tabella scritta in: {table_path}")
+        raster.close()
+        if 'temp_raster_path' in locals():
+            os.unlink(temp_raster_path)
+        logging.info("Elaborazione completata con successo")
+        original_print("Elaborazione completata con successo - Exit code: 0")
+        original_print(f"Log completo disponibile in: {log_path}")
+        sys.exit(0)
 
-print(f"\nElaborazione di {len(vector)} edifici...")
+    # Pre-filtro: gli edifici fuori dall'estensione del raster diventano record vuoti senza accessi al raster.
+    # Il filtro è sulle geometrie già in memoria, non una lettura bbox del layer: i record vuoti mantengono
+    # geometria, area e volume nell'output, quindi tutti gli edifici vanno comunque letti
+    overlap = None
+    if BBOX_PREFILTER:
+        extent = raster_extent(raster, valid_data=BBOX_PREFILTER == "data")
+        overlap = overlapping_buildings(vector.geometry, extent,
+                                        margin=buffer_distance + abs(raster.transform[0]))
+        print(f"Pre-filtro estensione raster ({BBOX_PREFILTER}): {int(overlap.sum())}/{len(vector)} edifici "
+              f"sovrapposti, {int((~overlap).sum())} record vuoti")
 
-for idx, row in vector.iterrows():
-    geom = row.geometry
-    a_base = geom.area  # Calcola area dalla geometria
-    h_uvl = row[HEIGHT_FIELD]  # Legge altezza dal campo parametrizzato
-    vol = a_base * h_uvl
+    # Impronta bagnata: anelli in celle solo asciutte/nodata -> record a profondità zero senza campionamento
+    dry = None
+    if WET_FOOTPRINT:
+        if FOOTPRINT_CACHE_DIR and not remote_raster:
+            footprint_cache = DiskCache(FOOTPRINT_CACHE_DIR)
+            footprint = cached_wet_footprint(raster, WET_CELL_SIZE, footprint_cache)
+        else:
+            footprint = wet_footprint(raster, cell_size=WET_CELL_SIZE)
+        dry, dry_valid = dry_buildings(vector.geometry, buffer_distance, raster, footprint, WET_CELL_SIZE)
+        if overlap is not None:
+            dry &= overlap
+        print(f"Impronta bagnata: {int((footprint == FOOTPRINT_WET).sum())}/{footprint.size} celle bagnate, "
+              f"{int(dry.sum())} edifici in area asciutta/nodata ({int((dry & dry_valid).sum())} con pixel validi)")
+        overlap = ~dry if overlap is None else overlap & ~dry
+
+    # Esecuzione incrementale: edifici invariati ripresi dallo stato precedente, senza campionamento
+    reuse = None
+    if args.incremental:
+        state_path = OUTPUT_PATH.replace('.shp', '_incrementale.parquet')
+        previous, previous_meta = load_state(state_path)
+        fingerprints = building_fingerprints(vector.geometry.values, heights)
+        run_meta = run_signature(raster, ZONAL_ENGINE, buffer_distance, HEIGHT_FIELD, previous_meta,
+                                 tile_size=INCREMENTAL_TILE_SIZE)
+        # Raster riconsegnato: da ricalcolare solo gli edifici con anello sui tile modificati
+        stale = None
+        changed = changed_tiles(previous_meta, run_meta) if previous is not None else None
+        if changed:
+            n_tiles = sum(len(row) for row in run_meta['tile_checksums'])
+            tile_rings = rings if rings is not None else build_rings(vector.geometry, buffer_distance)
+            stale = stale_buildings(raster, tile_rings, changed, INCREMENTAL_TILE_SIZE)
+            print(f"Raster modificato in {len(changed)}/{n_tiles} tile: {int(stale.sum())} edifici interessati")
+        elif changed == []:
+            stale = np.zeros(len(vector), dtype=bool)
+        reuse, previous_rows, n_deleted = match_previous(fingerprints, previous, previous_meta, run_meta, stale=stale)
+        if previous is not None and changed is None:
+            print("Esecuzione incrementale: raster o parametri cambiati, ricalcolo completo")
+        if reuse.any():
+            for field in ('DEPTH_MEAN', 'DEPTH_MIN', 'DEPTH_MAX', 'PERC_SUBM'):
+                results[field][reuse] = previous[field].to_numpy()[previous_rows[reuse]]
+            pixel_counts[reuse] = previous['N_PIXELS'].to_numpy()[previous_rows[reuse]]
+        print(f"Esecuzione incrementale: {int(reuse.sum())} edifici invariati, "
+              f"{int((~reuse).sum())} nuovi/modificati da calcolare, "
+              f"{n_deleted} impronte precedenti non più presenti (edifici eliminati o modificati)")
+        overlap = ~reuse if overlap is None else overlap & ~reuse
+
+    # anelli degli edifici esclusi vuoti: nessuna rasterizzazione né lettura per questi edifici
+    engine_rings = rings if overlap is None or rings is None else np.where(overlap, rings, None)
+    if dry is not None:
+        if ZONAL_ENGINE == "mask":
+            avoided = f"{int(dry.sum())} letture per edificio (rasterio.mask)"
+        elif pixel_index is not None:
+            avoided = "nessuna (statistiche da indice pixel)"
+        elif tile_memory_mb is not None:
+            tile_shape = plan_tiles(raster, tile_memory_mb)
+            all_tiles = assign_rings_to_tiles(raster, rings, tile_shape)
+            wet_tiles = assign_rings_to_tiles(raster, engine_rings, tile_shape)
+            avoided = f"{len(all_tiles) - len(wet_tiles)}/{len(all_tiles)} tile"
+        else:
+            all_window = rings_window(raster, rings)
+            wet_window = rings_window(raster, engine_rings)
+            all_pixels = int(all_window.width * all_window.height) if all_window is not None else 0
+            wet_pixels = int(wet_window.width * wet_window.height) if wet_window is not None else 0
+            avoided = f"{all_pixels - wet_pixels}/{all_pixels} pixel della finestra di lettura"
+        print(f"Letture raster evitate dall'impronta bagnata: {avoided}")
+
+    # Contatore letture GDAL del campionamento: riapre il file raster di lavoro (eventualmente riproiettato)
+    # con opener di conteggio, dopo checksum e impronte che usano il percorso del file
+    raster_file = raster.name
+    read_counter = None
+    if COUNT_BLOCK_READS and not remote_raster:
+        read_counter = BlockReadCounter()
+        raster.close()
+        raster = read_counter.open(raster_file)
+
+    # Ordine di elaborazione lungo curva di riempimento; l'output resta nell'ordine originale
+    processing_order = np.arange(len(vector))
+    if SPATIAL_SORT:
+        processing_order = space_filling_order(rings, curve=SPATIAL_SORT)
+        print(f"Edifici ordinati lungo curva {SPATIAL_SORT} per l'elaborazione")
+
+    # Motore batch: anelli rasterizzati in griglie di etichette e statistiche in un'unica passata
+    if ZONAL_ENGINE == "batch" and pixel_index is not None:
+        ring_stats = pixel_index_stats(raster, *pixel_index, tile_memory_mb=tile_memory_mb)
+        print(f"Statistiche anelli calcolate da indice pixel per {len(vector)} edifici")
+        if args.workers > 1:
+            print("NOTA: --workers non necessario con l'indice pixel (solo letture indicizzate)")
+    elif ZONAL_ENGINE == "batch":
+        if args.workers > 1:
+            # Partizioni spaziali compatte, un handle raster in sola lettura per processo
+            ring_stats = zonal_ring_stats_parallel(raster_file, engine_rings, args.workers,
+                                                   tile_memory_mb=tile_memory_mb)
+        else:
+            ring_stats = zonal_ring_stats(raster, engine_rings, tile_memory_mb=tile_memory_mb)
+        print(f"Statistiche anelli calcolate (motore batch, {args.workers} processi) per {len(vector)} edifici")
+    elif ZONAL_ENGINE == "exact":
+        # Copertura esatta: ogni pixel toccato dall'anello pesa per la frazione di area coperta
+        ring_stats = coverage_ring_stats(raster, engine_rings, tile_memory_mb=tile_memory_mb)
+        print(f"Statistiche anelli calcolate (copertura esatta) per {len(vector)} edifici")
+        if args.workers > 1:
+            print(f"ATTENZIONE: --workers ignorato con ZONAL_ENGINE = \"{ZONAL_ENGINE}\"")
+    elif args.workers > 1:
+        print(f"ATTENZIONE: --workers ignorato con ZONAL_ENGINE = \"{ZONAL_ENGINE}\"")
+
+    for count, pos in enumerate(processing_order, 1):
+        h_uvl = heights[pos]
     
-    # Estrai valori esterni al perimetro
-    external_values = get_external_pixels(geom, raster, BUFFER_DISTANCE)
+        # Estrai valori esterni al perimetro
+        if reuse is not None and reuse[pos]:
+            n_pixels = pixel_counts[pos]
+        elif dry is not None and dry[pos]:
+            # Anello in celle asciutte/nodata: profondità zero senza campionamento, elaborato se le celle
+            # hanno pixel validi (come il campionamento, che conta i pixel a zero), per tutti i motori
+            n_pixels = int(dry_valid[pos])
+        elif ZONAL_ENGINE in ("batch", "exact"):
+            n_pixels = ring_stats['count'][pos]
+        elif overlap is not None and not overlap[pos]:
+            n_pixels = 0
+        else:
+            external_values = get_external_pixels(vector.geometry.iloc[pos], raster, BUFFER_DISTANCE,
+                                                  ring=rings[pos] if rings is not None else None)
+            n_pixels = external_values.size
     
-    if external_values.size > 0 and h_uvl > 0:
-        # Calcola statistiche di sommersione
-        depth_mean = np.mean(external_values)
-        depth_min = np.min(external_values)
-        depth_max = np.max(external_values)
+        if n_pixels > 0 and h_uvl > 0:
+            # Calcola statistiche di sommersione
+            if reuse is not None and reuse[pos]:
+                depth_mean = results['DEPTH_MEAN'][pos]
+                depth_min = results['DEPTH_MIN'][pos]
+                depth_max = results['DEPTH_MAX'][pos]
+            elif dry is not None and dry[pos]:
+                depth_mean = depth_min = depth_max = 0.0
+            elif ZONAL_ENGINE in ("batch", "exact"):
+                depth_mean = ring_stats['mean'][pos]
+                depth_min = ring_stats['min'][pos]
+                depth_max = ring_stats['max'][pos]
+            else:
+                depth_mean = np.mean(external_values)
+                depth_min = np.min(external_values)
+                depth_max = np.max(external_values)
         
-        # Calcola percentuale di sommersione basata sulla quota media
-        perc_submerged = min((depth_mean / h_uvl) * 100, 100.0)
+            # Calcola percentuale di sommersione basata sulla quota media
+            perc_submerged = min((depth_mean / h_uvl) * 100, 100.0)
         
-        processed_count += 1
+            processed_count += 1
         
-    else:
-        # Nessun dato valido o edificio con altezza zero
-        depth_mean = 0.0
-        depth_min = 0.0
-        depth_max = 0.0
-        perc_submerged = 0.0
-        not_processed_count += 1
+        else:
+            # Nessun dato valido o edificio con altezza zero
+            depth_mean = 0.0
+            depth_min = 0.0
+            depth_max = 0.0
+            perc_submerged = 0.0
+            not_processed_count += 1
     
-    results.append({
-        'A_BASE': round(a_base, 2),
-        HEIGHT_FIELD: round(h_uvl, 2),
-        'VOL': round(vol, 2),
-        'DEPTH_MEAN': round(depth_mean, 2),
-        'DEPTH_MIN': round(depth_min, 2),
-        'DEPTH_MAX': round(depth_max, 2),
-        'PERC_SUBM': round(perc_submerged, 2),
-        'geometry': geom
-    })
+        results['DEPTH_MEAN'][pos] = depth_mean
+        results['DEPTH_MIN'][pos] = depth_min
+        results['DEPTH_MAX'][pos] = depth_max
+        results['PERC_SUBM'][pos] = perc_submerged
+        pixel_counts[pos] = n_pixels
     
-    # Progress indicator
-    if (idx + 1) % 100 == 0:
-        print(f"Elaborati {idx + 1}/{len(vector)} edifici...")
-
-# Crea GeoDataFrame di output
-out_gdf = gpd.GeoDataFrame(results, crs=vector.crs)
-
-# Crea cartella output se non esiste
-os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
-
-# Definisci schema per campi con precisione limitata
-schema = {
-    'geometry': 'Polygon',
-    'properties': {
-        'A_BASE': 'float:10.2',      # 10 cifre totali, 2 decimali
-        HEIGHT_FIELD: 'float:8.2',   # 8 cifre totali, 2 decimali
-        'VOL': 'float:12.2',         # 12 cifre totali, 2 decimali
-        'DEPTH_MEAN': 'float:8.2',   # 8 cifre totali, 2 decimali
-        'DEPTH_MIN': 'float:8.2',    # 8 cifre totali, 2 decimali
-        'DEPTH_MAX': 'float:8.2',    # 8 cifre totali, 2 decimali
-        'PERC_SUBM': 'float:6.2'     # 6 cifre totali, 2 decimali
-    }
-}
-
-# Salva shapefile con schema definito
-with fiona.open(OUTPUT_PATH, 'w', driver='ESRI Shapefile', crs=out_gdf.crs, schema=schema) as f:
-    for idx, row in out_gdf.iterrows():
-        feature = {
-            'geometry': mapping(row.geometry),
-            'properties': {
-                'A_BASE': float(row['A_BASE']),
-                HEIGHT_FIELD: float(row[HEIGHT_FIELD]),
-                'VOL': float(row['VOL']),
-                'DEPTH_MEAN': float(row['DEPTH_MEAN']),
-                'DEPTH_MIN': float(row['DEPTH_MIN']),
-                'DEPTH_MAX': float(row['DEPTH_MAX']),
-                'PERC_SUBM': float(row['PERC_SUBM'])
-            }
+        # Progress indicator
+        if count % 100 == 0:
+            print(f"Elaborati {count}/{len(vector)} edifici...")
+
+    if read_counter is not None:
+        print(f"Letture GDAL sul file raster: {read_counter.reads} ({read_counter.bytes / 1024 ** 2:.1f} MB)")
+        if ZONAL_ENGINE == "batch" and args.workers > 1:
+            print("NOTA: le letture dei processi worker non sono conteggiate")
+
+    # Crea cartella output se non esiste
+    os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
+
+    # Definisci schema per campi con precisione limitata
+    schema = {
+        'geometry': 'Polygon',
+        'properties': {
+            'A_BASE': 'float:10.2',      # 10 cifre totali, 2 decimali
+            HEIGHT_FIELD: 'float:8.2',   # 8 cifre totali, 2 decimali
+            'VOL': 'float:12.2',         # 12 cifre totali, 2 decimali
+            'DEPTH_MEAN': 'float:8.2',   # 8 cifre totali, 2 decimali
+            'DEPTH_MIN': 'float:8.2',    # 8 cifre totali, 2 decimali
+            'DEPTH_MAX': 'float:8.2',    # 8 cifre totali, 2 decimali
+            'PERC_SUBM': 'float:6.2'     # 6 cifre totali, 2 decimali
         }
-        f.write(feature)
-
-# Riepilogo finale
-total_buildings = len(vector)
-print(f"\n=== RIEPILOGO ELABORAZIONE ===")
-print(f"Edifici totali: {total_buildings}")
-print(f"Elaborati con successo: {processed_count}")
-print(f"Non processati: {not_processed_count}")
-print(f"Output scritto in: {OUTPUT_PATH}")
-
-# Calcola statistiche per il report
-if processed_count > 0:
-    processed_data = out_gdf[out_gdf['DEPTH_MEAN'] > 0]
+    }
+
+    # Valori di output arrotondati, in ordine originale (riusati da shapefile, output colonnare e report),
+    # preceduti dalla chiave del layer (FID di input o, in sua assenza, posizione 1..n)
+    key_field, key_values = building_keys(vector)
+    out_table = pd.DataFrame({
+        key_field: key_values,
+        'A_BASE': np.round(areas, 2),
+        HEIGHT_FIELD: np.round(heights, 2),
+        'VOL': np.round(areas * heights, 2),
+        'DEPTH_MEAN': np.round(results['DEPTH_MEAN'], 2),
+        'DEPTH_MIN': np.round(results['DEPTH_MIN'], 2),
+        'DEPTH_MAX': np.round(results['DEPTH_MAX'], 2),
+        'PERC_SUBM': np.round(results['PERC_SUBM'], 2),
+    })
+    geometries = vector.geometry.values
+
+    # Salva shapefile in streaming: record scritti a blocchi di OUTPUT_CHUNK_SIZE in ordine originale
+    if WRITE_SHAPEFILE:
+        columns = {field: out_table[field].to_numpy() for field in schema['properties']}
+        with fiona.open(OUTPUT_PATH, 'w', driver='ESRI Shapefile', crs=vector.crs, schema=schema) as f:
+            for start in range(0, len(vector), OUTPUT_CHUNK_SIZE):
+                stop = min(start + OUTPUT_CHUNK_SIZE, len(vector))
+                f.writerecords(
+                    {'geometry': mapping(geometries[pos]),
+                     'properties': {field: float(values[pos]) for field, values in columns.items()}}
+                    for pos in range(start, stop))
+
+    # Output colonnare scritto in blocco dagli array dei risultati (geometria WKB, nessuna conversione WKT)
+    if COLUMNAR_OUTPUT == "attributes":
+        # Solo chiavi e metriche: nessuna serializzazione delle geometrie
+        columnar_path = os.path.splitext(OUTPUT_PATH)[0] + '_attributi.feather'
+        out_table.to_feather(columnar_path, compression='zstd')
+        print(f"Output solo attributi scritto in: {columnar_path}")
+    elif COLUMNAR_OUTPUT:
+        columnar_path = os.path.splitext(OUTPUT_PATH)[0] + ('.parquet' if COLUMNAR_OUTPUT == "parquet" else '.feather')
+        columnar_gdf = gpd.GeoDataFrame(out_table, geometry=geometries, crs=vector.crs)
+        if COLUMNAR_OUTPUT == "parquet":
+            columnar_gdf.to_parquet(columnar_path, index=False, geometry_encoding='WKB')
+        else:
+            columnar_gdf.to_feather(columnar_path, index=False)
+        print(f"Output colonnare ({COLUMNAR_OUTPUT}) scritto in: {columnar_path}")
+
+    # Stato per la prossima esecuzione incrementale (metriche non arrotondate), dopo la scrittura dell'output
+    if args.incremental:
+        save_state(state_path, fingerprints, {**results, 'N_PIXELS': pixel_counts}, run_meta)
+        print(f"Stato incrementale scritto in: {state_path}")
+
+    # Inviluppo convesso degli edifici con sommersione (area analizzata nel report), a blocchi
+    processed_hull = None
+    wet_mask = out_table['DEPTH_MEAN'].to_numpy() > 0
+    for start in range(0, len(vector), OUTPUT_CHUNK_SIZE):
+        wet = geometries[start:start + OUTPUT_CHUNK_SIZE][wet_mask[start:start + OUTPUT_CHUNK_SIZE]]
+        if len(wet) > 0:
+            parts = [shapely.geometrycollections(wet)] + ([processed_hull] if processed_hull is not None else [])
+            processed_hull = shapely.convex_hull(shapely.geometrycollections(parts))
+
+    # Riepilogo finale
+    total_buildings = len(vector)
+    print(f"\n=== RIEPILOGO ELABORAZIONE ===")
+    print(f"Edifici totali: {total_buildings}")
+    print(f"Elaborati con successo: {processed_count}")
+    print(f"Non processati: {not_processed_count}")
+    if dry is not None:
+        print(f"Edifici in area asciutta/nodata (profondità zero, non campionati): {int(dry.sum())}, "
+              f"di cui {int((dry & dry_valid).sum())} con pixel validi")
+    if reuse is not None:
+        print(f"Risultati ripresi dall'esecuzione precedente: {int(reuse.sum())} edifici")
+    if WRITE_SHAPEFILE:
+        print(f"Output scritto in: {OUTPUT_PATH}")
+
+    # Calcola statistiche per il report
+    if processed_count > 0:
+        processed_data = out_table[out_table['DEPTH_MEAN'] > 0]
     
-    if len(processed_data) > 0:
-        # Statistiche sui livelli di sommersione
-        mean_depth_avg = processed_data['DEPTH_MEAN'].mean()
-        max_depth_avg = processed_data['DEPTH_MEAN'].max()
-        min_depth_avg = processed_data['DEPTH_MEAN'].min()
+        if len(processed_data) > 0:
+            # Statistiche sui livelli di sommersione
+            mean_depth_avg = processed_data['DEPTH_MEAN'].mean()
+            max_depth_avg = processed_data['DEPTH_MEAN'].max()
+            min_depth_avg = processed_data['DEPTH_MEAN'].min()
         
-        mean_depth_max = processed_data['DEPTH_MAX'].mean()
-        max_depth_max = processed_data['DEPTH_MAX'].max()
-        min_depth_max = processed_data['DEPTH_MAX'].min()
+            mean_depth_max = processed_data['DEPTH_MAX'].mean()
+            max_depth_max = processed_data['DEPTH_MAX'].max()
+            min_depth_max = processed_data['DEPTH_MAX'].min()
         
-        # Statistiche percentuali sommersione
-        mean_perc_subm = processed_data['PERC_SUBM'].mean()
-        max_perc_subm = processed_data['PERC_SUBM'].max()
-        min_perc_subm = processed_data['PERC_SUBM'].min()
-        median_perc_subm = processed_data['PERC_SUBM'].median()
-        std_perc_subm = processed_data['PERC_SUBM'].std()
+            # Statistiche percentuali sommersione
+            mean_perc_subm = processed_data['PERC_SUBM'].mean()
+            max_perc_subm = processed_data['PERC_SUBM'].max()
+            min_perc_subm = processed_data['PERC_SUBM'].min()
+            median_perc_subm = processed_data['PERC_SUBM'].median()
+            std_perc_subm = processed_data['PERC_SUBM'].std()
         
-        # Statistiche edifici
-        mean_altezza = processed_data[HEIGHT_FIELD].mean()
-        max_altezza = processed_data[HEIGHT_FIELD].max()
-        min_altezza = processed_data[HEIGHT_FIELD].min()
+            # Statistiche edifici
+            mean_altezza = processed_data[HEIGHT_FIELD].mean()
+            max_altezza = processed_data[HEIGHT_FIELD].max()
+            min_altezza = processed_data[HEIGHT_FIELD].min()
         
-        mean_area = processed_data['A_BASE'].mean()
-        max_area = processed_data['A_BASE'].max()
-        min_area = processed_data['A_BASE'].min()
+            mean_area = processed_data['A_BASE'].mean()
+            max_area = processed_data['A_BASE'].max()
+            min_area = processed_data['A_BASE'].min()
         
-        # Classificazione edifici per livello di sommersione
-        edifici_bassi = len(processed_data[processed_data['PERC_SUBM'] < 25])
-        edifici_medi = len(processed_data[(processed_data['PERC_SUBM'] >= 25) & (processed_data['PERC_SUBM'] < 75)])
-        edifici_alti = len(processed_data[(processed_data['PERC_SUBM'] >= 75) & (processed_data['PERC_SUBM'] < 100)])
-        edifici_totali = len(processed_data[processed_data['PERC_SUBM'] >= 100])
+            # Classificazione edifici per livello di sommersione
+            edifici_bassi = len(processed_data[processed_data['PERC_SUBM'] < 25])
+            edifici_medi = len(processed_data[(processed_data['PERC_SUBM'] >= 25) & (processed_data['PERC_SUBM'] < 75)])
+            edifici_alti = len(processed_data[(processed_data['PERC_SUBM'] >= 75) & (processed_data['PERC_SUBM'] < 100)])
+            edifici_totali = len(processed_data[processed_data['PERC_SUBM'] >= 100])
         
-        # Correlazioni e analisi avanzate
-        correlazione_altezza_sommersione = processed_data[HEIGHT_FIELD].corr(processed_data['PERC_SUBM'])
-        correlazione_area_sommersione = processed_data['A_BASE'].corr(processed_data['PERC_SUBM'])
+            # Correlazioni e analisi avanzate
+            correlazione_altezza_sommersione = processed_data[HEIGHT_FIELD].corr(processed_data['PERC_SUBM'])
+            correlazione_area_sommersione = processed_data['A_BASE'].corr(processed_data['PERC_SUBM'])
         
-        # Statistiche di variabilità delle profondità
-        range_profondita = processed_data['DEPTH_MAX'] - processed_data['DEPTH_MIN']
-        variabilita_media = range_profondita.mean()
-        variabilita_max = range_profondita.max()
+            # Statistiche di variabilità delle profondità
+            range_profondita = processed_data['DEPTH_MAX'] - processed_data['DEPTH_MIN']
+            variabilita_media = range_profondita.mean()
+            variabilita_max = range_profondita.max()
         
-        # Percentili di interesse
-        perc_25 = processed_data['PERC_SUBM'].quantile(0.25)
-        perc_75 = processed_data['PERC_SUBM'].quantile(0.75)
-        perc_90 = processed_data['PERC_SUBM'].quantile(0.90)
-        perc_95 = processed_data['PERC_SUBM'].quantile(0.95)
+            # Percentili di interesse
+            perc_25 = processed_data['PERC_SUBM'].quantile(0.25)
+            perc_75 = processed_data['PERC_SUBM'].quantile(0.75)
+            perc_90 = processed_data['PERC_SUBM'].quantile(0.90)
+            perc_95 = processed_data['PERC_SUBM'].quantile(0.95)
         
-        # Densità edifici per gravità danneggiamento
-        # Calcola area geografica con convex hull degli edifici analizzati
-        edifici_geometrie = processed_data.geometry
-        convex_hull = unary_union(edifici_geometrie).convex_hull
-        superficie_totale_analizzata = convex_hull.area / 10000  # in ettari
-        densita_edifici_critici = len(processed_data[processed_data['PERC_SUBM'] >= 50]) / superficie_totale_analizzata if superficie_totale_analizzata > 0 else 0
+            # Densità edifici per gravità danneggiamento
+            # Calcola area geografica con convex hull degli edifici analizzati
+            convex_hull = processed_hull
+            superficie_totale_analizzata = convex_hull.area / 10000  # in ettari
+            densita_edifici_critici = len(processed_data[processed_data['PERC_SUBM'] >= 50]) / superficie_totale_analizzata if superficie_totale_analizzata > 0 else 0
         
-        # Volume teorico acqua nell'area edifici (approssimativo)
-        volume_acqua_stimato = (processed_data['DEPTH_MEAN'] * processed_data['A_BASE']).sum()
+            # Volume teorico acqua nell'area edifici (approssimativo)
+            volume_acqua_stimato = (processed_data['DEPTH_MEAN'] * processed_data['A_BASE']).sum()
         
-        # Crea report TXT
-        report_path = OUTPUT_PATH.replace('.shp', '_report.txt')
-        with open(report_path, 'w', encoding='utf-8') as f:
-            f.write("=== REPORT ANALISI SOMMERSIONE EDIFICI ===\n\n")
-            f.write(f"Data elaborazione: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"Versione script: wd_estimation.py\n")
-            f.write(f"Campo altezza utilizzato: {HEIGHT_FIELD}\n")
-            f.write(f"Opzione riproiezione: {REPROJECTION_OPTION} ")
-            if REPROJECTION_OPTION == 1:
-                f.write("(riproietta vettoriale)\n")
-            elif REPROJECTION_OPTION == 2:
-                f.write("(riproietta raster)\n")
-            else:
-                f.write(f"(riproietta entrambi in {TARGET_EPSG})\n")
-            f.write("\n")
+            # Crea report TXT
+            report_path = OUTPUT_PATH.replace('.shp', '_report.txt')
+            with open(report_path, 'w', encoding='utf-8') as f:
+                f.write("=== REPORT ANALISI SOMMERSIONE EDIFICI ===\n\n")
+                f.write(f"Data elaborazione: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+                f.write(f"Versione script: wd_estimation.py\n")
+                f.write(f"Campo altezza utilizzato: {HEIGHT_FIELD}\n")
+                f.write(f"Opzione riproiezione: {REPROJECTION_OPTION} ")
+                if REPROJECTION_OPTION == 1:
+                    f.write("(riproietta vettoriale)\n")
+                elif REPROJECTION_OPTION == 2:
+                    f.write("(riproietta raster)\n")
+                else:
+                    f.write(f"(riproietta entrambi in {TARGET_EPSG})\n")
+                f.write("\n")
             
-            f.write("=== FILE DI INPUT/OUTPUT ===\n")
-            f.write(f"File vettoriale: {VECTOR_PATH}\n")
-            f.write(f"File raster: {RASTER_PATH}\n")
-            f.write(f"File output: {OUTPUT_PATH}\n")
-            f.write(f"File report: {report_path}\n")
-            f.write(f"File log: {log_path}\n\n")
+                f.write("=== FILE DI INPUT/OUTPUT ===\n")
+                f.write(f"File vettoriale: {VECTOR_PATH}\n")
+                f.write(f"File raster: {RASTER_PATH}\n")
+                f.write(f"File output: {OUTPUT_PATH}\n")
+                f.write(f"File report: {report_path}\n")
+                f.write(f"File log: {log_path}\n\n")
             
-            f.write("=== SISTEMI DI RIFERIMENTO ===\n")
-            f.write(f"CRS vettoriale originale: {vector_crs}\n")
-            f.write(f"CRS raster: {raster_crs}\n")
-            if vector_crs != raster_crs:
-                f.write("NOTA: Sistemi di riferimento diversi - applicata riproiezione automatica\n")
-            else:
-                f.write("NOTA: Sistemi di riferimento coincidenti - nessuna riproiezione necessaria\n")
-            f.write("\n")
+                f.write("=== SISTEMI DI RIFERIMENTO ===\n")
+                f.write(f"CRS vettoriale originale: {vector_crs}\n")
+                f.write(f"CRS raster: {raster_crs}\n")
+                if vector_crs != raster_crs:
+                    f.write("NOTA: Sistemi di riferimento diversi - applicata riproiezione automatica\n")
+                else:
+                    f.write("NOTA: Sistemi di riferimento coincidenti - nessuna riproiezione necessaria\n")
+                f.write("\n")
             
-            f.write("=== RIEPILOGO ELABORAZIONE ===\n")
-            f.write(f"Edifici totali nel vettoriale: {total_buildings}\n")
-            f.write(f"Edifici processati con successo: {processed_count} ({processed_count/total_buildings*100:.1f}%)\n")
-            f.write(f"Edifici con sommersione rilevata: {len(processed_data)} ({len(processed_data)/total_buildings*100:.1f}%)\n")
-            f.write(f"Edifici non processati: {not_processed_count} ({not_processed_count/total_buildings*100:.1f}%)\n")
-            f.write(f"  - Cause: senza sovrapposizione con raster, altezza zero/negativa, errori geometrici\n\n")
+                f.write("=== RIEPILOGO ELABORAZIONE ===\n")
+                f.write(f"Edifici totali nel vettoriale: {total_buildings}\n")
+                f.write(f"Edifici processati con successo: {processed_count} ({processed_count/total_buildings*100:.1f}%)\n")
+                f.write(f"Edifici con sommersione rilevata: {len(processed_data)} ({len(processed_data)/total_buildings*100:.1f}%)\n")
+                f.write(f"Edifici non processati: {not_processed_count} ({not_processed_count/total_buildings*100:.1f}%)\n")
+                f.write(f"  - Cause: senza sovrapposizione con raster, altezza zero/negativa, errori geometrici\n\n")
             
-            f.write("=== METODOLOGIA ===\n")
-            f.write("L'analisi calcola la sommersione degli edifici campionando i valori di profondità\n")
-            f.write("dell'acqua nei pixel esterni al perimetro di ciascun edificio (buffer di 1 pixel).\n")
-            f.write("La percentuale di sommersione è calcolata come: (profondità_media / altezza_edificio) × 100\n")
-            f.write("I valori sono limitati al 100% per edifici completamente sommersi.\n\n")
+                f.write("=== METODOLOGIA ===\n")
+                f.write("L'analisi calcola la sommersione degli edifici campionando i valori di profondità\n")
+                f.write("dell'acqua nei pixel esterni al perimetro di ciascun edificio (buffer di 1 pixel).\n")
+                f.write("La percentuale di sommersione è calcolata come: (profondità_media / altezza_edificio) × 100\n")
+                f.write("I valori sono limitati al 100% per edifici completamente sommersi.\n\n")
             
-            f.write("=== PROFONDITÀ ACQUA ===\n")
-            f.write(f"Profondità media: {mean_depth_avg:.2f} m (range: {min_depth_avg:.2f} - {max_depth_avg:.2f} m)\n")
-            f.write(f"Profondità massima rilevata: {max_depth_max:.2f} m\n\n")
+                f.write("=== PROFONDITÀ ACQUA ===\n")
+                f.write(f"Profondità media: {mean_depth_avg:.2f} m (range: {min_depth_avg:.2f} - {max_depth_avg:.2f} m)\n")
+                f.write(f"Profondità massima rilevata: {max_depth_max:.2f} m\n\n")
             
-            f.write("=== CARATTERISTICHE TERRITORIO ===\n")
-            f.write(f"Area geografica analizzata (convex hull): {superficie_totale_analizzata:.1f} ettari\n")
-            f.write(f"Edifici con danno significativo (≥50%): {len(processed_data[processed_data['PERC_SUBM'] >= 50])} su {len(processed_data)}\n")
-            f.write(f"Densità edifici critici: {densita_edifici_critici:.1f} edifici/ettaro\n")
-            f.write(f"Altezza media edifici: {mean_altezza:.1f} m (range: {min_altezza:.1f} - {max_altezza:.1f} m)\n\n")
+                f.write("=== CARATTERISTICHE TERRITORIO ===\n")
+                f.write(f"Area geografica analizzata (convex hull): {superficie_totale_analizzata:.1f} ettari\n")
+                f.write(f"Edifici con danno significativo (≥50%): {len(processed_data[processed_data['PERC_SUBM'] >= 50])} su {len(processed_data)}\n")
+                f.write(f"Densità edifici critici: {densita_edifici_critici:.1f} edifici/ettaro\n")
+                f.write(f"Altezza media edifici: {mean_altezza:.1f} m (range: {min_altezza:.1f} - {max_altezza:.1f} m)\n\n")
             
-            f.write("=== CLASSIFICAZIONE EDIFICI PER LIVELLO SOMMERSIONE ===\n")
-            f.write(f"Sommersione bassa (<25%): {edifici_bassi} edifici ({edifici_bassi/len(processed_data)*100:.1f}%)\n")
-            f.write(f"Sommersione media (25-75%): {edifici_medi} edifici ({edifici_medi/len(processed_data)*100:.1f}%)\n")
-            f.write(f"Sommersione alta (75-99%): {edifici_alti} edifici ({edifici_alti/len(processed_data)*100:.1f}%)\n")
-            f.write(f"Completamente sommersi (≥100%): {edifici_totali} edifici ({edifici_totali/len(processed_data)*100:.1f}%)\n\n")
+                f.write("=== CLASSIFICAZIONE EDIFICI PER LIVELLO SOMMERSIONE ===\n")
+                f.write(f"Sommersione bassa (<25%): {edifici_bassi} edifici ({edifici_bassi/len(processed_data)*100:.1f}%)\n")
+                f.write(f"Sommersione media (25-75%): {edifici_medi} edifici ({edifici_medi/len(processed_data)*100:.1f}%)\n")
+                f.write(f"Sommersione alta (75-99%): {edifici_alti} edifici ({edifici_alti/len(processed_data)*100:.1f}%)\n")
+                f.write(f"Completamente sommersi (≥100%): {edifici_totali} edifici ({edifici_totali/len(processed_data)*100:.1f}%)\n\n")
             
-            f.write("=== CAMPI OUTPUT SHAPEFILE ===\n")
-            f.write("DEPTH_AVG: Profondità media dell'acqua attorno all'edificio (m)\n")
-            f.write("DEPTH_MAX: Profondità massima dell'acqua attorno all'edificio (m)\n")
-            f.write("DEPTH_MIN: Profondità minima dell'acqua attorno all'edificio (m)\n")
-            f.write("PERC_SUBM: Percentuale di sommersione dell'edificio (%)\n")
-            f.write(f"{HEIGHT_FIELD}: Altezza dell'edificio utilizzata nel calcolo (m)\n")
-            f.write("AREA_BASE: Area della base dell'edificio (m²)\n")
-            f.write("+ tutti i campi originali del vettoriale di input\n")
+                f.write("=== CAMPI OUTPUT SHAPEFILE ===\n")
+                f.write("DEPTH_AVG: Profondità media dell'acqua attorno all'edificio (m)\n")
+                f.write("DEPTH_MAX: Profondità massima dell'acqua attorno all'edificio (m)\n")
+                f.write("DEPTH_MIN: Profondità minima dell'acqua attorno all'edificio (m)\n")
+                f.write("PERC_SUBM: Percentuale di sommersione dell'edificio (%)\n")
+                f.write(f"{HEIGHT_FIELD}: Altezza dell'edificio utilizzata nel calcolo (m)\n")
+                f.write("AREA_BASE: Area della base dell'edificio (m²)\n")
+                f.write("+ tutti i campi originali del vettoriale di input\n")
             
-        print(f"Report statistico scritto in: {report_path}")
-
-# Pulizia file temporaneo se creato
-if 'temp_raster_path' in locals():
-    raster.close()
-    os.unlink(temp_raster_path)
-
-# Exit code finale
-logging.info("Elaborazione completata con successo")
-original_print("Elaborazione completata con successo - Exit code: 0")
-original_print(f"Log completo disponibile in: {log_path}")
-sys.exit(0)
+            print(f"Report statistico scritto in: {report_path}")
+
+    # Pulizia file temporaneo se creato
+    if 'temp_raster_path' in locals():
+        raster.close()
+        os.unlink(temp_raster_path)
+
+    # Exit code finale
+    logging.info("Elaborazione completata con successo")
+    original_print("Elaborazione completata con successo - Exit code: 0")
+    original_print(f"Log completo disponibile in: {log_path}")
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+ESECUZIONE INCREMENTALE
+Conserva accanto all'output lo stato dell'ultima esecuzione (impronta per
+edificio e metriche non arrotondate) per ricalcolare, al successivo
+aggiornamento del catasto edifici, solo gli edifici nuovi o modificati.
+
+Impronta edificio: hash di geometria (WKB, nel CRS di elaborazione) e
+altezza. I parametri dell'esecuzione (griglia e nodata del raster, motore
+zonale, buffer, campo altezza) sono registrati nei metadati dello stato:
+se cambiano, nessun risultato precedente viene riusato. Gli edifici
+eliminati dal vettoriale non compaiono nel nuovo output.
+
+Se il raster viene riconsegnato con modifiche limitate a una sotto-area,
+i checksum per tile dei valori (registrati nello stato) individuano i tile
+modificati: vengono ricalcolati solo gli edifici con anello su quei tile.
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+import shapely
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from wd_engine import assign_rings_to_tiles, grid_signature, tile_checksums
+
+logger = logging.getLogger(__name__)
+
+STATE_METADATA_KEY = b'wd_incremental'
+STATE_FIELDS = ('DEPTH_MEAN', 'DEPTH_MIN', 'DEPTH_MAX', 'PERC_SUBM', 'N_PIXELS')
+CHUNK_SIZE = 8 * 1024 * 1024
+TILE_SIZE = 512
+
+
+def building_fingerprints(geometries, heights):
+    """
+    Impronta di ciascun edificio (BLAKE2b a 128 bit, esadecimale)
+
+    Parametri:
+    - geometries: array di geometrie (CRS di elaborazione)
+    - heights: array delle altezze (campo HEIGHT_FIELD)
+    """
+    wkb = shapely.to_wkb(np.asarray(geometries), output_dimension=2, include_srid=False)
+    heights = np.asarray(heights, dtype='<f8')
+    return np.array([hashlib.blake2b(geometry + height.tobytes(), digest_size=16).hexdigest()
+                     for geometry, height in zip(wkb, heights)], dtype=object)
+
+
+def raster_checksum(path, previous_meta=None):
+    """
+    SHA-256 del file raster, riusando quello dello stato precedente se
+    percorso, dimensione e data di modifica non sono cambiati
+    """
+    stat = os.stat(path)
+    file_stat = [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+    if previous_meta and previous_meta.get('raster_stat') == file_stat:
+        return previous_meta['raster_checksum'], file_stat
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest(), file_stat
+
+
+def run_signature(raster, engine, buffer_distance, height_field, previous_meta=None, tile_size=TILE_SIZE):
+    """
+    Metadati dell'esecuzione
+
+    Parametri:
+    - tile_size: lato dei tile di checksum in pixel (None = nessun checksum
+      per tile: un raster modificato invalida tutti i risultati)
+
+    Ritorna:
+    - dizionario serializzabile JSON: 'run' = parametri che invalidano tutti
+      i risultati se cambiano, checksum del file raster (con memo per
+      dimensione/data di modifica) e checksum dei tile
+    """
+    checksum, file_stat = raster_checksum(raster.name, previous_meta)
+    run = {
+        'grid': [str(value) for value in grid_signature(raster)],
+        'nodata': repr(raster.nodata),
+        'engine': engine,
+        'buffer_distance': repr(float(buffer_distance)),
+        'height_field': height_field,
+    }
+
+    tiles = None
+    if tile_size:
+        previous_meta = previous_meta or {}
+        if (previous_meta.get('raster_checksum') == checksum and previous_meta.get('run') == run
+                and previous_meta.get('tile_size') == tile_size):
+            # raster invariato: checksum dei tile dallo stato precedente, nessuna lettura
+            tiles = previous_meta['tile_checksums']
+        else:
+            tiles = tile_checksums(raster, tile_size).tolist()
+    return {
+        'run': run,
+        'raster_checksum': checksum,
+        'raster_stat': file_stat,
+        'tile_size': tile_size,
+        'tile_checksums': tiles,
+    }
+
+
+def changed_tiles(previous_meta, meta):
+    """
+    Tile raster modificati rispetto all'esecuzione precedente
+
+    Ritorna:
+    - lista di chiavi (tile_row, tile_col), vuota se il raster è invariato;
+      None se i checksum non sono confrontabili (assenti, griglia o parametri diversi)
+    """
+    if previous_meta.get('run') != meta['run']:
+        return None
+    if previous_meta.get('raster_checksum') == meta['raster_checksum']:
+        return []
+    previous_tiles, tiles = previous_meta.get('tile_checksums'), meta['tile_checksums']
+    if previous_tiles is None or tiles is None or previous_meta.get('tile_size') != meta['tile_size']:
+        return None
+    changed = np.argwhere(np.asarray(previous_tiles, dtype=object) != np.asarray(tiles, dtype=object))
+    return [(int(tr), int(tc)) for tr, tc in changed]
+
+
+def stale_buildings(raster, rings, changed, tile_size):
+    """
+    Edifici con anello (bounding box + 1 pixel) su almeno un tile modificato
+
+    Ritorna:
+    - array bool (True = da ricalcolare)
+    """
+    stale = np.zeros(len(rings), dtype=bool)
+    if changed:
+        tiles = assign_rings_to_tiles(raster, rings, (tile_size, tile_size))
+        for key in changed:
+            stale[tiles.get(key, [])] = True
+    return stale
+
+
+def load_state(path):
+    """
+    Stato dell'esecuzione precedente
+
+    Ritorna:
+    - tuple (DataFrame con FINGERPRINT e STATE_FIELDS, metadati) oppure (None, {})
+    """
+    if pq is None or not os.path.exists(path):
+        return None, {}
+    try:
+        table = pq.read_table(path)
+        meta = json.loads((table.schema.metadata or {}).get(STATE_METADATA_KEY, b'{}'))
+        return table.to_pandas(), meta
+    except (OSError, ValueError, pa.ArrowException) as e:
+        logger.warning(f"Stato incrementale non leggibile ({e}): ricalcolo completo")
+        return None, {}
+
+
+def save_state(path, fingerprints, values, meta):
+    """
+    Scrive lo stato dell'esecuzione (scrittura atomica)
+
+    Parametri:
+    - path: file di stato (.parquet)
+    - fingerprints: impronte degli edifici (da building_fingerprints)
+    - values: dizionario {campo: array} con i campi STATE_FIELDS, non arrotondati
+    - meta: metadati da run_signature()
+    """
+    if pq is None:
+        logger.warning("pyarrow non disponibile: stato incrementale non salvato")
+        return None
+    frame = pd.DataFrame({'FINGERPRINT': fingerprints, **{field: values[field] for field in STATE_FIELDS}})
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                           STATE_METADATA_KEY: json.dumps(meta).encode('utf-8')})
+    tmp_path = path + '.tmp'
+    pq.write_table(table, tmp_path, compression='zstd')
+    os.replace(tmp_path, path)
+    return path
+
+
+def match_previous(fingerprints, previous, previous_meta, meta, stale=None):
+    """
+    Edifici riusabili dall'esecuzione precedente
+
+    Parametri:
+    - stale: edifici su tile raster modificati (da stale_buildings); None se
+      i tile non sono confrontabili: con raster modificato nessun riuso
+
+    Ritorna:
+    - reuse: array bool (True = edificio invariato, risultati riusati)
+    - previous_rows: riga dello stato precedente per ciascun edificio (-1 = da calcolare)
+    - n_deleted: edifici dello stato precedente assenti dal vettoriale attuale
+    """
+    n = len(fingerprints)
+    if previous is None:
+        return np.zeros(n, dtype=bool), np.full(n, -1, dtype=np.int64), 0
+    n_deleted = int((~previous['FINGERPRINT'].isin(fingerprints)).sum())
+    raster_changed = previous_meta.get('raster_checksum') != meta['raster_checksum']
+    if previous_meta.get('run') != meta['run'] or (raster_changed and stale is None):
+        return np.zeros(n, dtype=bool), np.full(n, -1, dtype=np.int64), n_deleted
+
+    # impronte duplicate (geometria e altezza identiche) hanno gli stessi risultati
+    unique = previous['FINGERPRINT'].drop_duplicates()
+    found = pd.Index(unique).get_indexer(fingerprints)
+    previous_rows = np.where(found >= 0, unique.index.to_numpy()[found], -1).astype(np.int64)
+    if raster_changed:
+        previous_rows[stale] = -1
+    return previous_rows >= 0, previous_rows, n_deleted
@@ -0,0 +1,180 @@
+"""
+LETTURA VETTORIALE EDIFICI
+Carica dal vettoriale edifici solo le colonne usate dall'analisi (geometria,
+campo altezza, eventuale FID) invece di tutti gli attributi del layer DBTR.
+
+Formati: shapefile, GeoPackage e gli altri formati OGR tramite pyogrio (con
+trasferimento Arrow se pyarrow è disponibile, fiona altrimenti); GeoParquet
+letto direttamente con proiezione delle colonne.
+
+Le consegne DBTR zippate (es. DATI/ZIP/downloadDBTR_312556.zip, con lo zip
+dei dati annidato) sono lette direttamente dall'archivio tramite i percorsi
+virtuali GDAL /vsizip, senza estrazione su disco.
+"""
+
+import json
+import logging
+import os
+import zipfile
+
+import geopandas as gpd
+import numpy as np
+
+try:
+    import pyogrio
+except ImportError:
+    pyogrio = None
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+PARQUET_EXTENSIONS = ('.parquet', '.geoparquet')
+KEY_FIELDS = ('FID',)
+ZIP_LAYER = 'V_UVL_GPG'  # layer DBTR delle unità volumetriche
+
+
+def is_parquet(path):
+    """True se il percorso è un file GeoParquet"""
+    return path.lower().endswith(PARQUET_EXTENSIONS)
+
+
+def is_zip(path):
+    """True se il percorso è un archivio zip o un percorso virtuale /vsizip"""
+    return path.lower().endswith('.zip') or path.startswith('/vsizip/')
+
+
+def _find_zip_member(archive, filename):
+    """Catena di membri fino al file cercato, entrando negli zip annidati (None se assente)"""
+    names = archive.namelist()
+    for name in names:
+        if os.path.basename(name).lower() == filename.lower():
+            return [name]
+    for name in names:
+        if name.lower().endswith('.zip'):
+            # lo zip annidato è letto in streaming dall'archivio esterno, senza estrazione
+            with archive.open(name) as inner_file, zipfile.ZipFile(inner_file) as inner:
+                found = _find_zip_member(inner, filename)
+            if found:
+                return [name] + found
+    return None
+
+
+def zip_vector_path(path, layer=ZIP_LAYER):
+    """
+    Percorso GDAL /vsizip dello shapefile del layer dentro l'archivio zip
+
+    Parametri:
+    - path: archivio zip (i percorsi /vsizip sono restituiti invariati)
+    - layer: nome del layer DBTR (es. V_UVL_GPG)
+    """
+    if path.startswith('/vsizip/'):
+        return path
+    with zipfile.ZipFile(path) as archive:
+        members = _find_zip_member(archive, f"{layer}.shp")
+    if members is None:
+        raise FileNotFoundError(f"Layer {layer} non trovato nell'archivio {path}")
+    container = os.path.abspath(path)
+    for member in members:
+        container = f"/vsizip/{{{container}}}/{member}"
+    return container
+
+
+def archive_path(path):
+    """File locale che contiene i dati: l'archivio più esterno per i percorsi /vsizip"""
+    while path.startswith('/vsizip/'):
+        path = path[len('/vsizip/'):]
+        if path.startswith('{'):
+            depth = 0
+            for pos, char in enumerate(path):
+                depth += {'{': 1, '}': -1}.get(char, 0)
+                if depth == 0:
+                    path = path[1:pos]
+                    break
+        else:
+            path = path[:path.lower().index('.zip') + len('.zip')]
+    return path
+
+
+def _parquet_geometry_column(path):
+    """Colonna geometria principale dai metadati GeoParquet ('geo')"""
+    metadata = pq.read_schema(path).metadata or {}
+    geo = json.loads(metadata.get(b'geo', b'{}'))
+    return geo.get('primary_column', 'geometry')
+
+
+def list_fields(path, zip_layer=ZIP_LAYER):
+    """Campi attributo del vettoriale (senza leggere i dati)"""
+    if is_zip(path):
+        path = zip_vector_path(path, zip_layer)
+    if is_parquet(path):
+        geometry_column = _parquet_geometry_column(path)
+        return [name for name in pq.read_schema(path).names if name != geometry_column]
+    if pyogrio is not None:
+        return list(pyogrio.read_info(path)['fields'])
+    import fiona
+    with fiona.open(path) as src:
+        return list(src.schema['properties'])
+
+
+def projected_columns(fields, height_field, key_fields=KEY_FIELDS):
+    """Campi da leggere: campo altezza e campi chiave (confronto case-insensitive)"""
+    keys = {field.upper() for field in key_fields}
+    return [field for field in fields if field == height_field or field.upper() in keys]
+
+
+def building_keys(vector, key_fields=KEY_FIELDS):
+    """
+    Chiave degli edifici per gli output (shapefile, colonnari, CSV)
+
+    Parametri:
+    - vector: GeoDataFrame letto con read_buildings
+    - key_fields: campi identificativi in ordine di preferenza (confronto case-insensitive)
+
+    Ritorna:
+    - (nome colonna, valori): il primo campo chiave presente nel layer, altrimenti
+      'FID' generato dalla posizione (1..n, come nel notebook)
+    """
+    columns = {column.upper(): column for column in vector.columns}
+    for field in key_fields:
+        if field.upper() in columns:
+            column = columns[field.upper()]
+            return column, vector[column].to_numpy()
+    logger.info("Campo FID assente nel vettoriale: chiave generata dalla posizione (1..n)")
+    return 'FID', np.arange(1, len(vector) + 1, dtype=np.int64)
+
+
+def read_buildings(path, height_field, key_fields=KEY_FIELDS, zip_layer=ZIP_LAYER):
+    """
+    Legge il vettoriale edifici con le sole colonne necessarie
+
+    Parametri:
+    - path: shapefile, GeoPackage, GeoParquet, archivio zip DBTR o altro formato OGR
+    - height_field: campo altezza edifici
+    - key_fields: campi identificativi da mantenere se presenti (es. FID)
+    - zip_layer: layer da leggere se path è un archivio zip
+
+    Ritorna:
+    - GeoDataFrame con geometria, campo altezza e campi chiave presenti
+      (l'assenza del campo altezza è lasciata al controllo del chiamante)
+    """
+    if is_zip(path):
+        path = zip_vector_path(path, zip_layer)
+    columns = projected_columns(list_fields(path), height_field, key_fields)
+
+    if is_parquet(path):
+        vector = gpd.read_parquet(path, columns=columns + [_parquet_geometry_column(path)])
+        engine = 'pyarrow'
+    elif pyogrio is not None:
+        vector = gpd.read_file(path, engine='pyogrio', columns=columns, use_arrow=pq is not None)
+        engine = 'pyogrio/arrow' if pq is not None else 'pyogrio'
+    else:
+        vector = gpd.read_file(path, engine='fiona')
+        vector = vector[columns + [vector.geometry.name]]
+        engine = 'fiona'
+
+    logger.info(f"Vettoriale letto ({engine}): {len(vector)} edifici, colonne {columns}")
+    return vector
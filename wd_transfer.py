@@ -0,0 +1,339 @@
+"""
+TRASFERIMENTO FILE DALLE CARTELLE DATAIKU / MINIO
+Scarica i file di input dalle cartelle gestite (dataiku.Folder) verso una
+cartella locale a blocchi di dimensione fissa: la memoria usata non dipende
+dalla dimensione del file (raster multi-GB inclusi). I file di uno
+shapefile (.shp e accessori) sono scaricati in parallelo con un pool di
+thread e per ogni file è registrata la velocità di trasferimento.
+
+FolderIndex elenca il folder una sola volta e risolve i percorsi (esatto,
+nome file, stem, suffisso di percorso) con dizionari in tempo costante;
+folder_index() condivide l'indice tra le chiamate, con scadenza opzionale.
+shapefile_parts() risolve il .shp e i suoi accessori nella stessa cartella.
+
+remote_version() legge dimensione e data di modifica (o ETag) di un file
+remoto senza scaricarlo: è la chiave della cache locale degli input
+(wd_cache.cached_download_files).
+
+LocalFolder espone la stessa interfaccia (list_paths_in_partition,
+get_download_stream, get_path_details) su una cartella locale, per provare
+i trasferimenti senza Dataiku.
+"""
+
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+DOWNLOAD_WORKERS = 4
+SHAPEFILE_SIDECARS = ('.dbf', '.shx', '.prj', '.qix', '.xml', '.cpg', '.sbx', '.sbn')
+SIDECAR_DOUBLE_EXTENSIONS = ('.shp.xml',)  # estensioni doppie tolte per intero dallo stem (file_stem)
+INDEX_TTL = 300  # secondi di validità dell'indice condiviso (None = fino a refresh esplicito)
+
+# Indici condivisi per folder (chiave: id dell'oggetto folder)
+_folder_indexes = {}
+
+
+class LocalFolder:
+    """
+    Cartella locale con l'interfaccia di dataiku.Folder usata dai download
+
+    Parametri:
+    - root: cartella che simula il folder gestito (percorsi restituiti come '/sotto/cartella/file')
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def list_paths_in_partition(self, partition=''):
+        paths = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                relative = os.path.relpath(os.path.join(dirpath, filename), self.root)
+                paths.append('/' + relative.replace(os.sep, '/'))
+        return sorted(paths)
+
+    def get_download_stream(self, path):
+        return open(os.path.join(self.root, path.lstrip('/')), 'rb')
+
+    def get_path_details(self, path):
+        full_path = os.path.join(self.root, path.lstrip('/'))
+        if not os.path.exists(full_path):
+            return {'exists': False}
+        stat = os.stat(full_path)
+        return {'exists': True, 'directory': os.path.isdir(full_path), 'fullPath': path,
+                'size': stat.st_size, 'lastModified': stat.st_mtime_ns // 1_000_000}
+
+
+def _normalize(path):
+    """Chiave di confronto: minuscolo, separatori '/', senza '/' iniziale"""
+    return path.replace('\\', '/').lstrip('/').lower()
+
+
+def file_stem(path):
+    """
+    Stem del nome file: os.path.splitext del nome, tranne le estensioni
+    doppie degli accessori (V_UVL_GPG.shp.xml -> V_UVL_GPG); zona.v2.shp -> zona.v2
+    """
+    name = path.replace('\\', '/').rsplit('/', 1)[-1]
+    for ext in SIDECAR_DOUBLE_EXTENSIONS:
+        if name.lower().endswith(ext) and len(name) > len(ext):
+            return name[:-len(ext)]
+    return os.path.splitext(name)[0]
+
+
+class FolderIndex:
+    """
+    Indice dei percorsi di un folder, con una sola chiamata di listing
+
+    I confronti sono case-insensitive; a parità di chiave vale l'ordine del
+    listing. Lo stem è quello di file_stem (V_UVL_GPG per V_UVL_GPG.shp e
+    V_UVL_GPG.shp.xml, zona.v2 per zona.v2.shp).
+
+    Parametri:
+    - folder_obj: dataiku.Folder o LocalFolder
+    - ttl: secondi dopo i quali l'indice viene ricostruito al primo accesso (None = mai)
+    """
+
+    def __init__(self, folder_obj, ttl=None):
+        self.folder_obj = folder_obj
+        self.ttl = ttl
+        self.refresh()
+
+    def refresh(self):
+        """Rilegge il listing del folder e ricostruisce i dizionari"""
+        start = time.perf_counter()
+        try:
+            paths = list(self.folder_obj.list_paths_in_partition())
+        except Exception as e:
+            logger.warning(f"Listing del folder non riuscito: {e}")
+            paths = []
+        self._paths = paths
+        self._by_path = {}
+        self._by_name = {}
+        self._by_stem = {}
+        self._by_suffix = {}
+        for path in paths:
+            key = _normalize(path)
+            name = key.rsplit('/', 1)[-1]
+            self._by_path.setdefault(key, path)
+            self._by_name.setdefault(name, []).append(path)
+            self._by_stem.setdefault(file_stem(name), []).append(path)
+            parts = key.split('/')
+            for i in range(len(parts)):
+                self._by_suffix.setdefault('/'.join(parts[i:]), path)
+        self.built = time.time()
+        logger.info(f"Indice folder: {len(paths)} percorsi in {time.perf_counter() - start:.2f}s")
+
+    def _check(self):
+        if self.ttl is not None and time.time() - self.built > self.ttl:
+            self.refresh()
+
+    @property
+    def paths(self):
+        """Percorsi nell'ordine del listing"""
+        self._check()
+        return self._paths
+
+    def exact(self, path):
+        """Percorso con la stessa chiave (case-insensitive, '/' iniziale ignorato) o None"""
+        self._check()
+        return self._by_path.get(_normalize(path))
+
+    def by_name(self, filename):
+        """Percorsi con lo stesso nome file"""
+        self._check()
+        return self._by_name.get(filename.lower(), [])
+
+    def by_stem(self, stem):
+        """Percorsi con lo stesso stem (file_stem)"""
+        self._check()
+        return self._by_stem.get(stem.lower(), [])
+
+    def by_suffix(self, path):
+        """Primo percorso che termina con path (confronto su componenti intere) o None"""
+        self._check()
+        return self._by_suffix.get(_normalize(path))
+
+    def __contains__(self, path):
+        return self.exact(path) is not None
+
+    def __len__(self):
+        return len(self.paths)
+
+
+def folder_index(folder_obj, ttl=INDEX_TTL, refresh=False):
+    """
+    Indice condiviso del folder: il listing avviene alla prima richiesta e
+    viene riusato dalle successive (fino alla scadenza ttl o a refresh=True)
+
+    Gli entry point passano refresh=True all'inizio di ogni esecuzione: il
+    folder può essere cambiato dall'esecuzione precedente nello stesso kernel.
+    Un ttl diverso da quello dell'indice esistente lo sostituisce.
+    """
+    index = _folder_indexes.get(id(folder_obj))
+    if index is None or index.folder_obj is not folder_obj:
+        index = _folder_indexes[id(folder_obj)] = FolderIndex(folder_obj, ttl=ttl)
+        return index
+    index.ttl = ttl
+    if refresh:
+        index.refresh()
+    return index
+
+
+def folder_id(folder_obj):
+    """Identificativo stabile del folder tra le esecuzioni (id Dataiku o cartella locale)"""
+    if isinstance(folder_obj, LocalFolder):
+        return os.path.abspath(folder_obj.root)
+    try:
+        return folder_obj.get_id()
+    except Exception:
+        return getattr(folder_obj, 'name', None) or repr(folder_obj)
+
+
+def remote_version(folder_obj, remote_path):
+    """
+    Versione di un file remoto senza scaricarlo
+
+    Ritorna:
+    - tuple (dimensione in byte, ETag o data di modifica) da get_path_details;
+      None se il folder non fornisce i dettagli o il file non esiste
+    """
+    try:
+        details = folder_obj.get_path_details(remote_path)
+    except Exception as e:
+        logger.warning(f"Dettagli non disponibili per {remote_path}: {e}")
+        return None
+    if not details or not details.get('exists', True) or details.get('directory'):
+        return None
+    version = details.get('etag') or details.get('ETag') or details.get('lastModified')
+    if details.get('size') is None or version is None:
+        return None
+    return int(details['size']), str(version)
+
+
+def format_size(n_bytes):
+    """Dimensione leggibile (B, KB, MB, GB)"""
+    for unit in ('B', 'KB', 'MB'):
+        if n_bytes < 1024:
+            return f"{n_bytes:.0f} {unit}" if unit == 'B' else f"{n_bytes:.1f} {unit}"
+        n_bytes /= 1024
+    return f"{n_bytes:.2f} GB"
+
+
+def download_file(folder_obj, remote_path, local_path, chunk_size=COPY_CHUNK_SIZE):
+    """
+    Scarica un file dal folder a blocchi di chunk_size byte
+
+    Il file è scritto in <local_path>.part e rinominato a fine trasferimento:
+    un download interrotto non lascia un file parziale con il nome finale.
+
+    Ritorna:
+    - tuple (byte scaricati, secondi)
+    """
+    start = time.perf_counter()
+    tmp_path = local_path + '.part'
+    try:
+        with folder_obj.get_download_stream(remote_path) as stream, open(tmp_path, 'wb') as out:
+            shutil.copyfileobj(stream, out, chunk_size)
+            n_bytes = out.tell()
+        os.replace(tmp_path, local_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    elapsed = time.perf_counter() - start
+    logger.info(f"Scaricato {os.path.basename(remote_path)}: {format_size(n_bytes)} in {elapsed:.2f}s "
+                f"({format_size(n_bytes / elapsed if elapsed > 0 else n_bytes)}/s)")
+    return n_bytes, elapsed
+
+
+def download_files(folder_obj, remote_paths, local_dir, workers=DOWNLOAD_WORKERS, chunk_size=COPY_CHUNK_SIZE):
+    """
+    Scarica più file in parallelo nella cartella locale (stesso nome file)
+
+    Parametri:
+    - folder_obj: dataiku.Folder o LocalFolder
+    - remote_paths: percorsi nel folder
+    - local_dir: cartella locale di destinazione
+    - workers: thread di download concorrenti
+
+    Ritorna:
+    - lista dei percorsi locali nello stesso ordine (None per i file non scaricati
+      e per i nomi file ripetuti dopo il primo)
+    """
+    # un solo download per nome file locale: due thread sullo stesso .part mescolerebbero i contenuti
+    seen = set()
+    duplicates = set()
+    for i, remote_path in enumerate(remote_paths):
+        name = os.path.basename(remote_path).lower()
+        if name in seen:
+            duplicates.add(i)
+            logger.warning(f"Download saltato per {remote_path}: nome file già scaricato in {local_dir}")
+        seen.add(name)
+
+    def fetch(item):
+        i, remote_path = item
+        if i in duplicates:
+            return None, 0
+        local_path = os.path.join(local_dir, os.path.basename(remote_path))
+        try:
+            n_bytes, _ = download_file(folder_obj, remote_path, local_path, chunk_size=chunk_size)
+            return local_path, n_bytes
+        except Exception as e:
+            logger.warning(f"Download non riuscito per {remote_path}: {e}")
+            return None, 0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(remote_paths)))) as pool:
+        fetched = list(pool.map(fetch, enumerate(remote_paths)))
+    elapsed = time.perf_counter() - start
+    total = sum(n_bytes for _, n_bytes in fetched)
+    if len(remote_paths) > 1:
+        logger.info(f"Scaricati {sum(path is not None for path, _ in fetched)}/{len(remote_paths)} file: "
+                    f"{format_size(total)} in {elapsed:.2f}s "
+                    f"({format_size(total / elapsed if elapsed > 0 else total)}/s)")
+    return [path for path, _ in fetched]
+
+
+def shapefile_sidecars(shp_path, index):
+    """File accessori dello shapefile presenti nel folder (FolderIndex, confronto case-insensitive)"""
+    stem = os.path.splitext(shp_path)[0]
+    return [index.exact(stem + ext) for ext in SHAPEFILE_SIDECARS if (stem + ext) in index]
+
+
+def shapefile_parts(path, index):
+    """
+    File di uno shapefile nel folder: il .shp richiesto e i file con lo stesso
+    stem nella sua stessa cartella (.dbf, .shx, .prj, .shp.xml, ...)
+
+    Il .shp è risolto per percorso esatto, suffisso di percorso o nome file
+    (primo nell'ordine del listing); file omonimi in altre cartelle sono
+    esclusi e i nomi file ripetuti (case-insensitive) considerati una sola volta.
+
+    Parametri:
+    - path: percorso o nome del .shp
+    - index: FolderIndex del folder
+
+    Ritorna:
+    - lista dei percorsi remoti con il .shp per primo (vuota se il .shp non c'è)
+    """
+    shp_path = index.exact(path) or index.by_suffix(path)
+    if shp_path is None:
+        matches = index.by_name(path.replace('\\', '/').rsplit('/', 1)[-1])
+        shp_path = matches[0] if matches else None
+    if shp_path is None:
+        return []
+    directory, _, name = _normalize(shp_path).rpartition('/')
+    parts = [shp_path]
+    seen = {name}
+    for part in index.by_stem(file_stem(shp_path)):
+        part_directory, _, part_name = _normalize(part).rpartition('/')
+        if part_directory == directory and part_name not in seen:
+            parts.append(part)
+            seen.add(part_name)
+    return parts